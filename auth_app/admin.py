@@ -1,3 +1,30 @@
 from django.contrib import admin
 
-# Register your models here.
+from .billing import schedule_billing_events
+from .models import BillingEvent, Purchase
+
+
+class PurchaseAdmin(admin.ModelAdmin):
+    list_display = ['transaction_id', 'platform', 'user', 'product_id', 'expires_at', 'updated_at']
+    list_filter = ['platform', 'product_id']
+    search_fields = ['transaction_id', 'user__email']
+    raw_id_fields = ['user']
+
+
+class BillingEventAdmin(admin.ModelAdmin):
+    list_display = ['event_id', 'source', 'event_type', 'status', 'attempts', 'received_at', 'processed_at']
+    list_filter = ['status', 'source', 'event_type']
+    search_fields = ['event_id']
+    readonly_fields = ['received_at', 'processed_at']
+    actions = ['retry_events']
+
+    @admin.action(description="Retry selected events")
+    def retry_events(self, request, queryset):
+        count = queryset.exclude(status=BillingEvent.STATUS_DONE).update(
+            status=BillingEvent.STATUS_PENDING, attempts=0)
+        schedule_billing_events()
+        self.message_user(request, f"Queued {count} event(s)")
+
+
+admin.site.register(Purchase, PurchaseAdmin)
+admin.site.register(BillingEvent, BillingEventAdmin)
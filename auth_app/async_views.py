@@ -0,0 +1,81 @@
+"""
+Async versions of the hot read endpoints, used when running under ASGI.
+
+Same responses as the `AuthViewSet` actions, but built with Django's async ORM
+so they never tie up a worker thread.
+"""
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+from rest_framework import exceptions
+from rest_framework.authentication import SessionAuthentication, TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.settings import api_settings
+from songs.models import UserProfile
+from .views import access_status, expire_trial_if_needed, profile_payload
+
+
+def _uses(authentication_class, authentication_classes):
+    return any(issubclass(cls, authentication_class) for cls in authentication_classes)
+
+
+async def aget_request_user(request, authentication_classes=None):
+    """
+    Resolve the caller with the same authentication classes DRF would use
+    (the configured defaults unless a view overrides them). Returns None if
+    anonymous.
+    """
+    if authentication_classes is None:
+        authentication_classes = api_settings.DEFAULT_AUTHENTICATION_CLASSES
+
+    if _uses(TokenAuthentication, authentication_classes):
+        keyword, _, key = request.headers.get('Authorization', '').partition(' ')
+        if keyword == 'Token' and key.strip():
+            token = await Token.objects.select_related('user').filter(key=key.strip()).afirst()
+            if token and token.user.is_active:
+                return token.user
+            return None
+
+    if _uses(SessionAuthentication, authentication_classes):
+        user = await request.auser()
+        if user.is_authenticated:
+            return user
+    return None
+
+
+def not_authenticated(authentication_classes=None):
+    """Same status and body DRF produces when a permission rejects an anonymous user"""
+    if authentication_classes is None:
+        authentication_classes = api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    if authentication_classes:
+        response = JsonResponse({'detail': exceptions.NotAuthenticated.default_detail}, status=401)
+        header = authentication_classes[0]().authenticate_header(None)
+        if header:
+            response['WWW-Authenticate'] = header
+        return response
+    return JsonResponse({'detail': exceptions.PermissionDenied.default_detail}, status=403)
+
+
+@require_GET
+async def me(request):
+    """Get current user profile"""
+    user = await aget_request_user(request)
+    if user is None:
+        return not_authenticated()
+
+    profile = await UserProfile.objects.aget(user=user)
+    if expire_trial_if_needed(profile):
+        await profile.asave()
+
+    return JsonResponse(profile_payload(user, profile))
+
+
+@require_GET
+async def check_access(request):
+    """Check if user has access (premium or valid trial)"""
+    user = await aget_request_user(request)
+    if user is None:
+        return not_authenticated()
+
+    profile = await UserProfile.objects.aget(user=user)
+    access, reason = access_status(profile)
+    return JsonResponse({'access': access, 'reason': reason}, status=200 if access else 403)
@@ -0,0 +1,398 @@
+"""
+In-app purchase verification and subscription events.
+
+Purchases (`AuthViewSet.purchase`)
+    The store receipt is checked by the verifier configured for its platform
+    in RECEIPT_VERIFIERS: Apple's verifyReceipt, the Google Play Developer
+    API, or FakeReceiptVerifier for development and tests.  Verified receipts
+    are cached by hash until they expire (at most RECEIPT_CACHE_SECONDS), so
+    restores and retries skip the store round trip.  Each store transaction
+    is bound to the first user who claims it (`Purchase`), so one receipt
+    can't unlock several accounts.  If the store can't be reached the receipt
+    is queued and `purchase` answers 202 straight away.
+
+Renewals and cancellations
+    Stripe webhooks and the queued receipts are stored as `BillingEvent`
+    rows, once per (source, event_id), so redelivered notifications are
+    no-ops.  `process_billing_events` applies pending events in batches:
+    it claims a batch in one short transaction, verifies queued receipts
+    with the store outside any transaction, then writes every affected
+    UserProfile with one bulk_update in a second short transaction.  It runs in the
+    background after each new event, and from
+    `python manage.py process_billing_events` as a backstop.
+"""
+import hashlib
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import Q
+from django.http import HttpResponse
+from django.utils.dateparse import parse_datetime
+from django.utils.module_loading import import_string
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from songs import tasks
+from songs.models import UserProfile
+from .models import BillingEvent, Purchase
+
+logger = logging.getLogger(__name__)
+
+# Store product id -> UserProfile.subscription_type
+PRODUCT_PLANS = {
+    'com.miclab.premium.monthly': 'premium_monthly',
+    'com.miclab.premium.yearly': 'premium_yearly',
+}
+PLAN_PERIODS = {
+    'premium_monthly': timedelta(days=30),
+    'premium_yearly': timedelta(days=365),
+}
+
+# Retryable events are given up on after this many attempts
+MAX_EVENT_ATTEMPTS = 10
+# How long a claimed batch is reserved for the worker verifying it (each
+# queued receipt can take two store round trips of IAP_VERIFY_TIMEOUT)
+EVENT_CLAIM_SECONDS = 15 * 60
+STRIPE_EVENT_TYPES = (
+    'invoice.paid',
+    'customer.subscription.created',
+    'customer.subscription.updated',
+    'customer.subscription.deleted',
+)
+
+
+class ReceiptError(Exception):
+    def __init__(self, message, status=400, retryable=False):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+
+
+def _timestamp(seconds):
+    return datetime.fromtimestamp(int(seconds), tz=timezone.utc)
+
+
+# Verifiers: verify(receipt, product_id) returns
+# {'transaction_id': ..., 'product_id': ..., 'expires_at': datetime}
+# or raises ReceiptError (retryable=True when the store is unavailable).
+
+class FakeReceiptVerifier:
+    """
+    Development and test verifier.  ``fake:<transaction id>`` is a valid
+    receipt for one billing period of the product; ``fake:invalid`` is
+    rejected and ``fake:unavailable`` behaves like a store outage.
+    """
+
+    def verify(self, receipt, product_id):
+        if not receipt.startswith('fake:'):
+            raise ReceiptError("Not a test receipt")
+        transaction_id = receipt[len('fake:'):]
+        if transaction_id == 'invalid':
+            raise ReceiptError("Receipt rejected by the store")
+        if transaction_id == 'unavailable':
+            raise ReceiptError("Store unavailable", status=503, retryable=True)
+        period = PLAN_PERIODS[PRODUCT_PLANS[product_id]]
+        return {'transaction_id': transaction_id, 'product_id': product_id,
+                'expires_at': datetime.now(timezone.utc) + period}
+
+
+class AppleReceiptVerifier:
+    """App Store verifyReceipt, with the sandbox fallback for TestFlight receipts."""
+    PRODUCTION_URL = 'https://buy.itunes.apple.com/verifyReceipt'
+    SANDBOX_URL = 'https://sandbox.itunes.apple.com/verifyReceipt'
+    SANDBOX_RECEIPT = 21007
+
+    def _post(self, url, body):
+        import requests
+
+        try:
+            response = requests.post(url, json=body, timeout=settings.IAP_VERIFY_TIMEOUT)
+        except requests.RequestException as e:
+            raise ReceiptError(f"App Store unreachable: {e}", status=503, retryable=True)
+        if response.status_code >= 500:
+            raise ReceiptError("App Store unavailable", status=503, retryable=True)
+        return response.json()
+
+    def verify(self, receipt, product_id):
+        body = {'receipt-data': receipt, 'password': settings.APPLE_SHARED_SECRET,
+                'exclude-old-transactions': True}
+        data = self._post(self.PRODUCTION_URL, body)
+        if data.get('status') == self.SANDBOX_RECEIPT:
+            data = self._post(self.SANDBOX_URL, body)
+
+        status = data.get('status')
+        if status != 0:
+            if data.get('is-retryable'):
+                raise ReceiptError(f"App Store error {status}", status=503, retryable=True)
+            raise ReceiptError(f"Receipt rejected by the App Store ({status})")
+
+        transactions = [t for t in data.get('latest_receipt_info', [])
+                        if t.get('product_id') == product_id and t.get('expires_date_ms')]
+        if not transactions:
+            raise ReceiptError("Receipt has no subscription for this product")
+        latest = max(transactions, key=lambda t: int(t['expires_date_ms']))
+        return {'transaction_id': latest['original_transaction_id'], 'product_id': product_id,
+                'expires_at': _timestamp(int(latest['expires_date_ms']) // 1000)}
+
+
+class GooglePlayReceiptVerifier:
+    """
+    Google Play Developer API (purchases.subscriptionsv2).  The receipt is
+    the purchase token.  Needs google-auth and a service account
+    (GOOGLE_SERVICE_ACCOUNT_FILE) with access to the Play Console.
+    """
+    URL = ('https://androidpublisher.googleapis.com/androidpublisher/v3/applications/'
+           '{package}/purchases/subscriptionsv2/tokens/{token}')
+    ACTIVE_STATES = ('SUBSCRIPTION_STATE_ACTIVE', 'SUBSCRIPTION_STATE_IN_GRACE_PERIOD',
+                     'SUBSCRIPTION_STATE_CANCELED')
+
+    def __init__(self):
+        try:
+            from google.auth.transport.requests import AuthorizedSession
+            from google.oauth2 import service_account
+        except ImportError:
+            raise ImproperlyConfigured("GooglePlayReceiptVerifier needs the google-auth package")
+        credentials = service_account.Credentials.from_service_account_file(
+            settings.GOOGLE_SERVICE_ACCOUNT_FILE,
+            scopes=['https://www.googleapis.com/auth/androidpublisher'])
+        self.session = AuthorizedSession(credentials)
+
+    def verify(self, receipt, product_id):
+        import requests
+
+        url = self.URL.format(package=settings.GOOGLE_PLAY_PACKAGE_NAME, token=quote(receipt, safe=''))
+        try:
+            response = self.session.get(url, timeout=settings.IAP_VERIFY_TIMEOUT)
+        except requests.RequestException as e:
+            raise ReceiptError(f"Google Play unreachable: {e}", status=503, retryable=True)
+        if response.status_code >= 500:
+            raise ReceiptError("Google Play unavailable", status=503, retryable=True)
+        if response.status_code != 200:
+            raise ReceiptError("Purchase token rejected by Google Play")
+
+        data = response.json()
+        if data.get('subscriptionState') not in self.ACTIVE_STATES:
+            raise ReceiptError("Subscription is not active")
+        items = [i for i in data.get('lineItems', []) if i.get('productId') == product_id]
+        if not items:
+            raise ReceiptError("Purchase has no subscription for this product")
+        # Renewal orders are "<order id>..<n>"; the subscription is the base id
+        transaction_id = data.get('latestOrderId', receipt).split('..')[0]
+        expires_at = max(parse_datetime(i['expiryTime']) for i in items)
+        return {'transaction_id': transaction_id, 'product_id': product_id, 'expires_at': expires_at}
+
+
+@lru_cache(maxsize=None)
+def _verifier(path):
+    return import_string(path)()
+
+
+def get_verifier(platform):
+    try:
+        return _verifier(settings.RECEIPT_VERIFIERS[platform])
+    except KeyError:
+        raise ReceiptError(f"Unknown platform. Use one of: {', '.join(settings.RECEIPT_VERIFIERS)}")
+
+
+def verify_receipt(user_id, platform, product_id, receipt):
+    """
+    Verified receipt for ``user_id``, from the cache when possible.  Binds
+    the store transaction to the user; raises ReceiptError on failure.
+    """
+    key = f"iap:receipt:{platform}:{hashlib.sha256(receipt.encode()).hexdigest()}"
+    verified = cache.get(key)
+    if verified is None or verified['product_id'] != product_id:
+        verified = get_verifier(platform).verify(receipt, product_id)
+        ttl = (verified['expires_at'] - datetime.now(timezone.utc)).total_seconds()
+        if ttl > 0:
+            cache.set(key, verified, min(int(ttl), settings.RECEIPT_CACHE_SECONDS))
+
+    if verified['expires_at'] <= datetime.now(timezone.utc):
+        raise ReceiptError("Subscription has expired")
+
+    purchase, created = Purchase.objects.get_or_create(
+        platform=platform, transaction_id=verified['transaction_id'],
+        defaults={'user_id': user_id, 'product_id': product_id, 'expires_at': verified['expires_at']})
+    if purchase.user_id != user_id:
+        raise ReceiptError("This purchase belongs to another account", status=409)
+    if not created and purchase.expires_at != verified['expires_at']:
+        Purchase.objects.filter(pk=purchase.pk).update(
+            product_id=product_id, expires_at=verified['expires_at'])
+    return verified
+
+
+def apply_subscription(profile, plan, expires_at):
+    """Set the profile's subscription fields (does not save)."""
+    if profile.subscription_type != plan or not profile.subscription_start_date:
+        profile.subscription_start_date = datetime.now(timezone.utc)
+    profile.subscription_type = plan
+    profile.subscription_end_date = expires_at
+
+
+# Durable event queue
+
+def record_event(source, event_id, event_type, payload):
+    """Store an event once; returns True if it was new."""
+    _, created = BillingEvent.objects.get_or_create(
+        source=source, event_id=event_id,
+        defaults={'event_type': event_type, 'payload': payload})
+    if created:
+        transaction.on_commit(schedule_billing_events)
+    return created
+
+
+def queue_receipt(user_id, platform, product_id, receipt):
+    """Verify a receipt later, when the store is reachable again."""
+    event_id = hashlib.sha256(f"{user_id}:{platform}:{receipt}".encode()).hexdigest()
+    return record_event('receipt', event_id, platform, {
+        'user_id': user_id, 'platform': platform, 'product_id': product_id, 'receipt': receipt})
+
+
+def schedule_billing_events():
+    return tasks.submit(process_billing_events, key=('billing-events',))
+
+
+def _stripe_change(event):
+    """(('stripe_customer_id', customer), plan, expires_at) or None."""
+    obj = event.payload['data']['object']
+    if event.event_type == 'invoice.paid':
+        line = (obj.get('lines') or {}).get('data', [{}])[0]
+        price = (line.get('price') or {}).get('id') or \
+            ((line.get('pricing') or {}).get('price_details') or {}).get('price')
+        expires_at = _timestamp(line['period']['end'])
+    else:
+        item = (obj.get('items') or {}).get('data', [{}])[0]
+        price = (item.get('price') or {}).get('id')
+        if event.event_type == 'customer.subscription.deleted' or \
+                obj.get('status') not in ('active', 'trialing', 'past_due'):
+            expires_at = _timestamp(obj.get('ended_at') or obj.get('canceled_at') or event.payload['created'])
+        else:
+            expires_at = _timestamp(obj.get('current_period_end') or item['current_period_end'])
+    plan = settings.STRIPE_PRICE_PLANS.get(price)
+    if plan is None:
+        return None
+    return ('stripe_customer_id', obj['customer']), plan, expires_at
+
+
+def _receipt_change(event):
+    data = event.payload
+    plan = PRODUCT_PLANS[data['product_id']]
+    verified = verify_receipt(data['user_id'], data['platform'], data['product_id'], data['receipt'])
+    return ('user_id', data['user_id']), plan, verified['expires_at']
+
+
+EVENT_HANDLERS = {
+    'stripe': _stripe_change,
+    'receipt': _receipt_change,
+}
+
+
+def process_billing_events(batch=500):
+    """
+    Apply pending events until none are left.  Returns how many were done.
+    Batches are claimed with SELECT ... FOR UPDATE SKIP LOCKED (PostgreSQL)
+    and a short lease, so several workers can drain the queue at once, and
+    store requests never run while row (or SQLite database) locks are held.
+    """
+    processed, retry_later = 0, set()
+    while True:
+        events = _claim_events(batch, retry_later)
+        if not events:
+            return processed
+        changes = _verify_events(events)
+        with transaction.atomic():
+            _apply_changes(events, changes)
+        retry_later.update(e.pk for e in events if e.status == BillingEvent.STATUS_PENDING)
+        processed += sum(e.status == BillingEvent.STATUS_DONE for e in events)
+        if len(events) < batch:
+            return processed
+
+
+def _claim_events(batch, exclude):
+    now = datetime.now(timezone.utc)
+    with transaction.atomic():
+        events = list(BillingEvent.objects.select_for_update(skip_locked=True)
+                      .filter(status=BillingEvent.STATUS_PENDING)
+                      .filter(Q(claimed_until__isnull=True) | Q(claimed_until__lt=now))
+                      .exclude(pk__in=exclude).order_by('id')[:batch])
+        BillingEvent.objects.filter(pk__in=[e.pk for e in events]).update(
+            claimed_until=now + timedelta(seconds=EVENT_CLAIM_SECONDS))
+    return events
+
+
+def _verify_events(events):
+    """Run the handlers (store requests included); returns [(event, change)]."""
+    now = datetime.now(timezone.utc)
+    changes = []
+    for event in events:
+        event.attempts += 1
+        event.claimed_until = None
+        try:
+            change = EVENT_HANDLERS[event.source](event)
+        except ReceiptError as e:
+            event.last_error = str(e)[:500]
+            if not e.retryable or event.attempts >= MAX_EVENT_ATTEMPTS:
+                event.status = BillingEvent.STATUS_FAILED
+            continue
+        except Exception as e:
+            logger.exception("Billing event %s failed", event)
+            event.last_error = str(e)[:500]
+            event.status = BillingEvent.STATUS_FAILED
+            continue
+        event.status = BillingEvent.STATUS_DONE
+        event.processed_at = now
+        if change is not None:
+            changes.append((event, change))
+    return changes
+
+
+def _apply_changes(events, changes):
+    now = datetime.now(timezone.utc)
+    customers = {lookup[1] for _, (lookup, _, _) in changes if lookup[0] == 'stripe_customer_id'}
+    customer_users = dict(UserProfile.objects.filter(stripe_customer_id__in=customers)
+                          .values_list('stripe_customer_id', 'user_id'))
+
+    # One final state per user; events are applied in arrival order
+    latest = {}
+    for event, ((field, value), plan, expires_at) in changes:
+        user_id = customer_users.get(value) if field == 'stripe_customer_id' else value
+        if user_id is None:
+            event.last_error = "No profile for this customer"
+            continue
+        latest[user_id] = (plan, expires_at)
+
+    profiles = list(UserProfile.objects.select_for_update().filter(user_id__in=latest))
+    for profile in profiles:
+        apply_subscription(profile, *latest[profile.user_id])
+        profile.updated_at = now  # bulk_update skips auto_now
+    UserProfile.objects.bulk_update(
+        profiles, ['subscription_type', 'subscription_start_date', 'subscription_end_date', 'updated_at'])
+    BillingEvent.objects.bulk_update(
+        events, ['status', 'attempts', 'last_error', 'processed_at', 'claimed_until'])
+
+
+@csrf_exempt
+@require_POST
+def stripe_webhook(request):
+    """Stripe event endpoint: verify the signature, queue the event, answer 200."""
+    import stripe
+
+    if not settings.STRIPE_WEBHOOK_SECRET:
+        return HttpResponse("Stripe webhooks are not configured", status=503, content_type='text/plain')
+    try:
+        stripe.Webhook.construct_event(
+            request.body, request.headers.get('Stripe-Signature', ''), settings.STRIPE_WEBHOOK_SECRET)
+    except (ValueError, stripe.SignatureVerificationError):
+        return HttpResponse("Invalid payload or signature", status=400, content_type='text/plain')
+
+    event = json.loads(request.body)
+    if event.get('type') in STRIPE_EVENT_TYPES:
+        record_event('stripe', event['id'], event['type'], event)
+    return HttpResponse(status=200)
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from auth_app.billing import process_billing_events
+from auth_app.models import BillingEvent
+
+
+class Command(BaseCommand):
+    help = "Apply pending billing events (Stripe webhooks, receipts waiting for the store)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--failed', action='store_true', help="Retry failed events too")
+        parser.add_argument('--watch', action='store_true', help="Keep running, polling every --interval seconds")
+        parser.add_argument('--interval', type=float, default=60.0)
+
+    def handle(self, *args, **options):
+        if options['failed']:
+            BillingEvent.objects.filter(status=BillingEvent.STATUS_FAILED).update(
+                status=BillingEvent.STATUS_PENDING, attempts=0)
+        while True:
+            processed = process_billing_events()
+            self.stdout.write(self.style.SUCCESS(f"Applied {processed} billing events"))
+            if not options['watch']:
+                return
+            time.sleep(options['interval'])
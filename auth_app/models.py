@@ -1,3 +1,67 @@
 from django.db import models
+from django.contrib.auth.models import User
 
-# Create your models here.
+
+class Purchase(models.Model):
+    """
+    A store subscription verified from a receipt (auth_app/billing.py),
+    bound to the first user who claimed it.
+    """
+    platform = models.CharField(max_length=10)
+    # Apple original_transaction_id / Google order id without the renewal suffix
+    transaction_id = models.CharField(max_length=255)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='purchases')
+    product_id = models.CharField(max_length=255)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['platform', 'transaction_id'],
+                                    name='purchase_platform_transaction_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.platform} {self.transaction_id} - {self.user_id}"
+
+
+class BillingEvent(models.Model):
+    """
+    Durable queue of subscription events (Stripe webhooks, receipts waiting
+    for the store). Each (source, event_id) is stored once, so redelivered
+    notifications are no-ops.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    source = models.CharField(max_length=20)
+    event_id = models.CharField(max_length=255)
+    event_type = models.CharField(max_length=100, blank=True)
+    payload = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.CharField(max_length=500, blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    # Set while a worker verifies the event outside a transaction; other
+    # workers skip it until then
+    claimed_until = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'event_id'], name='billing_event_source_id_uniq'),
+        ]
+        indexes = [
+            # Pending events in arrival order
+            models.Index(fields=['status', 'id'], name='billing_event_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.source} {self.event_type} {self.event_id}"
@@ -1,3 +1,155 @@
-from django.test import TestCase
+import hashlib
+import hmac
+import json
+import os
+import time
+from datetime import datetime, timezone
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.authtoken.models import Token
+
+from songs.models import UserProfile
+from .billing import FakeReceiptVerifier, process_billing_events
+from .models import BillingEvent
+
+
+class LoginTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def login(self, email, password, **headers):
+        return self.client.post('/api/auth/login/', {'email': email, 'password': password}, **headers)
+
+    def test_old_password_hashes_are_upgraded_on_login(self):
+        user = User.objects.create(username='ayna', email='ayna@example.com',
+                                   password=make_password('pass12345', hasher='pbkdf2_sha256'))
+        UserProfile.objects.create(user=user)
+        self.assertEqual(self.login('ayna@example.com', 'pass12345').status_code, 200)
+        user.refresh_from_db()
+        self.assertFalse(user.password.startswith('pbkdf2_sha256$'))
+        self.assertTrue(user.check_password('pass12345'))
+
+    def test_ip_limit_ignores_client_forwarded_for(self):
+        for i in range(30):
+            response = self.login(f'user{i}@example.com', 'wrong', HTTP_X_FORWARDED_FOR=f'10.0.0.{i}')
+            self.assertEqual(response.status_code, 401)
+        response = self.login('last@example.com', 'wrong', HTTP_X_FORWARDED_FOR='10.0.1.1')
+        self.assertEqual(response.status_code, 429)
+
+
+class ReceiptVerifierSettingsTests(SimpleTestCase):
+    def load(self, debug=True, **env):
+        source = open(os.path.join(settings.BASE_DIR, 'config', 'settings.py')).read()
+        if not debug:
+            source = source.replace('\nDEBUG = True\n', '\nDEBUG = False\n')
+        with mock.patch.dict(os.environ, env):
+            if 'IAP_VERIFIER' not in env:
+                os.environ.pop('IAP_VERIFIER', None)
+            namespace = {'__file__': os.path.join(settings.BASE_DIR, 'config', 'settings.py')}
+            exec(compile(source, 'settings.py', 'exec'), namespace)
+        return namespace['RECEIPT_VERIFIERS']
+
+    def test_stores_by_default_and_fake_only_when_asked_for_in_debug(self):
+        self.assertEqual(self.load(), {'ios': 'auth_app.billing.AppleReceiptVerifier',
+                                       'android': 'auth_app.billing.GooglePlayReceiptVerifier'})
+        self.assertEqual(set(self.load(IAP_VERIFIER='fake').values()), {'auth_app.billing.FakeReceiptVerifier'})
+        with self.assertRaises(ImproperlyConfigured):
+            self.load(debug=False, IAP_VERIFIER='fake')
+        for value in ('apple', 'google', ''):
+            with self.assertRaises(ImproperlyConfigured):
+                self.load(IAP_VERIFIER=value)
+
+
+FAKE_VERIFIERS = {'ios': 'auth_app.billing.FakeReceiptVerifier', 'android': 'auth_app.billing.FakeReceiptVerifier'}
+
+
+@override_settings(RECEIPT_VERIFIERS=FAKE_VERIFIERS)
+class PurchaseTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = []
+        for name in ('ayna', 'merdan'):
+            user = User.objects.create_user(name, f'{name}@example.com', 'pass12345')
+            UserProfile.objects.create(user=user)
+            cls.users.append((user, Token.objects.create(user=user).key))
+
+    def setUp(self):
+        cache.clear()
+
+    def purchase(self, token, receipt):
+        return self.client.post('/api/auth/purchase/', {
+            'product_id': 'com.miclab.premium.monthly', 'receipt': receipt, 'platform': 'ios',
+        }, HTTP_AUTHORIZATION=f'Token {token}')
+
+    def test_verified_receipts_are_cached_and_bound_to_one_user(self):
+        (user, token), (_, other_token) = self.users
+        with mock.patch.object(FakeReceiptVerifier, 'verify', wraps=FakeReceiptVerifier().verify) as verify:
+            self.assertEqual(self.purchase(token, 'fake:1000').status_code, 200)
+            self.assertEqual(self.purchase(token, 'fake:1000').status_code, 200)
+            self.assertEqual(verify.call_count, 1)
+        self.assertEqual(UserProfile.objects.get(user=user).subscription_type, 'premium_monthly')
+        self.assertEqual(self.purchase(other_token, 'fake:1000').status_code, 409)
+        self.assertEqual(self.purchase(token, 'fake:invalid').status_code, 400)
+
+    def test_store_outage_queues_the_receipt(self):
+        user, token = self.users[0]
+        self.assertEqual(self.purchase(token, 'fake:unavailable').status_code, 202)
+        event = BillingEvent.objects.get(source='receipt')
+
+        self.assertEqual(process_billing_events(), 0)
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts), (BillingEvent.STATUS_PENDING, 1))
+
+        available = {'transaction_id': '2000', 'product_id': 'com.miclab.premium.monthly',
+                     'expires_at': datetime(2100, 1, 1, tzinfo=timezone.utc)}
+        depth = len(connection.savepoint_ids)
+        depths = []
+
+        def verify(receipt, product_id):
+            depths.append(len(connection.savepoint_ids))
+            return available
+
+        with mock.patch.object(FakeReceiptVerifier, 'verify', side_effect=verify):
+            self.assertEqual(process_billing_events(), 1)
+        # The store is asked outside the claim and write transactions
+        self.assertEqual(depths, [depth])
+        profile = UserProfile.objects.get(user=user)
+        self.assertEqual(profile.subscription_end_date, available['expires_at'])
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET='whsec_test')
+class StripeWebhookTests(TestCase):
+    def post_event(self, event):
+        payload = json.dumps(event)
+        timestamp = int(time.time())
+        signature = hmac.new(b'whsec_test', f'{timestamp}.{payload}'.encode(), hashlib.sha256).hexdigest()
+        return self.client.post('/api/billing/stripe/', payload, content_type='application/json',
+                                HTTP_STRIPE_SIGNATURE=f't={timestamp},v1={signature}')
+
+    def test_renewals_are_stored_once_and_applied_in_bulk(self):
+        user = User.objects.create_user('ogulgerek', 'o@example.com', 'pass12345')
+        UserProfile.objects.create(user=user, stripe_customer_id='cus_1')
+        renewal = {
+            'id': 'evt_1', 'type': 'invoice.paid', 'created': 1900000000,
+            'data': {'object': {'customer': 'cus_1', 'lines': {'data': [
+                {'price': {'id': 'price_premium_yearly'}, 'period': {'end': 1931536000}}]}}},
+        }
+        self.assertEqual(self.post_event(renewal).status_code, 200)
+        self.assertEqual(self.post_event(renewal).status_code, 200)
+        self.assertEqual(BillingEvent.objects.count(), 1)
+
+        bad = self.client.post('/api/billing/stripe/', '{}', content_type='application/json',
+                               HTTP_STRIPE_SIGNATURE='t=1,v1=0')
+        self.assertEqual(bad.status_code, 400)
+
+        self.assertEqual(process_billing_events(), 1)
+        profile = UserProfile.objects.get(user=user)
+        self.assertEqual(profile.subscription_type, 'premium_yearly')
+        self.assertEqual(profile.subscription_end_date.timestamp(), 1931536000)
@@ -0,0 +1,33 @@
+import hashlib
+
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class LoginIPThrottle(SimpleRateThrottle):
+    """
+    Sliding-window limit on login attempts per client IP.
+
+    Throttles run before the view, so rejected attempts never reach the
+    (deliberately slow) password hasher.
+    """
+    scope = 'login_ip'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': self.get_ident(request)
+        }
+
+
+class LoginEmailThrottle(SimpleRateThrottle):
+    """Sliding-window limit on login attempts per target email"""
+    scope = 'login_email'
+
+    def get_cache_key(self, request, view):
+        email = request.data.get('email')
+        if not email or not isinstance(email, str):
+            return None
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': hashlib.sha256(email.strip().lower().encode()).hexdigest()
+        }
@@ -2,14 +2,60 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.authentication import TokenAuthentication
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
 from rest_framework.authtoken.models import Token
 from datetime import datetime, timedelta, timezone
 from songs.models import UserProfile
+from .billing import PRODUCT_PLANS, ReceiptError, apply_subscription, queue_receipt, verify_receipt
+from .throttling import LoginEmailThrottle, LoginIPThrottle
 import json
 
 
+def expire_trial_if_needed(profile):
+    """Mark an elapsed free trial as expired. Returns True if it changed."""
+    now = datetime.now(timezone.utc)
+    if profile.subscription_type == 'free' and profile.trial_end_date and profile.trial_end_date < now:
+        profile.subscription_type = 'expired'
+        return True
+    return False
+
+
+def profile_payload(user, profile):
+    """Response body for the `me` endpoint"""
+    return {
+        'user_id': user.id,
+        'email': user.email,
+        'username': user.username,
+        'subscription_type': profile.subscription_type,
+        'trial_start_date': profile.trial_start_date.isoformat() if profile.trial_start_date else None,
+        'trial_end_date': profile.trial_end_date.isoformat() if profile.trial_end_date else None,
+        'subscription_start_date': profile.subscription_start_date.isoformat() if profile.subscription_start_date else None,
+        'subscription_end_date': profile.subscription_end_date.isoformat() if profile.subscription_end_date else None
+    }
+
+
+def access_status(profile):
+    """(access, reason) for a profile: premium or valid trial"""
+    now = datetime.now(timezone.utc)
+
+    # Premium users
+    if profile.subscription_type in ['premium_monthly', 'premium_yearly']:
+        if profile.subscription_end_date and profile.subscription_end_date > now:
+            return True, 'Premium subscriber'
+
+    # Free trial users
+    if profile.subscription_type == 'free' and profile.trial_end_date:
+        if profile.trial_end_date > now:
+            days_left = (profile.trial_end_date - now).days
+            return True, f'Trial ({days_left} days left)'
+        else:
+            return False, 'Trial expired'
+
+    return False, 'No active subscription'
+
+
 class AuthViewSet(viewsets.ViewSet):
     permission_classes = [AllowAny]
 
@@ -61,9 +107,14 @@ class AuthViewSet(viewsets.ViewSet):
             'subscription_type': profile.subscription_type
         }, status=status.HTTP_201_CREATED)
 
-    @action(detail=False, methods=['post'])
+    @action(detail=False, methods=['post'], throttle_classes=[LoginIPThrottle, LoginEmailThrottle])
     def login(self, request):
-        """Login user and return token"""
+        """
+        Login user and return token
+
+        Attempts are rate limited per IP and per email before any password
+        hashing; old password hashes are upgraded by check_password.
+        """
         email = request.data.get('email')
         password = request.data.get('password')
 
@@ -96,30 +147,25 @@ class AuthViewSet(viewsets.ViewSet):
     def me(self, request):
         """Get current user profile"""
         profile = UserProfile.objects.get(user=request.user)
-        
-        # Check if trial expired
-        now = datetime.now(timezone.utc)
-        if profile.subscription_type == 'free' and profile.trial_end_date and profile.trial_end_date < now:
-            profile.subscription_type = 'expired'
+
+        if expire_trial_if_needed(profile):
             profile.save()
 
-        return Response({
-            'user_id': request.user.id,
-            'email': request.user.email,
-            'username': request.user.username,
-            'subscription_type': profile.subscription_type,
-            'trial_start_date': profile.trial_start_date.isoformat() if profile.trial_start_date else None,
-            'trial_end_date': profile.trial_end_date.isoformat() if profile.trial_end_date else None,
-            'subscription_start_date': profile.subscription_start_date.isoformat() if profile.subscription_start_date else None,
-            'subscription_end_date': profile.subscription_end_date.isoformat() if profile.subscription_end_date else None
-        })
+        return Response(profile_payload(request.user, profile))
 
-    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated],
+            authentication_classes=[TokenAuthentication])
     def purchase(self, request):
-        """Handle IAP purchase (iOS/Android)"""
+        """
+        Handle IAP purchase (iOS/Android)
+
+        The receipt is verified with the store (cached, see billing.py). If
+        the store is unreachable it is queued and 202 is returned; poll
+        check_access for the result.
+        """
         product_id = request.data.get('product_id')
         receipt = request.data.get('receipt')
-        platform = request.data.get('platform')  # 'ios' or 'android'
+        platform = request.data.get('platform') or 'ios'  # 'ios' or 'android'
 
         if not product_id or not receipt:
             return Response(
@@ -127,34 +173,25 @@ class AuthViewSet(viewsets.ViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Map product IDs to subscription types
-        product_mapping = {
-            'com.miclab.premium.monthly': 'premium_monthly',
-            'com.miclab.premium.yearly': 'premium_yearly',
-        }
-
-        subscription_type = product_mapping.get(product_id)
+        subscription_type = PRODUCT_PLANS.get(product_id)
         if not subscription_type:
             return Response(
                 {'detail': 'Invalid product_id'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # TODO: Verify receipt with Apple/Google
-        # For now, we'll accept it (implement proper verification in production)
+        try:
+            verified = verify_receipt(request.user.pk, platform, product_id, receipt)
+        except ReceiptError as e:
+            if e.retryable:
+                queue_receipt(request.user.pk, platform, product_id, receipt)
+                return Response({'status': 'pending', 'detail': 'Receipt will be verified shortly'},
+                                status=status.HTTP_202_ACCEPTED)
+            return Response({'detail': str(e)}, status=e.status)
 
         # Update user subscription
         profile = UserProfile.objects.get(user=request.user)
-        now = datetime.now(timezone.utc)
-
-        profile.subscription_type = subscription_type
-        profile.subscription_start_date = now
-
-        if subscription_type == 'premium_monthly':
-            profile.subscription_end_date = now + timedelta(days=30)
-        elif subscription_type == 'premium_yearly':
-            profile.subscription_end_date = now + timedelta(days=365)
-
+        apply_subscription(profile, subscription_type, verified['expires_at'])
         profile.save()
 
         return Response({
@@ -166,19 +203,8 @@ class AuthViewSet(viewsets.ViewSet):
     def check_access(self, request):
         """Check if user has access (premium or valid trial)"""
         profile = UserProfile.objects.get(user=request.user)
-        now = datetime.now(timezone.utc)
-
-        # Premium users
-        if profile.subscription_type in ['premium_monthly', 'premium_yearly']:
-            if profile.subscription_end_date and profile.subscription_end_date > now:
-                return Response({'access': True, 'reason': 'Premium subscriber'})
-
-        # Free trial users
-        if profile.subscription_type == 'free' and profile.trial_end_date:
-            if profile.trial_end_date > now:
-                days_left = (profile.trial_end_date - now).days
-                return Response({'access': True, 'reason': f'Trial ({days_left} days left)'})
-            else:
-                return Response({'access': False, 'reason': 'Trial expired'}, status=status.HTTP_403_FORBIDDEN)
-
-        return Response({'access': False, 'reason': 'No active subscription'}, status=status.HTTP_403_FORBIDDEN)
+        access, reason = access_status(profile)
+        return Response(
+            {'access': access, 'reason': reason},
+            status=status.HTTP_200_OK if access else status.HTTP_403_FORBIDDEN
+        )
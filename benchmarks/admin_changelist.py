@@ -0,0 +1,98 @@
+"""
+Admin changelist timings for a large catalog.
+
+Seeds --songs songs and --favorites favorites, then times the Song and
+Favorite changelists (plain page and a search) with the previous admin
+options and with the current ones (select_related, cached counts, indexed
+search lookups). The ordering indexes from the migrations are present in
+both runs.
+
+    python benchmarks/admin_changelist.py --songs 100000 --favorites 1000000
+"""
+import argparse
+import random
+import time
+
+from common import measure, print_table, seed_catalog, setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--songs', type=int, default=100_000)
+    parser.add_argument('--favorites', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib import admin
+    from django.contrib.auth.models import User
+    from django.core.paginator import Paginator
+    from django.db import connection, reset_queries
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+    from songs.models import Favorite, Song
+
+    start = time.perf_counter()
+    seed_catalog(args.songs)
+    users_needed = max(args.favorites // 100, 1)
+    User.objects.bulk_create([User(username=f'user{i}') for i in range(users_needed)], batch_size=5000)
+    user_ids = list(User.objects.values_list('id', flat=True))
+    song_ids = list(Song.objects.values_list('id', flat=True))
+    rng = random.Random(0)
+    seen, batch = set(), []
+    while len(seen) < args.favorites:
+        pair = (rng.choice(user_ids), rng.choice(song_ids))
+        if pair in seen:
+            continue
+        seen.add(pair)
+        batch.append(Favorite(user_id=pair[0], song_id=pair[1]))
+        if len(batch) == 10000:
+            Favorite.objects.bulk_create(batch)
+            batch = []
+    Favorite.objects.bulk_create(batch)
+    print(f'Seeded {args.songs} songs and {args.favorites} favorites in {time.perf_counter() - start:.1f}s')
+
+    superuser = User.objects.create_superuser('bench-admin', 'admin@example.com', 'x')
+    client = Client()
+    client.force_login(superuser)
+
+    song_admin = admin.site._registry[Song]
+    favorite_admin = admin.site._registry[Favorite]
+    current = {
+        song_admin: {k: getattr(song_admin, k) for k in ('paginator', 'show_full_result_count', 'list_filter')},
+        favorite_admin: {k: getattr(favorite_admin, k) for k in ('paginator', 'show_full_result_count', 'search_fields', 'list_select_related')},
+    }
+    previous = {
+        song_admin: {'paginator': Paginator, 'show_full_result_count': True,
+                     'list_filter': ['category', 'created_at', 'is_active']},
+        favorite_admin: {'paginator': Paginator, 'show_full_result_count': True,
+                         'search_fields': ['user__username', 'song__title'], 'list_select_related': False},
+    }
+
+    pages = [
+        ('songs', '/admin/songs/song/'),
+        ('songs ?q=', '/admin/songs/song/?q=Song+42'),
+        ('favorites', '/admin/songs/favorite/'),
+        ('favorites ?q=', f'/admin/songs/favorite/?q=user{users_needed // 2}'),
+    ]
+
+    rows = []
+    for label, options in [('previous', previous), ('current', current)]:
+        for model_admin, attrs in options.items():
+            for name, value in attrs.items():
+                setattr(model_admin, name, value)
+        for page, url in pages:
+            client.get(url)  # warm up (and fill the count cache, as in steady state)
+            reset_queries()  # request_started clears the log mid-capture otherwise
+            with CaptureQueriesContext(connection) as ctx:
+                client.get(url)
+            elapsed, response = measure(lambda: client.get(url), args.repeat)
+            assert response.status_code == 200, response.status_code
+            rows.append([label, page, len(ctx.captured_queries), f'{elapsed / args.repeat * 1000:.1f}'])
+
+    print()
+    print_table(['admin', 'changelist', 'queries', 'ms/request'], rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""
+Sync gunicorn vs. ASGI (uvicorn workers) under many slow clients.
+
+Opens --slow-clients connections that trickle a recording upload body a few
+bytes at a time (a phone on a bad network), then measures how quickly a probe
+client gets `GET /api/songs/` answered while they are connected.
+
+    python benchmarks/asgi_concurrency.py --slow-clients 1000 --workers 4
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from common import BASE_DIR, percentile, print_table, seed_catalog, setup_django
+
+SERVERS = {
+    'gunicorn sync (wsgi)': ['config.wsgi:application'],
+    'gunicorn + uvicorn (asgi)': ['config.asgi:application', '-k', 'uvicorn_worker.UvicornWorker'],
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(args, port, workers, db_path):
+    env = dict(os.environ, SQLITE_PATH=str(db_path))
+    env.pop('MICLAB_ASYNC_VIEWS', None)
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', *args, '-w', str(workers),
+         '-b', f'127.0.0.1:{port}', '--timeout', '120', '--log-level', 'warning'],
+        cwd=BASE_DIR, env=env)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError('server did not start')
+
+
+async def slow_upload(port, stop, body_size=256 * 1024, chunk=256, interval=0.5):
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    except OSError:
+        return
+    try:
+        writer.write((
+            'POST /api/recordings/ HTTP/1.1\r\nHost: localhost\r\n'
+            'Content-Type: multipart/form-data; boundary=miclab\r\n'
+            f'Content-Length: {body_size}\r\n\r\n').encode())
+        sent = 0
+        while not stop.is_set() and sent < body_size:
+            writer.write(b'x' * chunk)
+            await writer.drain()
+            sent += chunk
+            await asyncio.sleep(interval)
+    except (ConnectionError, OSError):
+        pass
+    finally:
+        writer.close()
+
+
+async def probe(port, duration, timeout, trial_token):
+    latencies, failures = [], 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+            writer.write((
+                'GET /api/songs/ HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n'
+                f'X-Trial-Token: {trial_token}\r\n\r\n').encode())
+            status = await asyncio.wait_for(reader.readline(), timeout)
+            await asyncio.wait_for(reader.read(), timeout)
+            writer.close()
+            if b' 200 ' in status:
+                latencies.append(time.perf_counter() - start)
+            else:
+                failures += 1
+        except (asyncio.TimeoutError, ConnectionError, OSError):
+            failures += 1
+    return latencies, failures
+
+
+async def run_load(port, slow_clients, duration, timeout, trial_token):
+    stop = asyncio.Event()
+    uploads = [asyncio.create_task(slow_upload(port, stop)) for _ in range(slow_clients)]
+    await asyncio.sleep(2)  # let the slow clients connect and start trickling
+    latencies, failures = await probe(port, duration, timeout, trial_token)
+    stop.set()
+    await asyncio.gather(*uploads, return_exceptions=True)
+    return latencies, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--slow-clients', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=15.0, help='probe duration (s)')
+    parser.add_argument('--timeout', type=float, default=5.0, help='probe request timeout (s)')
+    args = parser.parse_args()
+
+    db_path = setup_django()
+    seed_catalog(100)
+    from songs.trial import issue_trial_token
+    trial_token, _ = issue_trial_token('benchmark-device')
+
+    rows = []
+    for label, server_args in SERVERS.items():
+        port = free_port()
+        proc = start_server(server_args, port, args.workers, db_path)
+        try:
+            latencies, failures = asyncio.run(
+                run_load(port, args.slow_clients, args.duration, args.timeout, trial_token))
+        finally:
+            proc.terminate()
+            proc.wait()
+        rows.append([
+            label, len(latencies), failures,
+            f'{percentile(latencies, 50) * 1000:.1f}', f'{percentile(latencies, 99) * 1000:.1f}',
+        ])
+
+    print(f'\n{args.slow_clients} slow upload clients, {args.workers} workers, {args.duration:.0f}s probe\n')
+    print_table(['server', 'ok', 'failed/timeout', 'p50 ms', 'p99 ms'], rows)
+
+
+if __name__ == '__main__':
+    main()
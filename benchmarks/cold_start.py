@@ -0,0 +1,101 @@
+"""
+Cold start: time from launching gunicorn to the first 200 on /api/songs/.
+
+Each variant starts a fresh single-worker gunicorn (using gunicorn.conf.py
+from the project directory), polls the song list until it answers 200, and
+stops the server. With --budget-ms the script exits non-zero when any
+variant's median is over budget, so it can guard startup time in CI:
+
+    python benchmarks/cold_start.py --repeat 5 --budget-ms 1500
+
+--project-dir runs the same measurement against another checkout, e.g. a
+`git worktree` of an older commit, for before/after numbers.
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+from common import BASE_DIR, print_table, seed_catalog, setup_django
+
+VARIANTS = {
+    'preload': {},
+    'no preload': {'GUNICORN_PRELOAD': '0'},
+    'preload, API-only': {'MICLAB_API_ONLY': '1'},
+    'no preload, API-only': {'GUNICORN_PRELOAD': '0', 'MICLAB_API_ONLY': '1'},
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def first_200(project_dir, db_path, trial_token, extra_env, timeout=60):
+    """Seconds from Popen to the first successful song list response."""
+    port = free_port()
+    env = dict(os.environ, SQLITE_PATH=str(db_path), **extra_env)
+    for name in ('MICLAB_ASYNC_VIEWS', 'WEB_CONCURRENCY'):
+        env.pop(name, None)
+    request = urllib.request.Request(
+        f'http://127.0.0.1:{port}/api/songs/', headers={'X-Trial-Token': trial_token})
+
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'config.wsgi:application', '-w', '1',
+         '-b', f'127.0.0.1:{port}', '--log-level', 'warning'],
+        cwd=project_dir, env=env)
+    try:
+        while time.perf_counter() - start < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError('gunicorn exited during startup')
+            try:
+                with urllib.request.urlopen(request, timeout=5) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except (urllib.error.URLError, ConnectionError):
+                pass
+            time.sleep(0.005)
+        raise RuntimeError('no 200 from /api/songs/ before the timeout')
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--songs', type=int, default=500)
+    parser.add_argument('--budget-ms', type=float, help='fail if a median is above this')
+    parser.add_argument('--project-dir', default=str(BASE_DIR), help='checkout to start gunicorn from')
+    args = parser.parse_args()
+
+    db_path = setup_django()
+    seed_catalog(args.songs)
+    from songs.trial import issue_trial_token
+    trial_token, _ = issue_trial_token('benchmark-device')
+
+    rows, over_budget = [], []
+    for label, extra_env in VARIANTS.items():
+        times = [first_200(args.project_dir, db_path, trial_token, extra_env) * 1000
+                 for _ in range(args.repeat)]
+        median = statistics.median(times)
+        rows.append([label, f'{median:.0f}', f'{min(times):.0f}', f'{max(times):.0f}'])
+        if args.budget_ms and median > args.budget_ms:
+            over_budget.append(label)
+
+    print(f'\n{args.project_dir}, {args.repeat} runs per variant\n')
+    print_table(['variant', 'median ms', 'min ms', 'max ms'], rows)
+    if over_budget:
+        print(f"\nOver the {args.budget_ms:.0f} ms budget: {', '.join(over_budget)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
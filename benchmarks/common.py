@@ -0,0 +1,71 @@
+"""
+Shared setup for the benchmark scripts.
+
+Every benchmark runs against a throwaway SQLite database so it never touches
+db.sqlite3:
+
+    python benchmarks/<name>.py --help
+"""
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django(db_path=None):
+    """Point Django at a fresh (or given) SQLite file, migrate it and return its path."""
+    if str(BASE_DIR) not in sys.path:
+        sys.path.insert(0, str(BASE_DIR))
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix='miclab-bench-'), 'bench.sqlite3')
+    os.environ['SQLITE_PATH'] = str(db_path)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+    import django
+    from django.core.management import call_command
+
+    django.setup()
+    call_command('migrate', verbosity=0)
+    return db_path
+
+
+def seed_catalog(songs=100, category_name='Traditional'):
+    """Insert `songs` rows pointing at placeholder media names."""
+    from songs.models import Category, Song
+
+    category, _ = Category.objects.get_or_create(
+        name=category_name, defaults={'slug': category_name.lower()})
+    Song.objects.bulk_create([
+        Song(title=f'Song {i}', artist=f'Artist {i % 37}', category=category,
+             audio_file=f'songs/audio/song_{i}.m4a', lyrics_file=f'songs/audio/song_{i}.vtt',
+             duration=180 + i % 120)
+        for i in range(songs)
+    ], batch_size=1000)
+    return category
+
+
+def measure(fn, repeat=1):
+    """Run fn `repeat` times, return (total seconds, last result)."""
+    start = time.perf_counter()
+    result = None
+    for _ in range(repeat):
+        result = fn()
+    return time.perf_counter() - start, result
+
+
+def percentile(values, pct):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(int(len(values) * pct / 100), len(values) - 1)]
+
+
+def print_table(headers, rows):
+    widths = [max(len(str(h)), *(len(str(r[i])) for r in rows)) for i, h in enumerate(headers)]
+    print('  '.join(str(h).ljust(w) for h, w in zip(headers, widths)))
+    print('  '.join('-' * w for w in widths))
+    for row in rows:
+        print('  '.join(str(c).ljust(w) for c, w in zip(row, widths)))
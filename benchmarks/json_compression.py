@@ -0,0 +1,58 @@
+"""
+Song list payloads: JSON encode time and bytes on the wire.
+
+Serializes pages of SongListSerializer once, then times rendering them with
+DRF's stdlib JSONRenderer vs. the orjson FastJSONRenderer, and reports the
+size and cost of each content encoding CompressionMiddleware can pick.
+
+    python benchmarks/json_compression.py --page-size 20 --page-size 100
+"""
+import argparse
+
+from common import measure, print_table, seed_catalog, setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--page-size', type=int, action='append')
+    parser.add_argument('--repeat', type=int, default=500)
+    args = parser.parse_args()
+    page_sizes = args.page_size or [20, 100]
+
+    setup_django()
+    from rest_framework.renderers import JSONRenderer
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+    from config import compression
+    from config.renderers import FastJSONRenderer
+    from songs.models import Song
+    from songs.serializers import SongListSerializer
+
+    seed_catalog(max(page_sizes))
+    request = Request(APIRequestFactory().get('/api/songs/', HTTP_HOST='api.miclab.example.com'))
+
+    encode_rows, size_rows = [], []
+    for page_size in page_sizes:
+        songs = list(Song.objects.select_related('category')[:page_size])
+        data = {
+            'count': len(songs), 'next': None, 'previous': None,
+            'results': SongListSerializer(
+                songs, many=True, context={'request': request, 'favorite_ids': set()}).data,
+        }
+
+        for label, renderer in [('json (stdlib)', JSONRenderer()), ('orjson', FastJSONRenderer())]:
+            elapsed, body = measure(lambda: renderer.render(data), args.repeat)
+            encode_rows.append([page_size, label, f'{elapsed / args.repeat * 1e6:.1f}'])
+
+        size_rows.append([page_size, 'identity', len(body), '-'])
+        for name, encode in compression.ENCODERS:
+            elapsed, compressed = measure(lambda: encode(body), args.repeat)
+            size_rows.append([page_size, name, len(compressed), f'{elapsed / args.repeat * 1e6:.1f}'])
+
+    print_table(['page size', 'renderer', 'us/page'], encode_rows)
+    print()
+    print_table(['page size', 'encoding', 'bytes/page', 'us/page'], size_rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Login throughput per password hasher, with and without an attack-shaped load.
+
+For every legitimate login the attack mix adds --attack-ratio wrong-password
+attempts from a handful of IPs against random accounts (credential stuffing).
+With the login throttles on, those attempts are rejected from the cache
+before any hashing work.
+
+    python benchmarks/login_throughput.py --logins 50 --attack-ratio 20
+"""
+import argparse
+import random
+import time
+
+from common import print_table, setup_django
+
+
+def run(client, users, logins, attack_ratio, attacker_ips=5):
+    rng = random.Random(0)
+    ok = rejected = 0
+    start = time.perf_counter()
+    for i in range(logins):
+        for _ in range(attack_ratio):
+            victim = rng.choice(users)
+            response = client.post('/api/auth/login/', {'email': victim, 'password': 'hunter2'},
+                                   format='json', REMOTE_ADDR=f'10.6.6.{rng.randrange(attacker_ips)}')
+            rejected += response.status_code == 429
+        email = users[i % len(users)]
+        response = client.post('/api/auth/login/', {'email': email, 'password': 'correct horse'},
+                               format='json', REMOTE_ADDR=f'192.168.{i // 250}.{i % 250}')
+        ok += response.status_code == 200
+    elapsed = time.perf_counter() - start
+    return ok, rejected, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logins', type=int, default=50, help='legitimate logins per scenario')
+    parser.add_argument('--attack-ratio', type=int, default=20, help='attack attempts per legitimate login')
+    parser.add_argument('--users', type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib.auth.hashers import make_password
+    from django.contrib.auth.models import User
+    from django.core.cache import cache
+    from django.test import override_settings
+    from rest_framework.test import APIClient
+    from auth_app.throttling import LoginEmailThrottle, LoginIPThrottle
+    from songs.models import UserProfile
+
+    emails = [f'user{i}@example.com' for i in range(args.users)]
+    users = User.objects.bulk_create([User(username=f'user{i}', email=e) for i, e in enumerate(emails)])
+    UserProfile.objects.bulk_create([UserProfile(user=u) for u in users])
+
+    hashers = {
+        'pbkdf2 (Django default)': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+        'scrypt (tuned)': 'auth_app.hashers.TunedScryptPasswordHasher',
+        'argon2 (tuned)': 'auth_app.hashers.TunedArgon2PasswordHasher',
+    }
+    throttle_rates = dict(LoginIPThrottle.THROTTLE_RATES)
+    client = APIClient()
+    rows = []
+
+    for label, hasher in hashers.items():
+        with override_settings(PASSWORD_HASHERS=[hasher]):
+            User.objects.update(password=make_password('correct horse'))
+            scenarios = [
+                ('no attack', 0, throttle_rates),
+                ('attack, no throttle', args.attack_ratio, {'login_ip': None, 'login_email': None}),
+                ('attack, throttled', args.attack_ratio, throttle_rates),
+            ]
+            for scenario, ratio, rates in scenarios:
+                LoginIPThrottle.THROTTLE_RATES = LoginEmailThrottle.THROTTLE_RATES = rates
+                cache.clear()
+                ok, rejected, elapsed = run(client, emails, args.logins, ratio)
+                rows.append([label, scenario, f'{ok}/{args.logins}', rejected,
+                             f'{args.logins * (ratio + 1) / elapsed:.1f}', f'{ok / elapsed:.1f}'])
+
+    print(f'\n{args.logins} legitimate logins, {args.attack_ratio} attack attempts each\n')
+    print_table(['hasher', 'scenario', 'legit ok', '429s', 'req/s', 'legit logins/s'], rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Recordings list: platform-wide full serializer vs. the caller's slim list.
+
+Seeds --recordings rows spread over --users users, then times page 1 of
+GET /api/recordings/ the old way (Recording.objects.all() + RecordingSerializer)
+and the new way (scoped to request.user, RecordingListSerializer, index).
+
+    python benchmarks/recordings_list.py --recordings 1000000 --users 50000
+"""
+import argparse
+import random
+import time
+import warnings
+
+from common import measure, print_table, seed_catalog, setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--recordings', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=50_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib.auth.models import User
+    from rest_framework.pagination import PageNumberPagination
+    from rest_framework.request import Request
+    from rest_framework.test import APIClient, APIRequestFactory
+    from rest_framework.authtoken.models import Token
+    from songs.models import Recording, Song
+    from songs.serializers import RecordingSerializer
+    from django.core.paginator import UnorderedObjectListWarning
+
+    warnings.filterwarnings('ignore', category=UnorderedObjectListWarning)
+
+    seed_catalog(500)
+    song_ids = list(Song.objects.values_list('id', flat=True))
+
+    start = time.perf_counter()
+    User.objects.bulk_create(
+        [User(username=f'user{i}', email=f'user{i}@example.com') for i in range(args.users)],
+        batch_size=5000)
+    user_ids = list(User.objects.values_list('id', flat=True))
+    rng = random.Random(0)
+    batch = []
+    for i in range(args.recordings):
+        user_id = user_ids[i % len(user_ids)]
+        batch.append(Recording(user_id=user_id, song_id=rng.choice(song_ids),
+                               audio_file=f'myrecordings/recording_{i}.m4a',
+                               recording_id=f'bench_{i}', duration=rng.randrange(60, 300)))
+        if len(batch) == 10000:
+            Recording.objects.bulk_create(batch)
+            batch = []
+    Recording.objects.bulk_create(batch)
+    print(f'Seeded {args.recordings} recordings for {args.users} users in {time.perf_counter() - start:.1f}s')
+
+    user = User.objects.get(id=user_ids[len(user_ids) // 2])
+    token = Token.objects.create(user=user)
+    factory = APIRequestFactory()
+
+    def before():
+        request = Request(factory.get('/api/recordings/'))
+        paginator = PageNumberPagination()
+        page = paginator.paginate_queryset(Recording.objects.all(), request)
+        return paginator.get_paginated_response(
+            RecordingSerializer(page, many=True, context={'request': request}).data).data
+
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def after():
+        return client.get('/api/recordings/').json()
+
+    rows = []
+    for label, fn in [('all recordings, full serializer', before), ('own recordings, slim list', after)]:
+        fn()  # warm up
+        elapsed, data = measure(fn, args.repeat)
+        rows.append([label, data['count'], len(data['results']), f'{elapsed / args.repeat * 1000:.2f}'])
+
+    print()
+    print_table(['list', 'count', 'rows', 'ms/request'], rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Song list serialization: DRF SongListSerializer vs. the song_rows fast path.
+
+Reports rows/sec for serializing pre-fetched rows only, and for a whole page
+(query + serialize), on pages of --page-size songs.
+
+    python benchmarks/song_rows.py --page-size 20 --repeat 2000
+"""
+import argparse
+
+from common import measure, print_table, seed_catalog, setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--songs', type=int, default=1000)
+    parser.add_argument('--page-size', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    setup_django()
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+    from songs.models import Song
+    from songs.serializers import SONG_ROW_FIELDS, SongListSerializer, song_rows
+
+    seed_catalog(args.songs)
+    request = Request(APIRequestFactory().get('/api/songs/', HTTP_HOST='api.miclab.example.com'))
+    size = args.page_size
+
+    songs = list(Song.objects.select_related('category')[:size])
+    rows = list(Song.objects.values(*SONG_ROW_FIELDS)[:size])
+
+    cases = [
+        ('serialize only', 'SongListSerializer',
+         lambda: SongListSerializer(songs, many=True, context={'request': request, 'favorite_ids': set()}).data),
+        ('serialize only', 'song_rows',
+         lambda: song_rows(rows, request)),
+        ('query + serialize', 'SongListSerializer',
+         lambda: SongListSerializer(Song.objects.select_related('category')[:size], many=True,
+                                    context={'request': request, 'favorite_ids': set()}).data),
+        ('query + serialize', 'song_rows',
+         lambda: song_rows(Song.objects.values(*SONG_ROW_FIELDS)[:size], request)),
+    ]
+
+    table = []
+    for scope, label, fn in cases:
+        fn()  # warm up
+        elapsed, data = measure(fn, args.repeat)
+        assert len(data) == size
+        table.append([scope, label, f'{elapsed / args.repeat * 1e6:.0f}', f'{size * args.repeat / elapsed:,.0f}'])
+
+    print_table(['scope', 'path', 'us/page', 'rows/sec'], table)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,10 @@ ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Run with uvicorn workers so slow clients don't hold a worker thread:
+
+    gunicorn config.asgi:application -k uvicorn_worker.UvicornWorker -w 4
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -12,5 +16,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+os.environ.setdefault('MICLAB_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
@@ -0,0 +1,124 @@
+"""
+Negotiated response compression (brotli, zstd, gzip).
+
+Replaces Django's GZipMiddleware: picks the best encoding the client accepts
+(honouring q-values), only compresses text-like bodies above
+COMPRESSION_MIN_SIZE bytes, and leaves media, range and streaming responses
+alone so audio and song packs keep their byte ranges. HTML is skipped because
+it carries CSRF tokens (BREACH).
+
+brotli and zstandard are optional; without them gzip is used.
+"""
+import gzip
+import re
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+COMPRESSIBLE_TYPES = (
+    'application/json',
+    'application/javascript',
+    'application/xml',
+    'image/svg+xml',
+    'text/',
+)
+SKIPPED_TYPES = ('text/html',)
+
+
+def _brotli(data):
+    return brotli.compress(data, quality=getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 4))
+
+
+def _zstd(data):
+    return zstandard.ZstdCompressor(level=getattr(settings, 'COMPRESSION_ZSTD_LEVEL', 3)).compress(data)
+
+
+def _gzip(data):
+    return gzip.compress(data, compresslevel=getattr(settings, 'COMPRESSION_GZIP_LEVEL', 6), mtime=0)
+
+
+# Server preference order, used to break q-value ties
+ENCODERS = [
+    ('br', _brotli if brotli is not None else None),
+    ('zstd', _zstd if zstandard is not None else None),
+    ('gzip', _gzip),
+]
+ENCODERS = [(name, fn) for name, fn in ENCODERS if fn is not None]
+
+_accept_re = re.compile(r'\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*')
+
+
+def parse_accept_encoding(header):
+    """{coding: q} for an Accept-Encoding header."""
+    accepted = {}
+    for part in (header or '').split(','):
+        match = _accept_re.fullmatch(part)
+        if not match:
+            continue
+        try:
+            q = float(match.group(2)) if match.group(2) else 1.0
+        except ValueError:
+            continue
+        accepted[match.group(1).lower()] = q
+    return accepted
+
+
+def choose_encoding(header):
+    """Best available encoding for the header, or None for identity."""
+    accepted = parse_accept_encoding(header)
+    best, best_q = None, 0.0
+    for name, _ in ENCODERS:
+        q = accepted.get(name, accepted.get('*', 0.0))
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+def is_compressible(content_type):
+    content_type = content_type.split(';', 1)[0].strip().lower()
+    if content_type in SKIPPED_TYPES:
+        return False
+    return content_type.startswith(COMPRESSIBLE_TYPES) or content_type.endswith('+json')
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    def process_response(self, request, response):
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+        if response.status_code == 206 or request.method == 'HEAD':
+            return response
+        if not is_compressible(response.get('Content-Type', '')):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if 'no-transform' in response.get('Cache-Control', ''):
+            return response
+        if len(response.content) < getattr(settings, 'COMPRESSION_MIN_SIZE', 860):
+            return response
+
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING'))
+        if encoding is None:
+            return response
+        compressed = dict(ENCODERS)[encoding](response.content)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        # The encoded body differs, so a strong ETag would be wrong
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
@@ -0,0 +1,62 @@
+"""
+orjson-backed JSON renderer and parser for DRF.
+
+Output matches rest_framework's JSONRenderer with the default settings
+(compact, UTF-8, no ASCII escaping, U+2028/U+2029 escaped so the output is
+also valid JavaScript); anything orjson can't encode natively
+(Decimal, lazy translation strings, ...) and datetimes go through DRF's
+encoder. The one difference is the spelling of float exponents (1e20 vs
+1e+20, the same number to any JSON parser), and NaN/Infinity, which DRF
+refuses and orjson writes as null.
+Indented output (the browsable API, `?format=json; indent=4`) and non-UTF-8
+request bodies use the stock classes. Without orjson installed both classes
+behave exactly like DRF's.
+"""
+import codecs
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+_encoder = JSONEncoder()
+# Escaped by DRF's JSONRenderer; orjson writes them as raw UTF-8
+_LINE_SEPARATORS = (('\u2028'.encode(), b'\\u2028'), ('\u2029'.encode(), b'\\u2029'))
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            body = orjson.dumps(data, default=_encoder.default,
+                                option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+        except TypeError:
+            # e.g. integers beyond 64 bits; let the stdlib encoder decide
+            return super().render(data, accepted_media_type, renderer_context)
+        for raw, escaped in _LINE_SEPARATORS:
+            if raw in body:
+                body = body.replace(raw, escaped)
+        return body
+
+
+class FastJSONParser(JSONParser):
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or codecs.lookup(encoding).name != 'utf-8':
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
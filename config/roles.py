@@ -0,0 +1,40 @@
+"""
+Process roles (the ROLE setting, from MICLAB_ROLE).
+
+* ``all``    - everything in one process (development, small deployments).
+* ``api``    - the JSON API (config/urls_api.py). No admin, browsable API or
+  multipart parser; upload bodies are refused before they are read, so a
+  slow upload or encode never holds an API worker.
+* ``media``  - media files under MEDIA_URL (config/urls_media.py), with Range
+  support and sendfile.
+* ``ingest`` - admin, the song upload page, multipart song/recording uploads,
+  direct recording uploads and recording post-processing
+  (config/urls_ingest.py).
+
+Each role has its own URLconf, middleware stack and gunicorn sizing
+(gunicorn.conf.py), and runs with ``python manage.py run_role <role>``.
+"""
+from django.conf import settings
+from django.http import JsonResponse
+
+
+class RejectUploadsMiddleware:
+    """
+    API role: answer multipart and oversized requests with 415/413 before the
+    body is read. Uploads belong on the ingest role.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.content_type == 'multipart/form-data':
+            return JsonResponse({'error': 'Uploads are handled by the ingest service'}, status=415)
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        limit = settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+        if limit is not None and length > limit:
+            return JsonResponse({'error': 'Request body too large'}, status=413)
+        return self.get_response(request)
@@ -1,6 +1,9 @@
 from pathlib import Path
+import importlib.util
 import os
 
+from django.core.exceptions import ImproperlyConfigured
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = 'django-insecure-=7(*b(p2raey0ni9wnxcz%4b(!9l*vo8w@hps_q57t4z7rnvk6'
@@ -23,18 +26,55 @@ INSTALLED_APPS = [
     'auth_app',
 ]
 
-MIDDLEWARE = [
-    'django.middleware.security.SecurityMiddleware',
-    'corsheaders.middleware.CorsMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
-    'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
-    'django.middleware.clickjacking.XFrameOptionsMiddleware',
-]
+# Process role (config/roles.py). 'all' serves everything from one process;
+# in production each role runs as its own service, started with
+# `python manage.py run_role <role>`:
+#   api    - JSON API; no admin, browsable API or upload bodies
+#   media  - media files (Range requests, sendfile)
+#   ingest - admin, song uploads, recording uploads and post-processing
+ROLE = os.environ.get('MICLAB_ROLE', 'all')
+if ROLE not in ('all', 'api', 'media', 'ingest'):
+    raise ImproperlyConfigured(f"Unknown MICLAB_ROLE {ROLE!r}")
+
+# API-only workers (MICLAB_API_ONLY=1, or the api/media roles) skip the admin
+# site, the upload page and the browsable API, which keeps them out of
+# startup and memory
+API_ONLY = os.environ.get('MICLAB_API_ONLY') == '1' or ROLE in ('api', 'media')
+if API_ONLY:
+    INSTALLED_APPS.remove('django.contrib.admin')
+
+if ROLE == 'api':
+    # Token-authenticated JSON only: no sessions, CSRF or messages
+    MIDDLEWARE = [
+        'django.middleware.security.SecurityMiddleware',
+        'corsheaders.middleware.CorsMiddleware',
+        'config.roles.RejectUploadsMiddleware',
+        'config.compression.CompressionMiddleware',
+        'django.middleware.common.CommonMiddleware',
+    ]
+elif ROLE == 'media':
+    MIDDLEWARE = [
+        'django.middleware.security.SecurityMiddleware',
+        'corsheaders.middleware.CorsMiddleware',
+    ]
+else:
+    MIDDLEWARE = [
+        'django.middleware.security.SecurityMiddleware',
+        'corsheaders.middleware.CorsMiddleware',
+        'config.compression.CompressionMiddleware',
+        'django.contrib.sessions.middleware.SessionMiddleware',
+        'django.middleware.common.CommonMiddleware',
+        'django.middleware.csrf.CsrfViewMiddleware',
+        'django.contrib.auth.middleware.AuthenticationMiddleware',
+        'django.contrib.messages.middleware.MessageMiddleware',
+        'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    ]
 
-ROOT_URLCONF = 'config.urls'
+ROOT_URLCONF = 'config.urls' if ROLE == 'all' else f'config.urls_{ROLE}'
+
+# Public base URLs of the other roles when they run as separate services,
+# e.g. https://ingest.example.com; empty means "same host as the request"
+INGEST_URL = os.environ.get('MICLAB_INGEST_URL', '')
 
 TEMPLATES = [
     {
@@ -52,16 +92,45 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'config.wsgi.application'
+ASGI_APPLICATION = 'config.asgi.application'
+
+# Set by config/asgi.py: serve the hot read endpoints (song list, auth/me,
+# auth/check_access) and media files from async views
+ASYNC_API_VIEWS = os.environ.get('MICLAB_ASYNC_VIEWS') == '1'
 
 
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
     }
 }
 
 
+# Password hashing. PASSWORD_HASHER picks the preferred algorithm ('argon2',
+# needs argon2-cffi, or 'scrypt'); the PBKDF2 hashers stay listed so existing
+# hashes still verify and are re-hashed transparently on the next login.
+PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'argon2')
+if PASSWORD_HASHER == 'argon2' and importlib.util.find_spec('argon2') is None:
+    PASSWORD_HASHER = 'scrypt'
+
+ARGON2_TIME_COST = 2
+ARGON2_MEMORY_COST = 19 * 1024  # KiB
+ARGON2_PARALLELISM = 1
+SCRYPT_WORK_FACTOR = 2 ** 14
+
+_TUNED_HASHERS = {
+    'argon2': 'auth_app.hashers.TunedArgon2PasswordHasher',
+    'scrypt': 'auth_app.hashers.TunedScryptPasswordHasher',
+}
+PASSWORD_HASHERS = [_TUNED_HASHERS[PASSWORD_HASHER]] + [
+    hasher for name, hasher in _TUNED_HASHERS.items() if name != PASSWORD_HASHER
+] + [
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+]
+
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -90,7 +159,9 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
-MEDIA_URL = '/media/'
+# Absolute (e.g. https://media.example.com/media/) when the media role runs
+# on its own host
+MEDIA_URL = os.environ.get('MEDIA_URL', '/media/')
 
 # Use /data persistent disk on Render
 if os.path.exists('/data'):
@@ -98,9 +169,58 @@ if os.path.exists('/data'):
 else:
     MEDIA_ROOT = BASE_DIR / 'media'
 
-# Ensure directories exist
-os.makedirs(os.path.join(MEDIA_ROOT, 'songs', 'audio'), exist_ok=True)
-os.makedirs(os.path.join(MEDIA_ROOT, 'myrecordings'), exist_ok=True)
+# No os.makedirs here: FileSystemStorage creates directories on first save
+
+# Media storage for all FileFields (songs/storage.py): 'local' (MEDIA_ROOT)
+# or 's3' (AWS S3 or an S3-compatible server such as MinIO)
+MEDIA_STORAGE = os.environ.get('MEDIA_STORAGE', 'local')
+
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+if MEDIA_STORAGE == 's3':
+    STORAGES['default'] = {'BACKEND': 'songs.storage.S3MediaStorage'}
+    # Credentials come from AWS_ACCESS_KEY_ID / AWS_SECRET_ACCESS_KEY
+    AWS_STORAGE_BUCKET_NAME = os.environ.get('AWS_STORAGE_BUCKET_NAME', 'miclab-media')
+    # e.g. http://localhost:9000 for a local MinIO
+    AWS_S3_ENDPOINT_URL = os.environ.get('AWS_S3_ENDPOINT_URL')
+    AWS_S3_REGION_NAME = os.environ.get('AWS_S3_REGION_NAME', 'us-east-1')
+    AWS_S3_ADDRESSING_STYLE = 'path' if AWS_S3_ENDPOINT_URL else 'auto'
+    AWS_S3_SIGNATURE_VERSION = 's3v4'
+    AWS_S3_CUSTOM_DOMAIN = os.environ.get('AWS_S3_CUSTOM_DOMAIN')
+    AWS_DEFAULT_ACL = None
+    # Same naming as FileSystemStorage: never overwrite, add a suffix instead
+    AWS_S3_FILE_OVERWRITE = False
+    # Private bucket: media URLs are pre-signed GETs
+    AWS_QUERYSTRING_AUTH = True
+    AWS_QUERYSTRING_EXPIRE = 3600
+
+# Files above the threshold go to object storage as parallel multipart uploads
+MEDIA_MULTIPART_THRESHOLD = 8 * 1024 * 1024
+MEDIA_MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+MEDIA_MULTIPART_CONCURRENCY = 8
+
+# Largest recording accepted through direct uploads (songs/uploads.py)
+RECORDING_UPLOAD_MAX_BYTES = 100 * 1024 * 1024
+
+
+# Shared cache (throttling, ...). Set REDIS_URL so every worker sees the same
+# counters; the local-memory fallback is per process.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
 
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -112,8 +232,128 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'config.renderers.FastJSONRenderer',
+    ] + ([] if API_ONLY else ['rest_framework.renderers.BrowsableAPIRenderer']),
+    'DEFAULT_PARSER_CLASSES': [
+        'config.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+    ] + ([] if ROLE == 'api' else ['rest_framework.parsers.MultiPartParser']),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
+    # Proxies in front of the app whose X-Forwarded-For entries are trusted
+    # for client IPs (throttling). 0 uses REMOTE_ADDR and ignores the header.
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
+    'DEFAULT_THROTTLE_RATES': {
+        'login_ip': '30/min',
+        'login_email': '10/min',
+        # Token buckets per user (songs/limits.py)
+        'uploads': '30/hour',
+        'processing': '60/hour',
+        'events': '600/hour',
+    },
+}
+
+# Token bucket sizes for the scopes above: how many requests may arrive
+# back to back before the hourly rate applies
+THROTTLE_BURSTS = {
+    'uploads': 10,
+    'processing': 10,
+    'events': 60,
+}
+
+# In-app purchases (auth_app/billing.py). Receipts are checked with Apple
+# (ios) and Google Play (android). IAP_VERIFIER=fake accepts
+# FakeReceiptVerifier test receipts instead and is refused unless DEBUG is on
+IAP_VERIFIER = os.environ.get('IAP_VERIFIER', 'store')
+if IAP_VERIFIER == 'store':
+    RECEIPT_VERIFIERS = {
+        'ios': 'auth_app.billing.AppleReceiptVerifier',
+        'android': 'auth_app.billing.GooglePlayReceiptVerifier',
+    }
+elif IAP_VERIFIER == 'fake':
+    if not DEBUG:
+        raise ImproperlyConfigured("IAP_VERIFIER=fake accepts unpaid receipts and needs DEBUG")
+    RECEIPT_VERIFIERS = {
+        'ios': 'auth_app.billing.FakeReceiptVerifier',
+        'android': 'auth_app.billing.FakeReceiptVerifier',
+    }
+else:
+    raise ImproperlyConfigured(f"Unknown IAP_VERIFIER {IAP_VERIFIER!r}; use 'store' or 'fake'")
+IAP_VERIFY_TIMEOUT = 5
+# Verified receipts are reused for this long (or until they expire)
+RECEIPT_CACHE_SECONDS = 3600
+APPLE_SHARED_SECRET = os.environ.get('APPLE_SHARED_SECRET', '')
+GOOGLE_PLAY_PACKAGE_NAME = os.environ.get('GOOGLE_PLAY_PACKAGE_NAME', 'com.miclab.app')
+GOOGLE_SERVICE_ACCOUNT_FILE = os.environ.get('GOOGLE_SERVICE_ACCOUNT_FILE', '')
+STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET', '')
+# Stripe price id -> UserProfile.subscription_type
+STRIPE_PRICE_PLANS = {
+    os.environ.get('STRIPE_PRICE_MONTHLY', 'price_premium_monthly'): 'premium_monthly',
+    os.environ.get('STRIPE_PRICE_YEARLY', 'price_premium_yearly'): 'premium_yearly',
+}
+
+# Recording storage per user, by UserProfile.subscription_type
+STORAGE_QUOTAS = {
+    'free': 200 * 1024 * 1024,
+    'premium_monthly': 5 * 1024 * 1024 * 1024,
+    'premium_yearly': 5 * 1024 * 1024 * 1024,
 }
 
 CORS_ALLOW_ALL_ORIGINS = True
+
+# Response compression (config/compression.py): bodies smaller than this are
+# sent as-is
+COMPRESSION_MIN_SIZE = 860
+COMPRESSION_BROTLI_QUALITY = 4
+COMPRESSION_ZSTD_LEVEL = 3
+COMPRESSION_GZIP_LEVEL = 6
+
+# In-process background worker for media post-processing (songs/tasks.py)
+BACKGROUND_TASK_WORKERS = 2
+BACKGROUND_TASKS_EAGER = False
+# Named pools for long jobs; 'recordings' and 'keyshift' run one ffmpeg
+# process per worker
+BACKGROUND_TASK_POOLS = {
+    'recordings': 2,
+    'keyshift': 1,
+}
+# Analytics events (songs/analytics.py) are buffered per process and written
+# once this many are waiting, or this many seconds after the first one
+ANALYTICS_FLUSH_SIZE = 1000
+ANALYTICS_FLUSH_INTERVAL = 10
+ANALYTICS_BUFFER_MAX = 50000
+# Offline clients may send events up to this old (seconds)
+ANALYTICS_MAX_EVENT_AGE = 7 * 24 * 3600
+# Song rankings for ?ordering=trending|popular (songs/ranking.py): an event
+# loses half its weight every RANKING_HALF_LIVES days
+RANKING_WEIGHTS = {
+    'favorites': 5.0,
+    'recordings': 3.0,
+    'plays': 1.0,
+}
+RANKING_HALF_LIVES = {
+    'trending': 3,
+    'popular': 90,
+}
+RANKING_WINDOW_DAYS = 365
+RANKING_REFRESH_SECONDS = 15 * 60
+# Song recommendations (songs/recommendations.py): neighbours kept per song,
+# similarity shrinkage for pairs with few users, users skipped as outliers,
+# and how many of a user's recent songs seed /api/songs/recommended/
+RECOMMENDATION_NEIGHBORS = 30
+RECOMMENDATION_SHRINKAGE = 5.0
+RECOMMENDATION_MAX_USER_SONGS = 1000
+RECOMMENDATION_HISTORY = 50
+# Key-shifted backing tracks (songs/keyshift.py), rendered on demand into a
+# local disk cache that is kept under KEY_SHIFT_CACHE_MAX_BYTES
+KEY_SHIFT_CACHE_DIR = os.environ.get(
+    'KEY_SHIFT_CACHE_DIR', '/data/cache/keyshift' if os.path.exists('/data') else str(BASE_DIR / 'cache' / 'keyshift'))
+KEY_SHIFT_CACHE_MAX_BYTES = int(os.environ.get('KEY_SHIFT_CACHE_MAX_BYTES', 2 * 1024 * 1024 * 1024))
+KEY_SHIFT_MAX_SEMITONES = 6
+KEY_SHIFT_RENDER_TIMEOUT = 300
+# A failed render is reported (503) for this long before it is tried again
+KEY_SHIFT_FAILURE_SECONDS = 600
+# Post-process recordings in the process that received them. When the roles
+# are split, the ingest role's worker (`process_recordings --watch`) does it.
+RECORDING_PROCESSING_INLINE = ROLE == 'all'
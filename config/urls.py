@@ -1,29 +1,17 @@
-from django.contrib import admin
-from django.urls import path, include
+"""
+URLconf for the 'all' role: the api, ingest and (in development) media
+roles' URLs served from one process. See config/roles.py.
+"""
 from django.conf import settings
 from django.conf.urls.static import static
-from rest_framework.routers import DefaultRouter
-from songs.views import SongViewSet, CategoryViewSet, FavoriteViewSet, UserProfileViewSet, RecordingViewSet, upload_song_page
-from auth_app.views import AuthViewSet
+from config.urls_ingest import urlpatterns as ingest_urlpatterns
 
-# Create router and register viewsets
-router = DefaultRouter()
-router.register(r'songs', SongViewSet, basename='song')
-router.register(r'categories', CategoryViewSet, basename='category')
-router.register(r'favorites', FavoriteViewSet, basename='favorite')
-router.register(r'profile', UserProfileViewSet, basename='profile')
-router.register(r'recordings', RecordingViewSet, basename='recording')
-router.register(r'auth', AuthViewSet, basename='auth')
+urlpatterns = list(ingest_urlpatterns)
 
-urlpatterns = [
-    path('admin/', admin.site.urls),
-    path('upload/', upload_song_page, name='upload_song'),
-    path('api/', include(router.urls)),
-]
-
-# Serve media files in development
+# Serve media files in development (range-capable; async under ASGI)
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL,
-                          document_root=settings.MEDIA_ROOT)
+    from config.urls_media import urlpatterns as media_urlpatterns
+
+    urlpatterns += media_urlpatterns
     urlpatterns += static(settings.STATIC_URL,
                           document_root=settings.STATIC_ROOT)
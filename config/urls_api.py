@@ -0,0 +1,37 @@
+"""URLconf for the api role: the JSON API only."""
+from django.urls import path, include
+from django.conf import settings
+from rest_framework.routers import DefaultRouter
+from songs.views import SongViewSet, CategoryViewSet, FavoriteViewSet, UserProfileViewSet, RecordingViewSet, TrialViewSet, CatalogViewSet, EventViewSet
+from auth_app.views import AuthViewSet
+from auth_app.billing import stripe_webhook
+
+# Create router and register viewsets
+router = DefaultRouter()
+router.register(r'songs', SongViewSet, basename='song')
+router.register(r'categories', CategoryViewSet, basename='category')
+router.register(r'favorites', FavoriteViewSet, basename='favorite')
+router.register(r'profile', UserProfileViewSet, basename='profile')
+router.register(r'recordings', RecordingViewSet, basename='recording')
+router.register(r'auth', AuthViewSet, basename='auth')
+router.register(r'trial', TrialViewSet, basename='trial')
+router.register(r'catalog', CatalogViewSet, basename='catalog')
+router.register(r'events', EventViewSet, basename='event')
+
+urlpatterns = []
+
+# Under ASGI the hot read endpoints are answered by async views
+if settings.ASYNC_API_VIEWS:
+    from songs.async_views import song_list
+    from auth_app.async_views import me, check_access
+
+    urlpatterns += [
+        path('api/songs/', song_list),
+        path('api/auth/me/', me),
+        path('api/auth/check_access/', check_access),
+    ]
+
+urlpatterns += [
+    path('api/billing/stripe/', stripe_webhook, name='stripe_webhook'),
+    path('api/', include(router.urls)),
+]
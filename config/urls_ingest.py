@@ -0,0 +1,26 @@
+"""
+URLconf for the ingest role: admin, the song upload page and the upload
+endpoints. The API is mounted too, so multipart song and recording uploads
+(POST /api/songs/upload_song/, POST /api/recordings/, ...) can be sent here.
+"""
+from django.urls import path
+from django.conf import settings
+from songs.views import upload_song_page
+from songs.uploads import recording_upload
+from config.urls_api import urlpatterns as api_urlpatterns
+
+urlpatterns = []
+
+# Admin and the song upload page are left out of API-only workers
+if not settings.API_ONLY:
+    from django.contrib import admin
+
+    urlpatterns += [
+        path('admin/', admin.site.urls),
+        path('upload/', upload_song_page, name='upload_song'),
+    ]
+
+urlpatterns += [
+    path('upload/recordings/<str:token>/', recording_upload, name='recording_upload'),
+]
+urlpatterns += api_urlpatterns
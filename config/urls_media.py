@@ -0,0 +1,15 @@
+"""URLconf for the media role: files under MEDIA_URL, with Range support."""
+from urllib.parse import urlsplit
+
+from django.urls import re_path
+from django.conf import settings
+
+# Async under ASGI; under WSGI the file is handed to the server's sendfile
+if settings.ASYNC_API_VIEWS:
+    from songs.media import serve_media
+else:
+    from songs.media import serve_media_file as serve_media
+
+urlpatterns = [
+    re_path(r'^%s(?P<path>.*)$' % urlsplit(settings.MEDIA_URL).path.lstrip('/'), serve_media),
+]
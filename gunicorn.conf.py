@@ -0,0 +1,64 @@
+"""
+gunicorn settings, picked up automatically from the working directory:
+
+    gunicorn config.wsgi:application
+    MICLAB_API_ONLY=1 gunicorn config.wsgi:application   # API-only workers
+    python manage.py run_role media                       # one role (MICLAB_ROLE)
+
+Each role (config/roles.py) gets its own default port and sizing:
+CPU-bound API workers, many threads for slow media and upload clients, and
+long timeouts for ingest. PORT, WEB_CONCURRENCY and GUNICORN_TIMEOUT
+override them.
+
+The app is imported once in the master (preload) and forked, so workers
+start warm and share the imported code copy-on-write. Command-line flags
+override anything here.
+"""
+import multiprocessing
+import os
+
+_cpus = multiprocessing.cpu_count()
+ROLE_DEFAULTS = {
+    'all': {'port': 8000, 'workers': _cpus * 2 + 1, 'threads': 1, 'timeout': 120},
+    'api': {'port': 8000, 'workers': _cpus * 2 + 1, 'threads': 1, 'timeout': 30},
+    'media': {'port': 8001, 'workers': _cpus, 'threads': 32, 'timeout': 120},
+    'ingest': {'port': 8002, 'workers': 2, 'threads': 8, 'timeout': 600},
+}
+_role = ROLE_DEFAULTS.get(os.environ.get('MICLAB_ROLE', 'all'), ROLE_DEFAULTS['all'])
+
+bind = f"0.0.0.0:{os.environ.get('PORT', _role['port'])}"
+workers = int(os.environ.get('WEB_CONCURRENCY', _role['workers']))
+# threads > 1 switches sync workers to gthread
+threads = _role['threads']
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', _role['timeout']))
+keepalive = 5
+max_requests = 2000
+max_requests_jitter = 200
+
+# Heartbeat files on tmpfs, so a slow disk can't stall workers
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+
+def when_ready(server):
+    """Finish the lazy startup work in the master, before any worker forks."""
+    if not server.cfg.preload_app:
+        return
+    import gc
+
+    from django.urls import get_resolver
+
+    # Import every view module now instead of on each worker's first request
+    get_resolver().url_patterns
+    # Keep the preloaded objects out of GC passes, so collections in the
+    # workers don't write to (and un-share) the pages they live on
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Never share database sockets opened in the master with the workers
+    if server.cfg.preload_app:
+        from django.db import connections
+
+        connections.close_all()
@@ -1,10 +1,53 @@
+import hashlib
+
 from django.contrib import admin
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Count
+from django.utils.functional import cached_property
 from django.utils.html import format_html
-from django.db.models import Model
-from .models import Song, Category, Favorite, UserProfile
+from .models import Song, Category, Favorite, UserProfile, TrialSession, Recording, SongDailyStats
+from .postprocess import schedule_recording_processing
+from .trial import revoke_trial
 from django.core.files.base import ContentFile
 
 
+ADMIN_COUNT_CACHE_SECONDS = 300
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator that caches COUNT(*) per query for a few minutes"""
+
+    @cached_property
+    def count(self):
+        sql, params = self.object_list.query.sql_with_params()
+        key = 'admin-count:' + hashlib.sha1(f'{sql}{params}'.encode()).hexdigest()
+        count = cache.get(key)
+        if count is None:
+            count = super().count
+            cache.set(key, count, ADMIN_COUNT_CACHE_SECONDS)
+        return count
+
+
+class CategoryCountFilter(admin.SimpleListFilter):
+    """Category filter showing song counts, from one cached GROUP BY"""
+    title = 'category'
+    parameter_name = 'category__id__exact'
+
+    def lookups(self, request, model_admin):
+        lookups = cache.get('admin-category-counts')
+        if lookups is None:
+            categories = Category.objects.annotate(songs=Count('song')).values_list('id', 'name', 'songs')
+            lookups = [(str(pk), f"{name} ({songs})") for pk, name, songs in categories]
+            cache.set('admin-category-counts', lookups, ADMIN_COUNT_CACHE_SECONDS)
+        return lookups
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(category_id=self.value())
+        return queryset
+
+
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ['name', 'slug']
     prepopulated_fields = {'slug': ('name',)}
@@ -13,9 +56,12 @@ class CategoryAdmin(admin.ModelAdmin):
 class SongAdmin(admin.ModelAdmin):
     list_display = ['title', 'artist', 'category',
                     'duration', 'created_at', 'file_status']
-    list_filter = ['category', 'created_at', 'is_active']
+    list_filter = [CategoryCountFilter, 'created_at', 'is_active']
+    list_select_related = ['category']
     search_fields = ['title', 'artist']
     readonly_fields = ['created_at', 'updated_at', 'file_preview', 'duration']
+    paginator = CachedCountPaginator
+    show_full_result_count = False
 
     fieldsets = (
         ('Song Information', {
@@ -37,8 +83,8 @@ class SongAdmin(admin.ModelAdmin):
     def save_model(self, request, obj, form, change):
         """Custom save to handle audio conversion"""
         import os
+        import shutil
         import subprocess
-        from django.conf import settings
         import tempfile
 
         # Auto-detect duration if not set
@@ -84,9 +130,9 @@ class SongAdmin(admin.ModelAdmin):
         if obj.audio_file:
             ext = os.path.splitext(obj.audio_file.name)[1].lower()
 
-            # Save to temp file
-            temp_audio_path = os.path.join(
-                settings.MEDIA_ROOT, f'temp_audio{ext}')
+            # Save to temp file (outside media storage, which may be a bucket)
+            temp_dir = tempfile.mkdtemp(prefix='admin-upload-')
+            temp_audio_path = os.path.join(temp_dir, f'temp_audio{ext}')
 
             with open(temp_audio_path, 'wb') as f:
                 for chunk in obj.audio_file.chunks():
@@ -95,8 +141,7 @@ class SongAdmin(admin.ModelAdmin):
             # Convert to M4A if needed
             if ext in ['.mp3', '.wav', '.flac', '.ogg']:
                 try:
-                    output_path = os.path.join(
-                        settings.MEDIA_ROOT, 'temp_audio.m4a')
+                    output_path = os.path.join(temp_dir, 'temp_audio.m4a')
                     cmd = [
                         'ffmpeg',
                         '-i', temp_audio_path,
@@ -122,11 +167,7 @@ class SongAdmin(admin.ModelAdmin):
                                 ContentFile(audio_content), save=False)
 
             # Clean up temp
-            try:
-                if os.path.exists(temp_audio_path):
-                    os.remove(temp_audio_path)
-            except:
-                pass
+            shutil.rmtree(temp_dir, ignore_errors=True)
 
         # Rename VTT file if uploaded
         if obj.lyrics_file:
@@ -141,11 +182,12 @@ class SongAdmin(admin.ModelAdmin):
         super().save_model(request, obj, form, change)
 
     def file_status(self, obj):
-        """Show if files exist"""
-        audio = "✅" if obj.audio_file else "❌"
-        lyrics = "✅" if obj.lyrics_file else "❌"
-        return format_html(f"Audio: {audio} Lyrics: {lyrics}")
+        """Show if files exist (sizes are recorded when the song is saved)"""
+        audio = f"✅ {obj.audio_size / 1_000_000:.1f} MB" if obj.audio_size is not None else "❌"
+        lyrics = "✅" if obj.lyrics_size is not None else "❌"
+        return format_html("Audio: {} Lyrics: {}", audio, lyrics)
     file_status.short_description = "Files"
+    file_status.admin_order_field = 'audio_size'
 
     def file_preview(self, obj):
         """Show file links"""
@@ -170,16 +212,73 @@ class SongAdmin(admin.ModelAdmin):
 class FavoriteAdmin(admin.ModelAdmin):
     list_display = ['user', 'song', 'added_at']
     list_filter = ['added_at']
+    list_select_related = ['user', 'song']
     search_fields = ['user__username', 'song__title']
+    raw_id_fields = ['user', 'song']
+    paginator = CachedCountPaginator
+    show_full_result_count = False
 
 
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ['user', 'subscription_type']
+    list_select_related = ['user']
     list_filter = ['subscription_type']
     readonly_fields = ['created_at', 'updated_at']
 
 
+class RecordingAdmin(admin.ModelAdmin):
+    list_display = ['recording_id', 'user', 'song', 'processing_status', 'created_at']
+    list_filter = ['processing_status']
+    list_select_related = ['user', 'song']
+    search_fields = ['=recording_id', '=user__username']
+    raw_id_fields = ['user', 'song']
+    readonly_fields = ['processing_status', 'processing_error', 'processed_file', 'mix_file',
+                       'processed_at', 'created_at', 'updated_at']
+    paginator = CachedCountPaginator
+    show_full_result_count = False
+    actions = ['reprocess_recordings']
+
+    @admin.action(description="Re-run post-processing")
+    def reprocess_recordings(self, request, queryset):
+        recordings = list(queryset)
+        for recording in recordings:
+            schedule_recording_processing(recording)
+        self.message_user(request, f"Queued {len(recordings)} recording(s)")
+
+
+class TrialSessionAdmin(admin.ModelAdmin):
+    list_display = ['device_id', 'created_at', 'trial_end_date']
+    search_fields = ['device_id']
+    readonly_fields = ['created_at']
+    actions = ['revoke_trials']
+
+    @admin.action(description="Revoke selected trials")
+    def revoke_trials(self, request, queryset):
+        revoked = sum(revoke_trial(session.device_id) for session in queryset)
+        self.message_user(request, f"Revoked {revoked} trial(s)")
+
+
+class SongDailyStatsAdmin(admin.ModelAdmin):
+    """Read-only: rows are maintained by the analytics flush (songs/analytics.py)"""
+    list_display = ['day', 'song', 'plays', 'completions', 'recordings_started', 'seeks']
+    list_select_related = ['song']
+    list_filter = ['day']
+    date_hierarchy = 'day'
+    ordering = ['-day', '-plays']
+    paginator = CachedCountPaginator
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 admin.site.register(Song, SongAdmin)
 admin.site.register(Category, CategoryAdmin)
 admin.site.register(Favorite, FavoriteAdmin)
-admin.site.register(UserProfile, UserProfileAdmin)
\ No newline at end of file
+admin.site.register(UserProfile, UserProfileAdmin)
+admin.site.register(Recording, RecordingAdmin)
+admin.site.register(TrialSession, TrialSessionAdmin)
+admin.site.register(SongDailyStats, SongDailyStatsAdmin)
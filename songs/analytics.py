@@ -0,0 +1,199 @@
+"""
+Listening and singing analytics.
+
+Clients send batches of events (play, seek, record start, completion) to
+POST /api/events/. Events are appended to an in-process buffer and written
+with one bulk_create per flush. A flush runs when the buffer reaches
+ANALYTICS_FLUSH_SIZE events, or ANALYTICS_FLUSH_INTERVAL seconds after the
+first buffered event. The same transaction adds the events to the per-song
+daily counters in SongDailyStats (one upsert per song and day). Popularity
+queries read those counters instead of counting raw events.
+
+The buffer is per process. It is flushed at normal exit but lost if the
+process is killed, which analytics can afford. While the database is
+unavailable (OperationalError/InterfaceError), events are kept for the next
+flush, up to ANALYTICS_BUFFER_MAX and MAX_FLUSH_ATTEMPTS failed flushes in a
+row. A batch failing for any other reason (e.g. an IntegrityError because a
+user was deleted meanwhile) would fail every time, so it is logged and
+dropped.
+"""
+import atexit
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import InterfaceError, OperationalError, connection, transaction
+from django.utils import timezone
+
+from . import tasks
+from .models import Song, SongDailyStats, SongEvent
+
+logger = logging.getLogger(__name__)
+
+# SongEvent.event_type -> SongDailyStats counter
+EVENT_COUNTERS = {
+    SongEvent.TYPE_PLAY: 'plays',
+    SongEvent.TYPE_SEEK: 'seeks',
+    SongEvent.TYPE_RECORD_START: 'recordings_started',
+    SongEvent.TYPE_COMPLETE: 'completions',
+}
+COUNTER_FIELDS = ('plays', 'seeks', 'recordings_started', 'completions')
+# Client clocks may run this far ahead of ours
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+MAX_POSITION_MS = 2 ** 31 - 1
+FLUSH_TASK_KEY = ('analytics-flush',)
+# Buffered events are dropped after this many failed flushes in a row
+MAX_FLUSH_ATTEMPTS = 5
+
+# (song_id, event_type, position_ms, occurred_at, user_id, device_id, received_at)
+_buffer = []
+_lock = threading.Lock()
+_timer = None
+_failed_flushes = 0
+
+
+def parse_events(items, now=None):
+    """
+    Validate client events ``[{"type", "song", "position_ms"?, "ts"?}]``,
+    where ``ts`` is when it happened in epoch seconds (default: now).
+    Returns (events, number rejected). Events from the future or older than
+    ANALYTICS_MAX_EVENT_AGE are rejected.
+    """
+    now = now or timezone.now()
+    oldest = now - timedelta(seconds=settings.ANALYTICS_MAX_EVENT_AGE)
+    events, rejected = [], 0
+    for item in items:
+        try:
+            event_type = item['type']
+            if event_type not in EVENT_COUNTERS:
+                raise ValueError(event_type)
+            song_id = int(item['song'])
+            position_ms = min(max(int(item.get('position_ms') or 0), 0), MAX_POSITION_MS)
+            ts = item.get('ts')
+            occurred_at = now if ts is None else datetime.fromtimestamp(float(ts), dt_timezone.utc)
+        except (KeyError, TypeError, ValueError, OverflowError, OSError):
+            rejected += 1
+            continue
+        if not oldest <= occurred_at <= now + MAX_CLOCK_SKEW:
+            rejected += 1
+            continue
+        events.append((song_id, event_type, position_ms, min(occurred_at, now)))
+    return events, rejected
+
+
+def _arm_timer():
+    """Schedule the time-based flush (caller holds _lock)."""
+    global _timer
+    if _timer is None:
+        _timer = threading.Timer(settings.ANALYTICS_FLUSH_INTERVAL, schedule_flush)
+        _timer.daemon = True
+        _timer.start()
+
+
+def record_events(events, user_id=None, device_id=''):
+    """Buffer parsed events; returns how many were accepted."""
+    received_at = timezone.now()
+    with _lock:
+        room = max(settings.ANALYTICS_BUFFER_MAX - len(_buffer), 0)
+        if room < len(events):
+            logger.warning("Analytics buffer full, dropping %d events", len(events) - room)
+            events = events[:room]
+        _buffer.extend((*event, user_id, device_id, received_at) for event in events)
+        if _buffer:
+            _arm_timer()
+        size = len(_buffer)
+    if size >= settings.ANALYTICS_FLUSH_SIZE:
+        schedule_flush()
+    return len(events)
+
+
+def schedule_flush():
+    return tasks.submit(flush_events, key=FLUSH_TASK_KEY)
+
+
+def flush_events():
+    """Write the buffered events and add them to the daily stats. Returns the number written."""
+    global _buffer, _timer, _failed_flushes
+    with _lock:
+        batch, _buffer = _buffer, []
+        if _timer is not None:
+            _timer.cancel()
+            _timer = None
+    if not batch:
+        return 0
+    try:
+        written = _write_events(batch)
+    except (OperationalError, InterfaceError):
+        _failed_flushes += 1
+        if _failed_flushes >= MAX_FLUSH_ATTEMPTS:
+            logger.exception("Could not write %d analytics events after %d attempts, dropping them",
+                             len(batch), _failed_flushes)
+            _failed_flushes = 0
+            return 0
+        logger.exception("Could not write %d analytics events, keeping them for the next flush", len(batch))
+        with _lock:
+            room = max(settings.ANALYTICS_BUFFER_MAX - len(_buffer), 0)
+            _buffer[:0] = batch[:room]
+            if _buffer:
+                _arm_timer()
+        return 0
+    except Exception:
+        logger.exception("Could not write %d analytics events, dropping them", len(batch))
+        return 0
+    _failed_flushes = 0
+    return written
+
+
+def _write_events(batch):
+    # Events for deleted or unknown songs are dropped here, one query per flush
+    song_ids = set(Song.objects.filter(
+        id__in={event[0] for event in batch}).order_by().values_list('id', flat=True))
+    events = []
+    daily = defaultdict(lambda: dict.fromkeys(COUNTER_FIELDS, 0))
+    for song_id, event_type, position_ms, occurred_at, user_id, device_id, received_at in batch:
+        if song_id not in song_ids:
+            continue
+        events.append(SongEvent(
+            song_id=song_id, event_type=event_type, position_ms=position_ms,
+            occurred_at=occurred_at, user_id=user_id, device_id=device_id, received_at=received_at,
+        ))
+        daily[(song_id, timezone.localdate(occurred_at))][EVENT_COUNTERS[event_type]] += 1
+
+    with transaction.atomic():
+        SongEvent.objects.bulk_create(events, batch_size=1000)
+        add_daily_stats(daily)
+    return len(events)
+
+
+def add_daily_stats(daily):
+    """
+    Add ``{(song_id, day): {counter: n}}`` to SongDailyStats, creating rows
+    as needed. Rows are written in key order so concurrent flushes from
+    several processes can't deadlock.
+    """
+    if not daily:
+        return
+    quote = connection.ops.quote_name
+    table = quote(SongDailyStats._meta.db_table)
+    columns = ('song_id', 'day') + COUNTER_FIELDS
+    updates = ', '.join(f'{quote(c)} = {table}.{quote(c)} + excluded.{quote(c)}' for c in COUNTER_FIELDS)
+    # INSERT ... ON CONFLICT works on both PostgreSQL and SQLite
+    sql = (
+        f'INSERT INTO {table} ({", ".join(quote(c) for c in columns)}) '
+        f'VALUES ({", ".join(["%s"] * len(columns))}) '
+        f'ON CONFLICT ({quote("song_id")}, {quote("day")}) DO UPDATE SET {updates}'
+    )
+    rows = [
+        (song_id, day, *(counts[c] for c in COUNTER_FIELDS))
+        for (song_id, day), counts in sorted(daily.items())
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+@atexit.register
+def _flush_at_exit():
+    if _buffer:
+        flush_events()
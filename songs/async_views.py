@@ -0,0 +1,79 @@
+"""
+Async song list, used when running under ASGI.
+
+Produces the same paginated JSON as `SongViewSet.list` but reads through
+Django's async ORM. Other methods on the same URL (POST to create a song,
+OPTIONS) go to `SongViewSet` as usual.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from config.renderers import FastJSONRenderer
+from auth_app.async_views import aget_request_user, not_authenticated
+from .models import Song, Favorite
+from .ranking import RANK_ORDERINGS, order_by_rank, schedule_rank_refresh
+from .serializers import SONG_ROW_FIELDS, song_rows
+from .trial import TRIAL_TOKEN_HEADER, verify_trial_token
+from .views import SongViewSet
+
+_song_collection = SongViewSet.as_view({'get': 'list', 'post': 'create'})
+
+
+async def song_list(request):
+    """List all songs (paginated like DRF's PageNumberPagination)"""
+    if request.method != 'GET':
+        return await sync_to_async(_song_collection)(request)
+
+    # Same authentication and trial gate as SongViewSet
+    user = await aget_request_user(request, [TokenAuthentication])
+    if user is None and await sync_to_async(verify_trial_token)(request.headers.get(TRIAL_TOKEN_HEADER)) is None:
+        return not_authenticated([TokenAuthentication])
+
+    page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+    try:
+        page = int(request.GET.get('page', 1))
+    except ValueError:
+        page = 0
+
+    queryset = Song.objects.all()
+    ordering = request.GET.get('ordering')
+    if ordering is not None:
+        if ordering not in RANK_ORDERINGS:
+            return JsonResponse({'error': f'ordering must be one of: {", ".join(RANK_ORDERINGS)}'}, status=400)
+        schedule_rank_refresh()
+        queryset = order_by_rank(queryset, ordering)
+    queryset = queryset.values(*SONG_ROW_FIELDS)
+    count = await queryset.acount()
+    num_pages = max((count + page_size - 1) // page_size, 1)
+    if page < 1 or page > num_pages:
+        return JsonResponse({'detail': 'Invalid page.'}, status=404)
+
+    offset = (page - 1) * page_size
+    rows = [row async for row in queryset[offset:offset + page_size]]
+
+    favorite_ids = set()
+    if user is not None:
+        favorite_ids = {
+            song_id async for song_id in Favorite.objects.filter(
+                user=user, song_id__in=[row['id'] for row in rows]
+            ).values_list('song_id', flat=True)
+        }
+
+    url = request.build_absolute_uri()
+    next_url = replace_query_param(url, 'page', page + 1) if page < num_pages else None
+    if page <= 1:
+        previous_url = None
+    elif page == 2:
+        previous_url = remove_query_param(url, 'page')
+    else:
+        previous_url = replace_query_param(url, 'page', page - 1)
+
+    body = FastJSONRenderer().render({
+        'count': count,
+        'next': next_url,
+        'previous': previous_url,
+        'results': song_rows(rows, request, favorite_ids),
+    })
+    return HttpResponse(body, content_type='application/json')
@@ -0,0 +1,128 @@
+"""
+Offline "song pack" bundles.
+
+A bundle is a simple length-prefixed container so it can be streamed with
+constant memory and resumed with HTTP Range requests (every byte offset is
+known before anything is read):
+
+    b"MLPK"  u16 version  u32 entry_count
+    entry_count x (u16 name_len, name (utf-8), u64 data_len, data)
+
+All integers are big-endian.  The first entry is always ``manifest.json``
+describing the songs and the names of their audio/lyrics/thumbnail entries.
+"""
+import hashlib
+import json
+import os
+import struct
+
+from .thumbnails import pick_variant, variants_are_current
+
+BUNDLE_MAGIC = b'MLPK'
+BUNDLE_VERSION = 1
+BUNDLE_CONTENT_TYPE = 'application/vnd.miclab.songpack'
+MAX_BUNDLE_SONGS = 50
+CHUNK_SIZE = 64 * 1024
+
+
+class _BytesSegment:
+    def __init__(self, data):
+        self.data = data
+        self.size = len(data)
+
+    def read(self, start, end):
+        yield self.data[start:end]
+
+
+class _FileSegment:
+    def __init__(self, storage, name, size):
+        self.storage = storage
+        self.name = name
+        self.size = size
+
+    def read(self, start, end):
+        with self.storage.open(self.name, 'rb') as f:
+            f.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+
+def _entry_header(name, size):
+    encoded = name.encode('utf-8')
+    return struct.pack('>H', len(encoded)) + encoded + struct.pack('>Q', size)
+
+
+def _song_files(song):
+    """(kind, storage, name) for each file attached to a song."""
+    files = []
+    if song.audio_file:
+        files.append(('audio', song.audio_file.storage, song.audio_file.name))
+    if song.lyrics_file:
+        files.append(('lyrics', song.lyrics_file.storage, song.lyrics_file.name))
+    if song.thumbnail:
+        name = song.thumbnail.name
+        if variants_are_current(song):
+            name = pick_variant(song.thumbnail_variants, 256, 'webp') or name
+        files.append(('thumbnail', song.thumbnail.storage, name))
+    return files
+
+
+class SongBundle:
+    """Byte layout of a bundle for a list of songs, readable by range."""
+
+    def __init__(self, songs):
+        manifest = {'version': BUNDLE_VERSION, 'songs': []}
+        file_segments = []
+
+        for song in songs:
+            entry = {
+                'id': song.id,
+                'title': song.title,
+                'artist': song.artist,
+                'category': song.category.slug if song.category else None,
+                'duration': song.duration,
+                'updated_at': song.updated_at.isoformat(),
+                'files': {},
+            }
+            for kind, storage, name in _song_files(song):
+                try:
+                    size = storage.size(name)
+                except (OSError, NotImplementedError):
+                    continue
+                entry_name = f"{song.id}/{kind}{os.path.splitext(name)[1].lower()}"
+                entry['files'][kind] = entry_name
+                file_segments.append((entry_name, _FileSegment(storage, name, size)))
+            manifest['songs'].append(entry)
+
+        manifest_bytes = json.dumps(manifest, ensure_ascii=False).encode('utf-8')
+
+        self.segments = [_BytesSegment(
+            BUNDLE_MAGIC + struct.pack('>HI', BUNDLE_VERSION, len(file_segments) + 1))]
+        for name, segment in [('manifest.json', _BytesSegment(manifest_bytes))] + file_segments:
+            self.segments.append(_BytesSegment(_entry_header(name, segment.size)))
+            self.segments.append(segment)
+
+        self.size = sum(s.size for s in self.segments)
+        # Same songs and same file versions -> same bytes, so If-Range works
+        self.etag = '"%s"' % hashlib.sha1(
+            manifest_bytes + str(self.size).encode()).hexdigest()
+
+    def iter_range(self, start=0, end=None):
+        """Yield the bytes in [start, end) without buffering whole files."""
+        end = self.size if end is None else min(end, self.size)
+        offset = 0
+        for segment in self.segments:
+            seg_start, seg_end = offset, offset + segment.size
+            offset = seg_end
+            if seg_end <= start:
+                continue
+            if seg_start >= end:
+                break
+            yield from segment.read(max(start, seg_start) - seg_start,
+                                    min(end, seg_end) - seg_start)
+
@@ -0,0 +1,50 @@
+"""
+Time-ordered unique IDs (UUIDv7 layout, RFC 9562).
+
+    48 bits  unix time in milliseconds
+     4 bits  version (7)
+    12 bits  per-process counter, so IDs from one process are strictly
+             increasing even within the same millisecond
+     2 bits  variant
+    62 bits  random (os.urandom), which keeps IDs from different gunicorn
+             workers and hosts apart without any coordination
+
+The canonical string form sorts lexicographically in creation order, so new
+rows land at the end of the unique index instead of at random positions.
+"""
+import os
+import threading
+import time
+import uuid
+
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+
+
+def uuid7():
+    global _last_ms, _counter
+    with _lock:
+        now_ms = time.time_ns() // 1_000_000
+        if now_ms > _last_ms:
+            _last_ms = now_ms
+            _counter = int.from_bytes(os.urandom(2), 'big') & 0x7FF
+        else:
+            _counter += 1
+            if _counter > 0xFFF:
+                # Counter exhausted: borrow the next millisecond
+                _last_ms += 1
+                _counter = 0
+        ms, counter = _last_ms, _counter
+
+    rand = int.from_bytes(os.urandom(8), 'big') & ((1 << 62) - 1)
+    value = (ms & ((1 << 48) - 1)) << 80
+    value |= 0x7 << 76
+    value |= counter << 64
+    value |= 0b10 << 62
+    value |= rand
+    return uuid.UUID(int=value)
+
+
+def new_recording_id():
+    return str(uuid7())
@@ -0,0 +1,66 @@
+"""
+ffprobe/ffmpeg helpers for song ingest.
+
+Plain functions with no Django imports, so they can run in worker processes
+(see the import_catalog management command).
+"""
+import os
+import subprocess
+
+AUDIO_EXTENSIONS = ('.mp3', '.m4a', '.aac', '.wav', '.flac', '.ogg')
+LYRICS_EXTENSIONS = ('.vtt', '.lrc')
+THUMBNAIL_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+
+# Sources in these formats are re-encoded to AAC/M4A
+TRANSCODE_EXTENSIONS = ('.mp3', '.wav', '.flac', '.ogg')
+# Raw AAC (ADTS) is already AAC: the stream is copied into an M4A container
+REMUX_EXTENSIONS = ('.aac',)
+
+
+def media_basename(artist, title):
+    """`Artist_-_Title` style name used for stored song files"""
+    filename = f"{artist} - {title}"
+    filename = filename.replace('/', '_').replace('\\', '_').replace('"', '')
+    return filename.replace(' ', '_')
+
+
+def probe_duration(path, fallback_bytes_per_second=40000):
+    """Duration in whole seconds via ffprobe, estimated from size if that fails"""
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-show_entries', 'format=duration',
+        '-of', 'default=noprint_wrappers=1:nokey=1',
+        path
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+        if result.returncode == 0 and result.stdout.strip():
+            return int(float(result.stdout.strip()))
+    except (OSError, subprocess.TimeoutExpired, ValueError):
+        pass
+    return max(int(os.path.getsize(path) / fallback_bytes_per_second), 1)
+
+
+def transcode_to_m4a(input_path, output_path, bitrate='192k', copy_audio=False):
+    """
+    Encode to AAC/M4A with ffmpeg, or only rewrap an AAC stream if
+    ``copy_audio``. Raises RuntimeError on failure.
+    """
+    codec = ['-c:a', 'copy'] if copy_audio else ['-c:a', 'aac', '-b:a', bitrate]
+    cmd = [
+        'ffmpeg',
+        '-v', 'error',
+        '-i', input_path,
+        '-vn',
+        *codec,
+        '-y',
+        output_path
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=600)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise RuntimeError(f"ffmpeg failed: {e}")
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {result.stderr.strip()[-500:]}")
+    return output_path
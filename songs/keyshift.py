@@ -0,0 +1,253 @@
+"""
+Key-shifted backing tracks for ``GET /api/songs/{id}/audio/?semitones=N``.
+
+ffmpeg renders each variant once, on the ``keyshift`` worker pool. It uses
+the rubberband filter when ffmpeg has it, and asetrate + atempo otherwise;
+both change the pitch without changing the tempo.
+
+Renders are kept in a local disk cache (KEY_SHIFT_CACHE_DIR). Files are
+named by the SHA-256 of the song's audio and the shift, so a replaced audio
+file never gets a stale variant and identical audio shares one.
+The cache stays under KEY_SHIFT_CACHE_MAX_BYTES by evicting the least
+recently served files; every hit bumps the file's access time.
+
+The bookkeeping lives in the same directory (``.state/``), so every worker
+process that serves from it sees it: each song's content hash, a lock file
+per variant being rendered (concurrent requests collapse into one render)
+and the error of a failed render, which is reported for
+KEY_SHIFT_FAILURE_SECONDS before the next attempt. The view answers 202
+until the file exists, then serves it with Range support through
+songs/media.py.
+
+Renders run in the api process that serves the variant rather than on the
+ingest role: the cache is that host's local disk, so rendering anywhere else
+would mean shipping every variant back. The one-worker ``keyshift`` pool and
+the ``processing`` rate limit bound the CPU they take from requests.
+"""
+import functools
+import hashlib
+import logging
+import os
+import shutil
+import time
+import uuid
+
+from django.conf import settings
+
+from . import tasks
+from .postprocess import _local_path
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 44100
+BITRATE = '192k'
+# Renders abandoned by a crashed worker are removed after this long
+STALE_RENDER_SECONDS = 3600
+
+
+def variant_name(content_hash, semitones):
+    return f'{content_hash}_{semitones:+d}.m4a'
+
+
+def _state_path(song, suffix):
+    """Bookkeeping file for the song's current audio file."""
+    audio = hashlib.sha1(f'{song.audio_file.name}:{song.audio_size}'.encode()).hexdigest()[:16]
+    return os.path.join(settings.KEY_SHIFT_CACHE_DIR, '.state', f'{song.pk}-{audio}{suffix}')
+
+
+def _age(path):
+    """Seconds since ``path`` was written, or None if it doesn't exist."""
+    try:
+        return time.time() - os.stat(path).st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def _write_state(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = f'{path}.{uuid.uuid4().hex}'
+    with open(partial, 'w') as f:
+        f.write(text)
+    os.replace(partial, path)
+
+
+def _read_state(path):
+    try:
+        with open(path) as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def has_rubberband():
+    import subprocess
+
+    try:
+        result = subprocess.run(['ffmpeg', '-hide_banner', '-filters'],
+                                capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+    return any(line.split()[1:2] == ['rubberband'] for line in result.stdout.splitlines())
+
+
+def key_shift_filter(semitones):
+    """ffmpeg -af that shifts the pitch by ``semitones`` at the same tempo."""
+    ratio = 2 ** (semitones / 12)
+    if has_rubberband():
+        return f'rubberband=pitch={ratio:.6f}'
+    # Resample to shift pitch and tempo together, then restore the tempo
+    return (f'aresample={SAMPLE_RATE},asetrate={SAMPLE_RATE * ratio:.0f},'
+            f'aresample={SAMPLE_RATE},atempo={1 / ratio:.6f}')
+
+
+def key_shift_command(source, output, semitones):
+    return ['ffmpeg', '-v', 'error', '-y', '-i', source, '-vn',
+            '-af', key_shift_filter(semitones), '-c:a', 'aac', '-b:a', BITRATE,
+            '-movflags', '+faststart', output]
+
+
+def cached_variant(song, semitones):
+    """Cache file name for the variant if it has been rendered, else None."""
+    content_hash = _read_state(_state_path(song, '.sha256'))
+    if not content_hash:
+        return None
+    name = variant_name(content_hash, semitones)
+    path = os.path.join(settings.KEY_SHIFT_CACHE_DIR, name)
+    try:
+        # Mark as recently used for eviction (mtime stays for Last-Modified)
+        os.utime(path, (time.time(), os.stat(path).st_mtime))
+    except FileNotFoundError:
+        return None
+    return name
+
+
+def is_rendering(song, semitones):
+    age = _age(_state_path(song, f'_{semitones:+d}.lock'))
+    return age is not None and age < settings.KEY_SHIFT_RENDER_TIMEOUT
+
+
+def render_failure(song, semitones):
+    """(error, seconds until it is retried) for a recent failed render, else None."""
+    path = _state_path(song, f'_{semitones:+d}.failed')
+    age = _age(path)
+    if age is None or age >= settings.KEY_SHIFT_FAILURE_SECONDS:
+        return None
+    return _read_state(path) or 'Rendering failed', int(settings.KEY_SHIFT_FAILURE_SECONDS - age) + 1
+
+
+def _take_lock(lock):
+    """Create ``lock``, or take it over if a crashed render left it behind."""
+    os.makedirs(os.path.dirname(lock), exist_ok=True)
+    try:
+        os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        return True
+    except FileExistsError:
+        pass
+    age = _age(lock)
+    if age is None or age < settings.KEY_SHIFT_RENDER_TIMEOUT:
+        return False
+    # Renamed over the stale lock, so it never disappears meanwhile.  Two
+    # callers that saw the same stale lock can both get here; renders are
+    # renamed into place, so that costs one extra render at worst.
+    _write_state(lock, '')
+    return True
+
+
+def schedule_key_shift(song, semitones):
+    """Queue the render unless one is already running for this variant."""
+    if not _take_lock(_state_path(song, f'_{semitones:+d}.lock')):
+        return None
+    return tasks.submit(render_key_shift, song.pk, semitones,
+                        key=('keyshift', song.pk, semitones), pool='keyshift')
+
+
+def render_key_shift(song_id, semitones):
+    """Render one variant into the cache; returns its file name."""
+    import subprocess
+    import tempfile
+
+    from .models import Song
+
+    song = Song.objects.filter(pk=song_id).first()
+    if song is None or not song.audio_file:
+        return None
+    cache_dir = settings.KEY_SHIFT_CACHE_DIR
+    failed = _state_path(song, f'_{semitones:+d}.failed')
+    work_dir = tempfile.mkdtemp(prefix='keyshift-')
+    try:
+        source = _local_path(song.audio_file, work_dir)
+        content_hash = _file_hash(source)
+        _write_state(_state_path(song, '.sha256'), content_hash)
+        name = variant_name(content_hash, semitones)
+        path = os.path.join(cache_dir, name)
+        if not os.path.exists(path):
+            # Rendered next to the final file and renamed, so it appears whole
+            partial = os.path.join(cache_dir, f'.{uuid.uuid4().hex}.{name}')
+            try:
+                result = subprocess.run(key_shift_command(source, partial, semitones), capture_output=True,
+                                        text=True, timeout=settings.KEY_SHIFT_RENDER_TIMEOUT)
+            except (OSError, subprocess.TimeoutExpired) as e:
+                raise RuntimeError(f"ffmpeg failed: {e}")
+            if result.returncode != 0:
+                if os.path.exists(partial):
+                    os.remove(partial)
+                raise RuntimeError(f"ffmpeg failed: {result.stderr.strip()[-500:]}")
+            os.replace(partial, path)
+            evict_key_shift_cache()
+    except Exception as e:
+        _write_state(failed, str(e)[:500])
+        raise
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        try:
+            os.remove(_state_path(song, f'_{semitones:+d}.lock'))
+        except FileNotFoundError:
+            pass
+    try:
+        os.remove(failed)
+    except FileNotFoundError:
+        pass
+    return name
+
+
+def evict_key_shift_cache(max_bytes=None):
+    """Delete least recently served variants until the cache fits; returns its size."""
+    max_bytes = settings.KEY_SHIFT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    now = time.time()
+    entries = []
+    total = 0
+    try:
+        with os.scandir(settings.KEY_SHIFT_CACHE_DIR) as it:
+            for entry in it:
+                if not entry.is_file():
+                    continue
+                st = entry.stat()
+                if entry.name.startswith('.'):
+                    if st.st_mtime < now - STALE_RENDER_SECONDS:
+                        os.remove(entry.path)
+                    continue
+                entries.append((st.st_atime, entry.path, st.st_size))
+                total += st.st_size
+    except FileNotFoundError:
+        return 0
+
+    entries.sort()
+    for _, path, size in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        logger.info("Evicted key-shifted track %s", os.path.basename(path))
+    return total
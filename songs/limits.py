@@ -0,0 +1,142 @@
+"""
+Rate limits and storage quotas for uploads and processing.
+
+Upload and processing endpoints are throttled per user with token buckets:
+the rate from DEFAULT_THROTTLE_RATES refills the bucket and THROTTLE_BURSTS
+sets its size, so a client can send a short burst but not more than the rate
+on average. Buckets live in the shared cache (Redis when REDIS_URL is set).
+If the cache is unreachable they fall back to process-local memory, which is
+looser but keeps uploads working. Concurrent requests from one user can race
+on the read-modify-write and let a request or two extra through.
+
+Recording storage is counted per user in `UserProfile.storage_used`, updated
+incrementally when recordings are created and deleted (songs/signals.py),
+and capped by STORAGE_QUOTAS per subscription type.
+
+Both checks run on headers only (DRF throttles run before the view, and the
+quota uses Content-Length), so over-limit uploads are refused before their
+body is read.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.throttling import SimpleRateThrottle
+
+from .models import UserProfile
+
+logger = logging.getLogger(__name__)
+
+LOCAL_BUCKETS_MAX = 10000
+
+_local_buckets = OrderedDict()
+_local_lock = threading.Lock()
+
+
+def _refill(state, now, per_second, burst, cost):
+    """(tokens left, seconds to wait) after trying to take ``cost`` tokens."""
+    if state is None:
+        tokens = burst
+    else:
+        tokens, stamp = state
+        tokens = min(burst, tokens + (now - stamp) * per_second)
+    if tokens >= cost:
+        return tokens - cost, 0
+    return tokens, (cost - tokens) / per_second
+
+
+def take_tokens(cache, key, per_second, burst, cost=1):
+    """
+    Take ``cost`` tokens from the bucket at ``key``. Returns 0 if they were
+    available, otherwise the seconds until they will be.
+    """
+    now = time.time()
+    timeout = int(burst / per_second) + 1  # a full bucket needs no state
+    try:
+        tokens, wait = _refill(cache.get(key), now, per_second, burst, cost)
+        cache.set(key, (tokens, now), timeout)
+        return wait
+    except Exception as e:
+        logger.warning("Rate limit cache unavailable, using local buckets: %s", e)
+
+    with _local_lock:
+        tokens, wait = _refill(_local_buckets.pop(key, None), now, per_second, burst, cost)
+        _local_buckets[key] = (tokens, now)
+        while len(_local_buckets) > LOCAL_BUCKETS_MAX:
+            _local_buckets.popitem(last=False)
+    return wait
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """Token bucket per user (or client IP when anonymous)."""
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        burst = getattr(settings, 'THROTTLE_BURSTS', {}).get(self.scope, self.num_requests)
+        self.wait_seconds = take_tokens(self.cache, self.key, self.num_requests / self.duration, burst)
+        return self.wait_seconds == 0
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class UploadThrottle(TokenBucketThrottle):
+    """Song and recording uploads (multipart and direct)"""
+    scope = 'uploads'
+
+
+class ProcessingThrottle(TokenBucketThrottle):
+    """Server-side audio processing runs (ffmpeg)"""
+    scope = 'processing'
+
+
+class EventThrottle(TokenBucketThrottle):
+    """Analytics event batches"""
+    scope = 'events'
+
+
+class StorageQuotaExceeded(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Recording storage quota exceeded. Delete some recordings to upload more.'
+    default_code = 'storage_quota_exceeded'
+
+
+def storage_quota(profile):
+    """Bytes of recordings the profile's subscription may store."""
+    quotas = settings.STORAGE_QUOTAS
+    return quotas.get(profile.subscription_type, quotas['free'])
+
+
+def request_size(request):
+    """Declared body size (Content-Length) without reading the body."""
+    try:
+        return max(int(request.META.get('CONTENT_LENGTH') or 0), 0)
+    except ValueError:
+        return 0
+
+
+def check_storage_quota(user, incoming=0):
+    """
+    Raise StorageQuotaExceeded unless ``incoming`` more bytes fit in the
+    user's quota (with ``incoming=0``: unless there is any room left).
+    """
+    profile = UserProfile.objects.filter(user=user).only('subscription_type', 'storage_used').first()
+    if profile is None:
+        return
+    if profile.storage_used + max(incoming, 1) > storage_quota(profile):
+        raise StorageQuotaExceeded()
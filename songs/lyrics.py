@@ -0,0 +1,167 @@
+"""
+Lyrics search index.
+
+Each song's lyrics file (word-level WebVTT cues, or LRC lines) is tokenized
+into folded words: lowercase with diacritics removed, so "ýaryň", "YARYN"
+and "yaryn" are the same word. Turkmen letters (ä ç ň ö ş ü ý ž) lose their
+marks, and Azerbaijani ə and ı fold to e and i. Each word gets its position
+in the song and the start time of its cue.
+
+The inverted index (LyricsPosting) has one row per (word, song), holding the
+word's positions and times. A phrase query fetches the rows of its words in
+one indexed query and keeps the songs where they occur at consecutive
+positions, so no lyrics files are read at query time.
+
+Indexing is an ingest stage: it runs in the background when a song's lyrics
+file changes (songs/signals.py), like the thumbnail variants.
+`Song.lyrics_indexed` records which file the index was built from.
+`python manage.py index_lyrics` indexes any songs that are missing.
+"""
+import re
+import unicodedata
+from collections import defaultdict
+
+from django.db import transaction
+
+from . import tasks
+from .models import LyricsPosting, Song
+
+MAX_TERM_LENGTH = 64
+MAX_QUERY_TERMS = 12
+
+# Letters NFKD doesn't decompose into a base letter and a mark
+_FOLD = str.maketrans({'ə': 'e', 'ı': 'i', 'ß': 'ss', 'ø': 'o', 'đ': 'd', 'ł': 'l'})
+_WORD = re.compile(r'\w+')
+_TIMESTAMP = r'(?:(\d+):)?(\d{1,2}):(\d{2})(?:[.,](\d{1,3}))?'
+_VTT_TIMING = re.compile(rf'^\s*{_TIMESTAMP}\s*-->')
+_LRC_TIME = re.compile(rf'[\[<]{_TIMESTAMP}[\]>]')
+# VTT voice/class tags and [LINE-START]-style markers
+_MARKUP = re.compile(r'<[^>]*>|\[[^\]]*\]')
+
+
+def fold(text):
+    """Lowercase and strip diacritics ("Ýürek" -> "yurek")."""
+    text = unicodedata.normalize('NFKD', text.casefold().translate(_FOLD))
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+def tokenize(text):
+    """Folded words of ``text``."""
+    return [word[:MAX_TERM_LENGTH] for word in _WORD.findall(fold(text))]
+
+
+def _ms(hours, minutes, seconds, fraction):
+    fraction = (fraction or '0').ljust(3, '0')
+    return ((int(hours or 0) * 60 + int(minutes)) * 60 + int(seconds)) * 1000 + int(fraction)
+
+
+def parse_vtt(text):
+    """``[(word, start_ms), ...]`` from WebVTT cues."""
+    words = []
+    start = None
+    for line in text.splitlines():
+        timing = _VTT_TIMING.match(line)
+        if timing:
+            start = _ms(*timing.groups())
+        elif not line.strip():
+            start = None
+        elif start is not None:
+            words.extend((word, start) for word in tokenize(_MARKUP.sub(' ', line)))
+    return words
+
+
+def parse_lrc(text):
+    """
+    ``[(word, start_ms), ...]`` from LRC lines, including enhanced LRC
+    ``<mm:ss.xx>`` word times. Lines without a time count from 0.
+    """
+    words = []
+    for line in text.splitlines():
+        start = 0
+        end = 0
+        for match in _LRC_TIME.finditer(line):
+            words.extend((word, start) for word in tokenize(line[end:match.start()]))
+            start, end = _ms(*match.groups()), match.end()
+        rest = line[end:]
+        if end == 0 and rest.lstrip().startswith('['):
+            continue  # [ar: ...] style metadata
+        words.extend((word, start) for word in tokenize(rest))
+    return words
+
+
+def parse_lyrics(name, text):
+    if name.lower().endswith('.vtt') or text.startswith('WEBVTT'):
+        return parse_vtt(text)
+    return parse_lrc(text)
+
+
+def index_song_lyrics(song):
+    """(Re)build the index rows for one song; returns the number of words indexed."""
+    name = song.lyrics_file.name if song.lyrics_file else ''
+    words = []
+    if name:
+        with song.lyrics_file.open('rb') as f:
+            words = parse_lyrics(name, f.read().decode('utf-8-sig', errors='replace'))
+
+    postings = defaultdict(lambda: LyricsPosting(song_id=song.pk))
+    for position, (word, start_ms) in enumerate(words):
+        posting = postings[word]
+        posting.term = word
+        posting.positions.append(position)
+        posting.times_ms.append(start_ms)
+
+    with transaction.atomic():
+        LyricsPosting.objects.filter(song_id=song.pk).delete()
+        LyricsPosting.objects.bulk_create(postings.values(), batch_size=1000)
+        Song.objects.filter(pk=song.pk, lyrics_file=name).update(lyrics_indexed=name)
+    song.lyrics_indexed = name
+    return len(words)
+
+
+def lyrics_index_is_current(song):
+    return (song.lyrics_file.name or '') == song.lyrics_indexed
+
+
+def _index_for_pk(song_id):
+    song = Song.objects.filter(pk=song_id).first()
+    if song is None or lyrics_index_is_current(song):
+        return 0
+    return index_song_lyrics(song)
+
+
+def schedule_lyrics_index(song):
+    """Queue indexing on the background worker if the lyrics changed (deduplicated)."""
+    if lyrics_index_is_current(song):
+        return None
+    return tasks.submit(_index_for_pk, song.pk, key=('lyrics-index', song.pk))
+
+
+def search_lyrics(query, limit=20):
+    """
+    Songs whose lyrics contain ``query`` as a phrase, as
+    ``[(song_id, start_ms of the first match, number of matches), ...]``,
+    most matches first.
+    """
+    terms = tokenize(query)[:MAX_QUERY_TERMS]
+    if not terms:
+        return []
+
+    by_song = defaultdict(dict)
+    for term, song_id, positions, times_ms in LyricsPosting.objects.filter(
+            term__in=set(terms)).values_list('term', 'song_id', 'positions', 'times_ms'):
+        by_song[song_id][term] = (positions, times_ms)
+
+    results = []
+    for song_id, postings in by_song.items():
+        if len(postings) < len(set(terms)):
+            continue
+        positions, times_ms = postings[terms[0]]
+        following = [set(postings[term][0]) for term in terms[1:]]
+        starts = [
+            (position, start_ms) for position, start_ms in zip(positions, times_ms)
+            if all(position + offset in later for offset, later in enumerate(following, 1))
+        ]
+        if starts:
+            results.append((song_id, min(starts)[1], len(starts)))
+    results.sort(key=lambda result: (-result[2], result[0]))
+    return results[:limit]
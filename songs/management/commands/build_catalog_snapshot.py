@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from songs.snapshot import build_catalog_snapshot
+
+
+class Command(BaseCommand):
+    help = "Write the static catalog snapshot (JSON + gzip/brotli) to media storage"
+
+    def handle(self, *args, **options):
+        pointer = build_catalog_snapshot()
+        self.stdout.write(self.style.SUCCESS(
+            f"Catalog snapshot {pointer['version']}: {pointer['song_count']} songs, "
+            f"{pointer['size']} bytes -> {pointer['url']}"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from songs.recommendations import build_song_similarity
+
+
+class Command(BaseCommand):
+    help = "Rebuild the similar-songs index from co-favorites and co-recordings"
+
+    def handle(self, *args, **options):
+        built = build_song_similarity()
+        self.stdout.write(self.style.SUCCESS(f"Stored neighbours for {built} songs"))
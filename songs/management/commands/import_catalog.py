@@ -0,0 +1,262 @@
+"""
+Bulk-import songs from a directory or a CSV/JSON manifest.
+
+Directory mode pairs files by name: `Artist_-_Title.mp3` (or `.m4a`, ...)
+with `Artist_-_Title.vtt`/`.lrc` and an optional `Artist_-_Title.png`/`.jpg`.
+
+Manifest mode reads rows with `title`, `artist`, `audio`, `lyrics` and
+optional `thumbnail`, `category` (slug or name) and `duration`; relative
+paths are resolved against the manifest's directory.
+
+Probing and transcoding run in a process pool; rows are inserted with
+bulk_create in batches. Finished entries are appended to a state file so an
+interrupted import picks up where it stopped. Entries whose artist and title
+are already in the catalog are skipped, so a crash between a batch insert
+and its state write doesn't import that batch twice.
+
+    python manage.py import_catalog /path/to/library --category traditional
+    python manage.py import_catalog catalog.csv --workers 8
+"""
+import csv
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.text import slugify
+
+from songs.ingest import (
+    AUDIO_EXTENSIONS, LYRICS_EXTENSIONS, REMUX_EXTENSIONS, THUMBNAIL_EXTENSIONS, TRANSCODE_EXTENSIONS,
+    media_basename, probe_duration, transcode_to_m4a,
+)
+from songs.lyrics import schedule_lyrics_index
+from songs.models import Category, Song
+from songs.snapshot import request_catalog_snapshot
+from songs.thumbnails import schedule_thumbnail_variants
+
+
+def prepare_audio(entry, work_dir):
+    """Worker process: probe and transcode one entry's audio."""
+    audio = entry['audio']
+    result = {'key': entry['key']}
+    try:
+        duration = entry.get('duration') or probe_duration(audio)
+        ext = os.path.splitext(audio)[1].lower()
+        if ext in TRANSCODE_EXTENSIONS or ext in REMUX_EXTENSIONS:
+            output = os.path.join(work_dir, f"{entry['key_hash']}.m4a")
+            audio = transcode_to_m4a(audio, output, copy_audio=ext in REMUX_EXTENSIONS)
+        result.update(audio=audio, duration=int(duration))
+    except Exception as e:
+        result['error'] = str(e)
+    return result
+
+
+def _entry_key(path):
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}:{stat.st_size}:{int(stat.st_mtime)}"
+
+
+def _split_stem(stem):
+    for separator in ('_-_', ' - '):
+        if separator in stem:
+            artist, title = stem.split(separator, 1)
+            return artist.replace('_', ' ').strip(), title.replace('_', ' ').strip()
+    return 'Unknown', stem.replace('_', ' ').strip()
+
+
+class Command(BaseCommand):
+    help = "Bulk-import songs (audio + VTT/LRC lyrics + thumbnail) from a directory or CSV/JSON manifest"
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help="Directory of media files, or a .csv/.json manifest")
+        parser.add_argument('--category', help="Category slug/name for entries without one")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Probe/transcode processes (default: CPU count)")
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--state', help="Resume state file (default: next to the source)")
+        parser.add_argument('--limit', type=int, help="Import at most this many new songs")
+
+    def handle(self, *args, **options):
+        source = options['source']
+        if os.path.isdir(source):
+            entries = self.scan_directory(source)
+            state_path = options['state'] or os.path.join(source, '.import_catalog.state')
+        elif os.path.isfile(source):
+            entries = self.read_manifest(source)
+            state_path = options['state'] or source + '.state'
+        else:
+            raise CommandError(f"{source} does not exist")
+
+        done = set()
+        if os.path.exists(state_path):
+            with open(state_path, encoding='utf-8') as f:
+                done = {line.strip() for line in f if line.strip()}
+
+        pending = [e for e in entries if e['key'] not in done]
+        if options['limit']:
+            pending = pending[:options['limit']]
+        self.stdout.write(
+            f"{len(entries)} entries, {len(entries) - len(pending)} already imported, {len(pending)} to go")
+        if not pending:
+            return
+
+        self.categories = {}
+        self.default_category = self.get_category(options['category']) if options['category'] else None
+
+        work_dir = tempfile.mkdtemp(prefix='import_catalog-')
+        imported = failed = skipped = 0
+        started = time.monotonic()
+        try:
+            with ProcessPoolExecutor(max_workers=max(options['workers'], 1)) as pool, \
+                    open(state_path, 'a', encoding='utf-8') as state:
+                batch_size = max(options['batch_size'], 1)
+                for offset in range(0, len(pending), batch_size):
+                    batch, keys = self.skip_existing(pending[offset:offset + batch_size])
+                    skipped += len(keys)
+                    results = pool.map(prepare_audio, batch, [work_dir] * len(batch))
+                    songs = []
+                    for entry, result in zip(batch, results):
+                        if 'error' in result:
+                            failed += 1
+                            self.stderr.write(f"Skipping {entry['audio']}: {result['error']}")
+                            continue
+                        songs.append(self.build_song(entry, result))
+                        keys.append(entry['key'])
+
+                    with transaction.atomic():
+                        created = Song.objects.bulk_create(songs)
+                    # bulk_create sends no post_save, so queue what the signals would
+                    for song in created:
+                        schedule_thumbnail_variants(song)
+                        schedule_lyrics_index(song)
+                    state.write(''.join(key + '\n' for key in keys))
+                    state.flush()
+
+                    imported += len(created)
+                    for name in os.listdir(work_dir):
+                        os.remove(os.path.join(work_dir, name))
+
+                    elapsed = max(time.monotonic() - started, 1e-6)
+                    self.stdout.write(
+                        f"{imported + failed + skipped}/{len(pending)} processed, "
+                        f"{imported / elapsed * 60:.1f} songs/min")
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        # bulk_create doesn't send post_save, so refresh the snapshot once here
+        if imported:
+            request_catalog_snapshot()
+
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {imported} songs ({failed} failed, {skipped} already in the catalog) in {elapsed:.1f}s "
+            f"- {imported / elapsed * 60:.1f} songs/min"))
+
+    def skip_existing(self, batch):
+        """
+        Split off entries whose (artist, title) is already a song, or
+        repeats an earlier entry. Returns (entries to import, keys skipped).
+        """
+        existing = set(Song.objects.filter(
+            artist__in={e['artist'] for e in batch}, title__in={e['title'] for e in batch},
+        ).values_list('artist', 'title'))
+        entries, skipped = [], []
+        for entry in batch:
+            natural_key = (entry['artist'], entry['title'])
+            if natural_key in existing:
+                skipped.append(entry['key'])
+            else:
+                existing.add(natural_key)
+                entries.append(entry)
+        return entries, skipped
+
+    def scan_directory(self, directory):
+        by_stem = {}
+        for name in sorted(os.listdir(directory)):
+            stem, ext = os.path.splitext(name)
+            by_stem.setdefault(stem, {})[ext.lower()] = os.path.join(directory, name)
+
+        entries = []
+        for stem, files in by_stem.items():
+            audio = next((files[e] for e in AUDIO_EXTENSIONS if e in files), None)
+            lyrics = next((files[e] for e in LYRICS_EXTENSIONS if e in files), None)
+            if not audio or not lyrics:
+                continue
+            artist, title = _split_stem(stem)
+            entries.append(self.make_entry({
+                'artist': artist,
+                'title': title,
+                'audio': audio,
+                'lyrics': lyrics,
+                'thumbnail': next((files[e] for e in THUMBNAIL_EXTENSIONS if e in files), None),
+            }))
+        return entries
+
+    def read_manifest(self, path):
+        base = os.path.dirname(os.path.abspath(path))
+        with open(path, encoding='utf-8') as f:
+            if path.lower().endswith('.json'):
+                rows = json.load(f)
+            elif path.lower().endswith('.csv'):
+                rows = list(csv.DictReader(f))
+            else:
+                raise CommandError("Manifest must be a .csv or .json file")
+
+        entries = []
+        for number, row in enumerate(rows, start=1):
+            missing = [k for k in ('title', 'artist', 'audio', 'lyrics') if not row.get(k)]
+            if missing:
+                raise CommandError(f"Manifest row {number} is missing {', '.join(missing)}")
+            row = dict(row)
+            for key in ('audio', 'lyrics', 'thumbnail'):
+                if row.get(key):
+                    row[key] = os.path.join(base, row[key])
+                    if not os.path.isfile(row[key]):
+                        raise CommandError(f"Manifest row {number}: {row[key]} not found")
+            if row.get('duration'):
+                row['duration'] = int(row['duration'])
+            entries.append(self.make_entry(row))
+        return entries
+
+    def make_entry(self, row):
+        entry = dict(row)
+        entry['key'] = _entry_key(row['audio'])
+        entry['key_hash'] = hashlib.sha1(entry['key'].encode()).hexdigest()[:16]
+        return entry
+
+    def get_category(self, value):
+        if value not in self.categories:
+            category = Category.objects.filter(slug=slugify(value)).first() \
+                or Category.objects.filter(name=value).first()
+            if category is None:
+                category = Category.objects.create(name=value, slug=slugify(value))
+            self.categories[value] = category
+        return self.categories[value]
+
+    def build_song(self, entry, result):
+        basename = media_basename(entry['artist'], entry['title'])
+        song = Song(
+            title=entry['title'],
+            artist=entry['artist'],
+            category=self.get_category(entry['category']) if entry.get('category') else self.default_category,
+            duration=result['duration'],
+        )
+        with open(result['audio'], 'rb') as f:
+            song.audio_file.save(f"{basename}.m4a", File(f), save=False)
+        lyrics_ext = os.path.splitext(entry['lyrics'])[1].lower()
+        with open(entry['lyrics'], 'rb') as f:
+            song.lyrics_file.save(f"{basename}{lyrics_ext}", File(f), save=False)
+        if entry.get('thumbnail'):
+            thumbnail_ext = os.path.splitext(entry['thumbnail'])[1].lower()
+            with open(entry['thumbnail'], 'rb') as f:
+                song.thumbnail.save(f"{basename}{thumbnail_ext}", File(f), save=False)
+        # bulk_create skips Song.save(), so record the sizes here
+        song.audio_size = song.audio_file.size
+        song.lyrics_size = song.lyrics_file.size
+        return song
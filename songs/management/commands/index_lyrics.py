@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from songs.lyrics import index_song_lyrics, lyrics_index_is_current
+from songs.models import Song
+
+
+class Command(BaseCommand):
+    help = "Build the lyrics search index for songs whose lyrics aren't indexed yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Re-index every song")
+
+    def handle(self, *args, **options):
+        indexed = failed = 0
+        for song in Song.objects.order_by('id').iterator():
+            if not options['all'] and lyrics_index_is_current(song):
+                continue
+            try:
+                index_song_lyrics(song)
+                indexed += 1
+            except (OSError, ValueError) as e:
+                failed += 1
+                self.stderr.write(f"{song.pk} {song}: {e}")
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} songs, {failed} failed"))
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+
+from songs.models import Recording
+from songs.postprocess import claim_pending_recordings, process_recording, watch_pending_recordings
+
+
+class Command(BaseCommand):
+    help = ("Run post-processing for recordings left pending, abandoned mid-processing "
+            "(claimed over PROCESSING_STALE_SECONDS ago) or failed")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--failed', action='store_true', help="Also retry failed recordings")
+        parser.add_argument('--limit', type=int)
+        parser.add_argument('--watch', action='store_true',
+                            help="Keep picking up pending recordings (the ingest role's worker)")
+        parser.add_argument('--interval', type=float, default=2.0, help="Polling interval for --watch (s)")
+
+    def handle(self, *args, **options):
+        if options['watch']:
+            self.stdout.write("Watching for pending recordings")
+            try:
+                watch_pending_recordings(interval=options['interval'])
+            except KeyboardInterrupt:
+                pass
+            return
+
+        if options['failed']:
+            Recording.objects.filter(processing_status=Recording.STATUS_FAILED).update(
+                processing_status=Recording.STATUS_PENDING, processing_attempts=0)
+
+        counts = {}
+        processed = 0
+        # One claim at a time, so a long backlog never holds stale claims
+        while options['limit'] is None or processed < options['limit']:
+            claimed = claim_pending_recordings(batch=1)
+            if not claimed:
+                break
+            recording_id = claimed[0]
+            process_recording(recording_id)
+            processed += 1
+            outcome = Recording.objects.filter(pk=recording_id).values_list('processing_status', flat=True).first()
+            counts[outcome] = counts.get(outcome, 0) + 1
+        self.stdout.write(self.style.SUCCESS(
+            ", ".join(f"{n} {outcome}" for outcome, n in counts.items()) or "Nothing to process"))
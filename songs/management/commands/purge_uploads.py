@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from songs.uploads import purge_abandoned_uploads
+
+
+class Command(BaseCommand):
+    help = "Delete direct recording uploads that were never finalized (run periodically, e.g. hourly)"
+
+    def handle(self, *args, **options):
+        removed = purge_abandoned_uploads()
+        self.stdout.write(self.style.SUCCESS(f"Removed {removed} abandoned uploads"))
@@ -0,0 +1,26 @@
+from django.db.models import Sum
+from django.core.management.base import BaseCommand
+
+from songs.models import Recording, UserProfile, stored_file_size
+
+
+class Command(BaseCommand):
+    help = "Recompute recording sizes and every user's storage_used (e.g. after restoring files)"
+
+    def handle(self, *args, **options):
+        measured = 0
+        for recording in Recording.objects.filter(audio_size__isnull=True).only('id', 'audio_file').iterator():
+            size = stored_file_size(recording.audio_file)
+            if size is not None:
+                Recording.objects.filter(pk=recording.pk).update(audio_size=size)
+                measured += 1
+
+        totals = dict(Recording.objects.values_list('user_id').annotate(total=Sum('audio_size')))
+        updated = 0
+        for profile in UserProfile.objects.only('id', 'user_id', 'storage_used').iterator():
+            total = totals.get(profile.user_id) or 0
+            if profile.storage_used != total:
+                UserProfile.objects.filter(pk=profile.pk).update(storage_used=total)
+                updated += 1
+        self.stdout.write(self.style.SUCCESS(
+            f"Measured {measured} recordings, corrected storage_used for {updated} users"))
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from songs.ranking import refresh_song_ranks
+
+
+class Command(BaseCommand):
+    help = "Recompute the trending and popular song rankings"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--watch', action='store_true', help="Keep running, refreshing every --interval seconds")
+        parser.add_argument('--interval', type=float, default=900.0)
+
+    def handle(self, *args, **options):
+        while True:
+            ranked = refresh_song_ranks()
+            self.stdout.write(self.style.SUCCESS(f"Ranked {ranked} songs"))
+            if not options['watch']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,51 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Run one process role (api, media, ingest or all) under gunicorn; see config/roles.py"
+
+    def add_arguments(self, parser):
+        parser.add_argument('role', choices=['all', 'api', 'media', 'ingest'])
+        parser.add_argument('--port', type=int, help="Default: 8000 (all, api), 8001 (media), 8002 (ingest)")
+        parser.add_argument('--workers', type=int, help="gunicorn workers (default from gunicorn.conf.py)")
+        parser.add_argument('--asgi', action='store_true', help="Run config.asgi under uvicorn workers (uvicorn-worker package)")
+
+    def handle(self, *args, **options):
+        role = options['role']
+        env = dict(os.environ, MICLAB_ROLE=role)
+        if options['port']:
+            env['PORT'] = str(options['port'])
+        if options['workers']:
+            env['WEB_CONCURRENCY'] = str(options['workers'])
+
+        server = [sys.executable, '-m', 'gunicorn']
+        if options['asgi']:
+            server += ['config.asgi:application', '-k', 'uvicorn_worker.UvicornWorker']
+        else:
+            server += ['config.wsgi:application']
+        commands = [server]
+        if role == 'ingest':
+            # Recording post-processing runs next to the ingest web workers
+            commands.append([sys.executable, 'manage.py', 'process_recordings', '--watch'])
+
+        # Stop the children too when we are stopped (e.g. by a supervisor)
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        procs = [subprocess.Popen(cmd, cwd=settings.BASE_DIR, env=env) for cmd in commands]
+        try:
+            while all(proc.poll() is None for proc in procs):
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for proc in procs:
+                if proc.poll() is None:
+                    proc.send_signal(signal.SIGTERM)
+            for proc in procs:
+                proc.wait()
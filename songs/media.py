@@ -0,0 +1,182 @@
+"""
+Range-capable media serving.
+
+``serve_media`` is an async replacement for ``django.views.static.serve``:
+file chunks are read off the event loop, so a slow client downloading a song
+only costs a coroutine instead of a worker thread.
+
+``serve_media_file`` is the WSGI counterpart used by the media role: the
+file, or the requested byte range of it, goes out through the server's
+``wsgi.file_wrapper``, which gunicorn sends with sendfile().
+"""
+import mimetypes
+import os
+import posixpath
+import re
+from stat import S_ISREG
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+CHUNK_SIZE = 64 * 1024
+_RANGE = re.compile(r'^bytes=\s*(\d*)-(\d*)\s*$', re.ASCII)
+
+
+def parse_range_header(header, size):
+    """
+    Parse a single ``bytes=`` range.  Returns (start, end_exclusive), None if
+    the header is absent, malformed or unsupported (the full file is sent,
+    as RFC 9110 asks), or raises ValueError if the range is unsatisfiable.
+    """
+    match = _RANGE.match(header or '')
+    if match is None:
+        return None
+    first, last = match.groups()
+    if first == '':
+        if last == '':
+            return None
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError('Unsatisfiable range')
+        return max(size - length, 0), size
+    start = int(first)
+    end = int(last) + 1 if last else size
+    if last and end <= start:
+        return None
+    if start >= size:
+        raise ValueError('Unsatisfiable range')
+    return start, min(end, size)
+
+
+async def _aiter_file(path, start, end):
+    f = await sync_to_async(open, thread_sensitive=False)(path, 'rb')
+    try:
+        await sync_to_async(f.seek, thread_sensitive=False)(start)
+        remaining = end - start
+        while remaining > 0:
+            chunk = await sync_to_async(f.read, thread_sensitive=False)(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+class FileRange:
+    """
+    ``length`` bytes of an open file from its current position.  Exposes
+    fileno() so servers can sendfile() it; gunicorn starts at the file
+    descriptor's offset and stops at Content-Length.
+    """
+
+    def __init__(self, f, length):
+        self.f = f
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.f.fileno()
+
+    def close(self):
+        self.f.close()
+
+
+def _media_path(path, document_root=None):
+    document_root = document_root or settings.MEDIA_ROOT
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        return safe_join(document_root, path)
+    except SuspiciousFileOperation:
+        raise Http404('Invalid path')
+
+
+def _stat_file(fullpath):
+    try:
+        st = os.stat(fullpath)
+    except OSError:
+        raise Http404('File not found')
+    if not S_ISREG(st.st_mode):
+        raise Http404('File not found')
+    return st
+
+
+def _media_headers(response, st, encoding):
+    response['Accept-Ranges'] = 'bytes'
+    response['Last-Modified'] = http_date(st.st_mtime)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return response
+
+
+def serve_media_file(request, path, document_root=None):
+    """Serve a file under MEDIA_ROOT with HTTP Range support (WSGI, sendfile)."""
+    fullpath = _media_path(path, document_root)
+    st = _stat_file(fullpath)
+    if not was_modified_since(request.headers.get('If-Modified-Since'), st.st_mtime):
+        return HttpResponseNotModified()
+
+    content_type, encoding = mimetypes.guess_type(fullpath)
+    content_type = content_type or 'application/octet-stream'
+    size = st.st_size
+
+    try:
+        byte_range = parse_range_header(request.headers.get('Range'), size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    f = open(fullpath, 'rb')
+    if byte_range is None:
+        response = FileResponse(f, content_type=content_type)
+    else:
+        start, end = byte_range
+        f.seek(start)
+        response = FileResponse(FileRange(f, end - start), content_type=content_type, status=206)
+        response['Content-Length'] = str(end - start)
+        response['Content-Range'] = f'bytes {start}-{end - 1}/{size}'
+    return _media_headers(response, st, encoding)
+
+
+async def serve_media(request, path, document_root=None):
+    """Serve a file under MEDIA_ROOT with HTTP Range support."""
+    fullpath = _media_path(path, document_root)
+    st = await sync_to_async(_stat_file, thread_sensitive=False)(fullpath)
+
+    if not was_modified_since(request.headers.get('If-Modified-Since'), st.st_mtime):
+        return HttpResponseNotModified()
+
+    content_type, encoding = mimetypes.guess_type(fullpath)
+    content_type = content_type or 'application/octet-stream'
+    size = st.st_size
+
+    try:
+        byte_range = parse_range_header(request.headers.get('Range'), size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if byte_range is None:
+        start, end = 0, size
+        response = StreamingHttpResponse(_aiter_file(fullpath, start, end), content_type=content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            _aiter_file(fullpath, start, end), content_type=content_type, status=206)
+        response['Content-Range'] = f'bytes {start}-{end - 1}/{size}'
+
+    response['Content-Length'] = str(end - start)
+    return _media_headers(response, st, encoding)
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 15:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('songs', '0006_trialsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='song',
+            name='thumbnail_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 16:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('songs', '0007_song_thumbnail_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='favorites_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
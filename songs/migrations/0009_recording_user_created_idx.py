@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-19 16:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('songs', '0008_userprofile_favorites_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recording',
+            index=models.Index(fields=['user', '-created_at'], name='recording_user_created_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.8 on 2026-10-19 16:05
+
+from django.db import migrations, models
+
+
+def backfill_file_sizes(apps, schema_editor):
+    Song = apps.get_model('songs', 'Song')
+
+    def size(field_file):
+        if not field_file:
+            return None
+        try:
+            return field_file.size
+        except (OSError, ValueError):
+            return None
+
+    for song in Song.objects.all().iterator():
+        Song.objects.filter(pk=song.pk).update(
+            audio_size=size(song.audio_file), lyrics_size=size(song.lyrics_file))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('songs', '0009_recording_user_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='song',
+            name='audio_size',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='song',
+            name='lyrics_size',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='song',
+            index=models.Index(fields=['-created_at'], name='song_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='favorite',
+            index=models.Index(fields=['-added_at'], name='favorite_added_idx'),
+        ),
+        migrations.RunPython(backfill_file_sizes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.8 on 2026-10-19 16:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('songs', '0010_song_file_sizes_and_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recording',
+            name='mix_file',
+            field=models.FileField(blank=True, upload_to='myrecordings/processed/'),
+        ),
+        migrations.AddField(
+            model_name='recording',
+            name='mix_with_song',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='recording',
+            name='processed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='recording',
+            name='processed_file',
+            field=models.FileField(blank=True, upload_to='myrecordings/processed/'),
+        ),
+        migrations.AddField(
+            model_name='recording',
+            name='processing_error',
+            field=models.CharField(blank=True, max_length=500),
+        ),
+        migrations.AddField(
+            model_name='recording',
+            name='processing_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='recording',
+            name='vocal_offset_ms',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.8 on 2026-10-19 16:31
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_storage_used(apps, schema_editor):
+    Recording = apps.get_model('songs', 'Recording')
+    UserProfile = apps.get_model('songs', 'UserProfile')
+
+    for recording in Recording.objects.only('id', 'audio_file').iterator():
+        if not recording.audio_file:
+            continue
+        try:
+            size = recording.audio_file.size
+        except (OSError, ValueError):
+            continue
+        Recording.objects.filter(pk=recording.pk).update(audio_size=size)
+
+    totals = dict(Recording.objects.values_list('user_id').annotate(total=Sum('audio_size')))
+    for profile in UserProfile.objects.only('id', 'user_id').iterator():
+        UserProfile.objects.filter(pk=profile.pk).update(storage_used=totals.get(profile.user_id) or 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('songs', '0011_recording_processing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recording',
+            name='audio_size',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='storage_used',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_storage_used, migrations.RunPython.noop),
+    ]
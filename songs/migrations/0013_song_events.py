@@ -0,0 +1,49 @@
+# Generated by Django 5.2.8 on 2026-10-19 16:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('songs', '0012_recording_storage_quota'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SongDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('plays', models.PositiveIntegerField(default=0)),
+                ('seeks', models.PositiveIntegerField(default=0)),
+                ('recordings_started', models.PositiveIntegerField(default=0)),
+                ('completions', models.PositiveIntegerField(default=0)),
+                ('song', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='songs.song')),
+            ],
+            options={
+                'verbose_name_plural': 'Song daily stats',
+                'indexes': [models.Index(fields=['day', 'song'], name='song_daily_stats_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('song', 'day'), name='song_daily_stats_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SongEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('device_id', models.CharField(blank=True, max_length=255)),
+                ('event_type', models.CharField(choices=[('play', 'Play'), ('seek', 'Seek'), ('record_start', 'Record start'), ('complete', 'Completion')], max_length=20)),
+                ('position_ms', models.IntegerField(default=0)),
+                ('occurred_at', models.DateTimeField()),
+                ('received_at', models.DateTimeField()),
+                ('song', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='songs.song')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['occurred_at'], name='song_event_occurred_idx')],
+            },
+        ),
+    ]
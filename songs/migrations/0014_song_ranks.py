@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-19 16:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('songs', '0013_song_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SongRank',
+            fields=[
+                ('song', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rank', serialize=False, to='songs.song')),
+                ('trending_score', models.FloatField(default=0)),
+                ('trending_rank', models.PositiveIntegerField()),
+                ('popular_score', models.FloatField(default=0)),
+                ('popular_rank', models.PositiveIntegerField()),
+                ('computed_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['trending_rank'], name='song_rank_trending_idx'), models.Index(fields=['popular_rank'], name='song_rank_popular_idx')],
+            },
+        ),
+    ]
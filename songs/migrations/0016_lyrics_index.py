@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-19 16:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('songs', '0015_song_similarity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='song',
+            name='lyrics_indexed',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.CreateModel(
+            name='LyricsPosting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('positions', models.JSONField(default=list)),
+                ('times_ms', models.JSONField(default=list)),
+                ('song', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='songs.song')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('term', 'song'), name='lyrics_posting_term_song_uniq')],
+            },
+        ),
+    ]
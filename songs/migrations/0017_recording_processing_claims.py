@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-19 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('songs', '0016_lyrics_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recording',
+            name='processing_attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='recording',
+            name='processing_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
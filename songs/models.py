@@ -2,6 +2,16 @@ from django.db import models
 from django.contrib.auth.models import User
 
 
+def stored_file_size(field_file):
+    """Size of a FileField's file in bytes, or None if missing"""
+    if not field_file:
+        return None
+    try:
+        return field_file.size
+    except (OSError, ValueError):
+        return None
+
+
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
     slug = models.SlugField(unique=True)
@@ -24,17 +34,40 @@ class Song(models.Model):
     lyrics_file = models.FileField(upload_to='songs/audio/')
     thumbnail = models.ImageField(
         upload_to='songs/thumbnails/', null=True, blank=True)
+    # Resized WebP/AVIF/JPEG derivatives, see songs/thumbnails.py
+    thumbnail_variants = models.JSONField(
+        default=dict, blank=True, editable=False)
     duration = models.IntegerField(help_text="Duration in seconds")
+    # lyrics_file name the search index was built from, see songs/lyrics.py
+    lyrics_indexed = models.CharField(max_length=255, blank=True, editable=False)
+    # File sizes in bytes, recorded at save time (None = file missing)
+    audio_size = models.BigIntegerField(null=True, blank=True, editable=False)
+    lyrics_size = models.BigIntegerField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at'], name='song_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.artist} - {self.title}"
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'audio_file' in update_fields:
+            self.audio_size = stored_file_size(self.audio_file)
+        if update_fields is None or 'lyrics_file' in update_fields:
+            self.lyrics_size = stored_file_size(self.lyrics_file)
+        if update_fields is not None:
+            extra = {'audio_size'} if 'audio_file' in update_fields else set()
+            extra |= {'lyrics_size'} if 'lyrics_file' in update_fields else set()
+            kwargs['update_fields'] = set(update_fields) | extra
+        super().save(*args, **kwargs)
+
 
 class Favorite(models.Model):
     user = models.ForeignKey(
@@ -45,6 +78,9 @@ class Favorite(models.Model):
     class Meta:
         unique_together = ('user', 'song')
         ordering = ['-added_at']
+        indexes = [
+            models.Index(fields=['-added_at'], name='favorite_added_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.song.title}"
@@ -69,6 +105,10 @@ class UserProfile(models.Model):
         max_length=255, null=True, blank=True)
     stripe_subscription_id = models.CharField(
         max_length=255, null=True, blank=True)
+    # Bumped whenever the user's favorites change, for client-side caching
+    favorites_version = models.PositiveIntegerField(default=0)
+    # Bytes of recordings stored, kept current by songs/signals.py (see songs/limits.py)
+    storage_used = models.BigIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -83,14 +123,54 @@ class Recording(models.Model):
         # <- ADD null=True, blank=True
         Song, on_delete=models.CASCADE, related_name='recordings', null=True, blank=True)
     audio_file = models.FileField(upload_to='myrecordings/')
+    # Cached size of audio_file in bytes, counted towards the user's storage
+    audio_size = models.BigIntegerField(null=True, blank=True, editable=False)
     recording_id = models.CharField(max_length=100, unique=True)
     duration = models.IntegerField(default=0)
+
+    # Server-side post-processing, see songs/postprocess.py
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_READY = 'ready'
+    STATUS_FAILED = 'failed'
+    PROCESSING_STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_PROCESSING, 'Processing'),
+        (STATUS_READY, 'Ready'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    processing_status = models.CharField(
+        max_length=20, choices=PROCESSING_STATUS_CHOICES, default=STATUS_PENDING)
+    processing_error = models.CharField(max_length=500, blank=True)
+    # Claims by the ingest worker, see watch_pending_recordings
+    processing_attempts = models.PositiveSmallIntegerField(default=0)
+    processing_started_at = models.DateTimeField(null=True, blank=True)
+    mix_with_song = models.BooleanField(default=False)
+    # Milliseconds from the start of the song to the start of the vocal take
+    vocal_offset_ms = models.IntegerField(default=0)
+    processed_file = models.FileField(upload_to='myrecordings/processed/', blank=True)
+    mix_file = models.FileField(upload_to='myrecordings/processed/', blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Per-user listing, newest first
+            models.Index(fields=['user', '-created_at'],
+                         name='recording_user_created_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} - {self.recording_id}"
 
+    def save(self, *args, **kwargs):
+        # Measured once; a recording's audio file is never replaced
+        if self.audio_size is None and kwargs.get('update_fields') is None:
+            self.audio_size = stored_file_size(self.audio_file)
+        super().save(*args, **kwargs)
+
 
 class TrialSession(models.Model):
     """Track anonymous trial users - 7 days access to song list"""
@@ -104,3 +184,113 @@ class TrialSession(models.Model):
     def is_trial_active(self):
         from django.utils import timezone
         return timezone.now() < self.trial_end_date
+
+
+class SongEvent(models.Model):
+    """Raw client listening/singing event, written in batches (songs/analytics.py)"""
+    TYPE_PLAY = 'play'
+    TYPE_SEEK = 'seek'
+    TYPE_RECORD_START = 'record_start'
+    TYPE_COMPLETE = 'complete'
+    TYPE_CHOICES = [
+        (TYPE_PLAY, 'Play'),
+        (TYPE_SEEK, 'Seek'),
+        (TYPE_RECORD_START, 'Record start'),
+        (TYPE_COMPLETE, 'Completion'),
+    ]
+
+    song = models.ForeignKey(Song, on_delete=models.CASCADE, related_name='+')
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    # Anonymous trial devices
+    device_id = models.CharField(max_length=255, blank=True)
+    event_type = models.CharField(max_length=20, choices=TYPE_CHOICES)
+    # Playback position in the song
+    position_ms = models.IntegerField(default=0)
+    occurred_at = models.DateTimeField()
+    received_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['occurred_at'], name='song_event_occurred_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} {self.song_id} at {self.occurred_at}"
+
+
+class SongDailyStats(models.Model):
+    """Per-song daily counters, incremented on every SongEvent flush"""
+    song = models.ForeignKey(Song, on_delete=models.CASCADE, related_name='daily_stats')
+    day = models.DateField()
+    plays = models.PositiveIntegerField(default=0)
+    seeks = models.PositiveIntegerField(default=0)
+    recordings_started = models.PositiveIntegerField(default=0)
+    completions = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "Song daily stats"
+        constraints = [
+            models.UniqueConstraint(fields=['song', 'day'], name='song_daily_stats_uniq'),
+        ]
+        indexes = [
+            # Popularity over the last N days
+            models.Index(fields=['day', 'song'], name='song_daily_stats_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.song_id} {self.day}: {self.plays} plays"
+
+
+class SongRank(models.Model):
+    """Precomputed catalog positions (songs/ranking.py); rank 1 is the top song"""
+    song = models.OneToOneField(Song, on_delete=models.CASCADE, primary_key=True, related_name='rank')
+    trending_score = models.FloatField(default=0)
+    trending_rank = models.PositiveIntegerField()
+    popular_score = models.FloatField(default=0)
+    popular_rank = models.PositiveIntegerField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['trending_rank'], name='song_rank_trending_idx'),
+            models.Index(fields=['popular_rank'], name='song_rank_popular_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.song_id}: trending #{self.trending_rank}, popular #{self.popular_rank}"
+
+
+class SongSimilarity(models.Model):
+    """Top-K similar songs by co-favorites and co-recordings (songs/recommendations.py)"""
+    song = models.OneToOneField(Song, on_delete=models.CASCADE, primary_key=True, related_name='similarity')
+    # Most similar first; scores[i] is the similarity of neighbor_ids[i]
+    neighbor_ids = models.JSONField(default=list)
+    scores = models.JSONField(default=list)
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name_plural = "Song similarities"
+
+    def __str__(self):
+        return f"{self.song_id}: {len(self.neighbor_ids)} neighbors"
+
+
+class LyricsPosting(models.Model):
+    """
+    Inverted lyrics index entry: where a folded word occurs in a song's
+    lyrics (songs/lyrics.py). positions[i] is the word's position in the
+    song and times_ms[i] the start of its cue.
+    """
+    term = models.CharField(max_length=64)
+    song = models.ForeignKey(Song, on_delete=models.CASCADE, related_name='+')
+    positions = models.JSONField(default=list)
+    times_ms = models.JSONField(default=list)
+
+    class Meta:
+        constraints = [
+            # Also the term lookup index
+            models.UniqueConstraint(fields=['term', 'song'], name='lyrics_posting_term_song_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.term} in {self.song_id}"
@@ -0,0 +1,280 @@
+"""
+Server-side post-processing of uploaded recordings.
+
+One ffmpeg run per recording, with a single filter graph that
+
+* trims trailing silence and normalizes loudness (EBU R128, `loudnorm`),
+* trims leading silence for the stand-alone vocal, and
+* optionally mixes the vocal over the song's backing track.  The mix keeps
+  the leading silence so the vocal stays aligned with the song, shifted by
+  the client-reported `vocal_offset_ms` (when `mix_with_song` is set).
+
+Jobs run on the bounded ``recordings`` worker pool (see songs/tasks.py), so
+uploads return immediately; progress is tracked in
+`Recording.processing_status`.  Outputs are named after a hash of their
+inputs, so re-processing an unchanged recording is a no-op.  A run only
+marks the recording ready if its mix settings are still the ones it
+rendered; if they changed meanwhile it starts over with the new ones.
+"""
+import hashlib
+import logging
+import os
+import shutil
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import tasks
+
+logger = logging.getLogger(__name__)
+
+# Bump when the filter graph changes so cached outputs are rebuilt
+PIPELINE_VERSION = 1
+PROCESSED_DIR = 'myrecordings/processed'
+
+SILENCE_THRESHOLD = '-50dB'
+SILENCE_MIN_SECONDS = 0.3
+LOUDNESS_TARGET = 'I=-16:TP=-1.5:LRA=11'
+BACKING_TRACK_GAIN = 0.7
+SAMPLE_RATE = 48000
+# Clients report the vocal's latency against the backing track
+MAX_VOCAL_OFFSET_MS = 10_000
+# A claimed recording still `processing` after this long is assumed lost
+# (worker killed) and claimed again, up to MAX_PROCESSING_ATTEMPTS times
+PROCESSING_STALE_SECONDS = 15 * 60
+MAX_PROCESSING_ATTEMPTS = 3
+
+
+def filter_graph(mix=False, offset_ms=0):
+    """ffmpeg -filter_complex for input 0 = vocal (and input 1 = song)."""
+    trim_start = (f'silenceremove=start_periods=1:start_threshold={SILENCE_THRESHOLD}'
+                  f':start_silence={SILENCE_MIN_SECONDS}')
+    chains = [
+        f'[0:a]aresample={SAMPLE_RATE},areverse,{trim_start},areverse,'
+        f'loudnorm={LOUDNESS_TARGET},aresample={SAMPLE_RATE}'
+        + (',asplit=2[clean][aligned]' if mix else '[clean]'),
+        f'[clean]{trim_start}[vocal]',
+    ]
+    if mix:
+        if offset_ms >= 0:
+            align = f'adelay={offset_ms}:all=1'
+        else:
+            align = f'atrim=start={-offset_ms / 1000:.3f},asetpts=PTS-STARTPTS'
+        chains += [
+            f'[aligned]{align}[delayed]',
+            f'[1:a]aresample={SAMPLE_RATE},volume={BACKING_TRACK_GAIN}[backing]',
+            '[backing][delayed]amix=inputs=2:duration=shortest:normalize=0,alimiter=limit=0.95[mix]',
+        ]
+    return ';'.join(chains)
+
+
+def ffmpeg_command(vocal_path, vocal_out, song_path=None, mix_out=None, offset_ms=0):
+    mix = song_path is not None
+    cmd = ['ffmpeg', '-v', 'error', '-y', '-i', vocal_path]
+    if mix:
+        cmd += ['-i', song_path]
+    cmd += ['-filter_complex', filter_graph(mix, offset_ms),
+            '-map', '[vocal]', '-c:a', 'aac', '-b:a', '128k', vocal_out]
+    if mix:
+        cmd += ['-map', '[mix]', '-c:a', 'aac', '-b:a', '192k', mix_out]
+    return cmd
+
+
+def parse_vocal_offset(value):
+    """Client-supplied offset_ms as an int within +-MAX_VOCAL_OFFSET_MS; ValueError otherwise."""
+    try:
+        offset = int(value or 0)
+    except (TypeError, ValueError):
+        raise ValueError("offset_ms must be an integer")
+    if abs(offset) > MAX_VOCAL_OFFSET_MS:
+        raise ValueError(f"offset_ms must be between -{MAX_VOCAL_OFFSET_MS} and {MAX_VOCAL_OFFSET_MS}")
+    return offset
+
+
+def processing_key(recording, mix):
+    """Hash of everything the outputs depend on."""
+    parts = [PIPELINE_VERSION, recording.audio_file.name, recording.audio_file.size]
+    if mix:
+        parts += [recording.song.audio_file.name, recording.vocal_offset_ms]
+    return hashlib.sha1(':'.join(map(str, parts)).encode()).hexdigest()[:16]
+
+
+def _local_path(field_file, work_dir):
+    """Filesystem path for a stored file, copying it out of remote storage if needed."""
+    try:
+        return field_file.path
+    except NotImplementedError:
+        path = os.path.join(work_dir, os.path.basename(field_file.name))
+        with field_file.open('rb') as src, open(path, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        return path
+
+
+def process_recording(recording_id):
+    """Run the pipeline for one recording and record the outcome on it."""
+    from .models import Recording
+
+    import subprocess
+    import tempfile
+
+    recording = Recording.objects.select_related('song').filter(pk=recording_id).first()
+    if recording is None:
+        return None
+    mix = recording.mix_with_song and recording.song is not None and bool(recording.song.audio_file)
+    updates = Recording.objects.filter(pk=recording.pk)
+    # Only the settings this run rendered may mark the recording ready
+    unchanged = updates.filter(mix_with_song=recording.mix_with_song,
+                               vocal_offset_ms=recording.vocal_offset_ms)
+
+    def finish(saved=(), **fields):
+        if unchanged.update(**fields):
+            return True
+        # Settings changed while this run was going (or the recording is
+        # gone); the request that changed them was collapsed into this job.
+        # Outputs this run saved for the old settings are orphans now.
+        in_use = updates.values_list('processed_file', 'mix_file').first() or ()
+        for name in saved:
+            if name and name not in in_use and storage.exists(name):
+                storage.delete(name)
+        process_recording(recording_id)
+        return False
+
+    def fail(e):
+        logger.warning("Processing recording %s failed: %s", recording.recording_id, e)
+        finish(processing_status=Recording.STATUS_FAILED, processing_error=str(e)[:500])
+        return recording
+
+    try:
+        key = processing_key(recording, mix)
+        storage = recording.audio_file.storage
+        vocal_name = f'{PROCESSED_DIR}/{recording.recording_id}_{key}.m4a'
+        mix_name = f'{PROCESSED_DIR}/{recording.recording_id}_{key}_mix.m4a' if mix else ''
+        done = storage.exists(vocal_name) and (not mix or storage.exists(mix_name))
+    except Exception as e:
+        # Missing source, storage backend errors, ...
+        return fail(e)
+    if done:
+        finish(processing_status=Recording.STATUS_READY, processing_error='',
+               processed_file=vocal_name, mix_file=mix_name, processed_at=timezone.now())
+        return recording
+
+    updates.update(processing_status=Recording.STATUS_PROCESSING, processing_error='',
+                   processing_started_at=timezone.now())
+    work_dir = tempfile.mkdtemp(prefix='recording-')
+    try:
+        vocal_out = os.path.join(work_dir, 'vocal.m4a')
+        mix_out = os.path.join(work_dir, 'mix.m4a')
+        cmd = ffmpeg_command(
+            _local_path(recording.audio_file, work_dir), vocal_out,
+            _local_path(recording.song.audio_file, work_dir) if mix else None, mix_out,
+            recording.vocal_offset_ms)
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=600)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            raise RuntimeError(f"ffmpeg failed: {e}")
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed: {result.stderr.strip()[-500:]}")
+
+        with open(vocal_out, 'rb') as f:
+            vocal_name = storage.save(vocal_name, File(f))
+        if mix:
+            with open(mix_out, 'rb') as f:
+                mix_name = storage.save(mix_name, File(f))
+    except Exception as e:
+        return fail(e)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if finish(saved=(vocal_name, mix_name),
+              processing_status=Recording.STATUS_READY, processing_error='',
+              processed_file=vocal_name, mix_file=mix_name, processed_at=timezone.now()):
+        # Drop outputs from an earlier run with different inputs
+        for old in (recording.processed_file.name, recording.mix_file.name):
+            if old and old not in (vocal_name, mix_name) and storage.exists(old):
+                storage.delete(old)
+    return recording
+
+
+def schedule_recording_processing(recording):
+    """
+    Queue the pipeline on the recordings pool (deduplicated per recording).
+    Without RECORDING_PROCESSING_INLINE the recording is only marked pending
+    for the ingest role's worker, and None is returned.
+    """
+    from .models import Recording
+
+    Recording.objects.filter(pk=recording.pk).update(processing_status=Recording.STATUS_PENDING,
+                                                     processing_attempts=0)
+    recording.processing_status = Recording.STATUS_PENDING
+    if not getattr(settings, 'RECORDING_PROCESSING_INLINE', True):
+        return None
+    return tasks.submit(process_recording, recording.pk,
+                        key=('recording', recording.pk), pool='recordings')
+
+
+def _process_claimed(recording_id):
+    from .models import Recording
+
+    try:
+        return process_recording(recording_id)
+    except Exception as e:
+        Recording.objects.filter(pk=recording_id).update(
+            processing_status=Recording.STATUS_FAILED, processing_error=str(e)[:500])
+        raise
+
+
+def claim_pending_recordings(batch=100, now=None):
+    """
+    Atomically claim up to ``batch`` recordings that are pending, or whose
+    claim went stale, and return their ids.  Each claim is a conditional
+    UPDATE on the status and attempt count, so of several ingest workers
+    polling the same rows exactly one wins each.  Recordings that already
+    used up MAX_PROCESSING_ATTEMPTS are marked failed instead.
+    """
+    from .models import Recording
+
+    now = now or timezone.now()
+    stale = now - timedelta(seconds=PROCESSING_STALE_SECONDS)
+    claimable = Recording.objects.filter(
+        Q(processing_status=Recording.STATUS_PENDING)
+        | Q(processing_status=Recording.STATUS_PROCESSING, processing_started_at__lt=stale)
+        | Q(processing_status=Recording.STATUS_PROCESSING, processing_started_at__isnull=True))
+    claimable.filter(processing_attempts__gte=MAX_PROCESSING_ATTEMPTS).update(
+        processing_status=Recording.STATUS_FAILED,
+        processing_error=f"Gave up after {MAX_PROCESSING_ATTEMPTS} attempts")
+
+    candidates = claimable.filter(processing_attempts__lt=MAX_PROCESSING_ATTEMPTS) \
+        .order_by('created_at').values_list('id', 'processing_status', 'processing_attempts')[:batch]
+    claimed = []
+    for recording_id, current, attempts in candidates:
+        if Recording.objects.filter(pk=recording_id, processing_status=current, processing_attempts=attempts) \
+                .update(processing_status=Recording.STATUS_PROCESSING, processing_started_at=now,
+                        processing_attempts=F('processing_attempts') + 1):
+            claimed.append(recording_id)
+    return claimed
+
+
+def watch_pending_recordings(interval=2.0, stop=None):
+    """
+    Ingest role worker loop: claim pending (or abandoned) recordings as the
+    recordings pool has room and hand them to it, until ``stop`` (a
+    threading.Event) is set.  Safe to run in several processes at once.
+    """
+    from django.db import close_old_connections
+
+    stop = stop or threading.Event()
+    # Claim no more than can start now, so queued claims never go stale
+    workers = getattr(settings, 'BACKGROUND_TASK_POOLS', {}).get('recordings', 1)
+    running = set()
+    while not stop.is_set():
+        running = {future for future in running if not future.done()}
+        if len(running) < workers:
+            for recording_id in claim_pending_recordings(workers - len(running)):
+                running.add(tasks.submit(_process_claimed, recording_id,
+                                         key=('recording', recording_id), pool='recordings'))
+        close_old_connections()
+        stop.wait(interval)
@@ -0,0 +1,122 @@
+"""
+Precomputed song rankings for ``GET /api/songs/?ordering=trending|popular``.
+
+A song's score is the time-decayed sum of its favorites, recordings and
+plays (SongDailyStats). Each event counts RANKING_WEIGHTS[kind] and loses
+half its weight every RANKING_HALF_LIVES[ordering] days, so "trending"
+follows the last few days and "popular" the last months.
+
+`refresh_song_ranks` recomputes the whole SongRank table in bulk. It runs
+one GROUP BY (song, day) query per kind over RANKING_WINDOW_DAYS, looks up
+the decay per day, and does one bulk upsert. The song list only reads the
+rank columns, through their indexes.
+
+The list queues a background refresh once the ranks are older than
+RANKING_REFRESH_SECONDS. Only a shared cache (REDIS_URL) limits that to one
+process; with the default per-process cache every worker queues its own, and
+the job skips the rebuild when SongRank was already refreshed within the
+interval (workers that check at the same moment can still both rebuild).
+Songs without a rank yet (added since the last refresh, or before the first
+one) follow the ranked ones, newest first.
+`python manage.py refresh_song_ranks [--watch]` refreshes on demand.
+"""
+from collections import defaultdict
+from datetime import datetime, time as dt_time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Max
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import tasks
+from .models import Favorite, Recording, Song, SongDailyStats, SongRank
+
+RANK_ORDERINGS = ('trending', 'popular')
+FRESH_CACHE_KEY = 'songs:ranks:fresh'
+REFRESH_TASK_KEY = ('song-ranks',)
+
+
+def _daily_counts(since):
+    """(kind, rows of (song_id, day, count)) for activity since ``since``."""
+    favorites = (Favorite.objects.filter(added_at__gte=since)
+                 .annotate(day=TruncDate('added_at'))
+                 .values_list('song_id', 'day').annotate(n=Count('id')).order_by())
+    recordings = (Recording.objects.filter(created_at__gte=since, song__isnull=False)
+                  .annotate(day=TruncDate('created_at'))
+                  .values_list('song_id', 'day').annotate(n=Count('id')).order_by())
+    # Already aggregated per song and day by the analytics flush
+    plays = (SongDailyStats.objects.filter(day__gte=since.date(), plays__gt=0)
+             .values_list('song_id', 'day', 'plays').order_by())
+    return [('favorites', favorites), ('recordings', recordings), ('plays', plays)]
+
+
+def compute_scores(now=None):
+    """``{ordering: {song_id: score}}`` for every song with recent activity."""
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    window = settings.RANKING_WINDOW_DAYS
+    since = datetime.combine(today - timedelta(days=window), dt_time.min,
+                             tzinfo=timezone.get_current_timezone())
+    # Weight left after ``age`` days, per ordering
+    decay = {
+        ordering: [0.5 ** (age / half_life) for age in range(window + 1)]
+        for ordering, half_life in settings.RANKING_HALF_LIVES.items()
+    }
+
+    scores = {ordering: defaultdict(float) for ordering in RANK_ORDERINGS}
+    for kind, rows in _daily_counts(since):
+        weight = settings.RANKING_WEIGHTS[kind]
+        for song_id, day, count in rows:
+            age = min(max((today - day).days, 0), window)
+            for ordering in RANK_ORDERINGS:
+                scores[ordering][song_id] += weight * count * decay[ordering][age]
+    return scores
+
+
+def refresh_song_ranks(now=None):
+    """Recompute SongRank for every song; returns the number of songs ranked."""
+    now = now or timezone.now()
+    scores = compute_scores(now)
+    # Newest first among equal scores (sorted() below is stable)
+    song_ids = list(Song.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    ranks = {song_id: SongRank(song_id=song_id, computed_at=now) for song_id in song_ids}
+    for ordering in RANK_ORDERINGS:
+        ordering_scores = scores[ordering]
+        ordered = sorted(song_ids, key=lambda song_id: -ordering_scores.get(song_id, 0.0))
+        for position, song_id in enumerate(ordered, 1):
+            setattr(ranks[song_id], f'{ordering}_score', ordering_scores.get(song_id, 0.0))
+            setattr(ranks[song_id], f'{ordering}_rank', position)
+
+    with transaction.atomic():
+        SongRank.objects.bulk_create(
+            ranks.values(), batch_size=1000, update_conflicts=True, unique_fields=['song'],
+            update_fields=['trending_score', 'trending_rank', 'popular_score', 'popular_rank', 'computed_at'],
+        )
+    cache.set(FRESH_CACHE_KEY, 1, settings.RANKING_REFRESH_SECONDS)
+    return len(ranks)
+
+
+def _refresh_if_stale():
+    latest = SongRank.objects.aggregate(latest=Max('computed_at'))['latest']
+    if latest is not None:
+        age = (timezone.now() - latest).total_seconds()
+        if age < settings.RANKING_REFRESH_SECONDS:
+            # Another process refreshed them
+            cache.set(FRESH_CACHE_KEY, 1, int(settings.RANKING_REFRESH_SECONDS - age) or 1)
+            return 0
+    return refresh_song_ranks()
+
+
+def schedule_rank_refresh():
+    """Queue a background refresh if the ranks are stale (at most one per interval)."""
+    if cache.add(FRESH_CACHE_KEY, 1, settings.RANKING_REFRESH_SECONDS):
+        return tasks.submit(_refresh_if_stale, key=REFRESH_TASK_KEY)
+    return None
+
+
+def order_by_rank(queryset, ordering):
+    """Songs from ``queryset``, best first; unranked ones last, newest first."""
+    return queryset.order_by(F(f'rank__{ordering}_rank').asc(nulls_last=True), '-created_at', '-id')
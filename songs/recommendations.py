@@ -0,0 +1,124 @@
+"""
+Song recommendations from co-favorites and co-recordings.
+
+Favorites and recordings form a binary user x song matrix: a user "has" a
+song if they favorited or recorded it. `build_song_similarity` computes the
+item-item similarity
+
+    sim(a, b) = co / sqrt(n(a) * n(b)) * co / (co + RECOMMENDATION_SHRINKAGE)
+
+where n(a) is the number of users with song a and co the number with both.
+This is cosine similarity, shrunk for pairs seen by only a few users. The
+matrix is kept sparse (songs per user, users per song) and multiplied one
+song at a time, so memory stays proportional to the number of interactions.
+Users with more than RECOMMENDATION_MAX_USER_SONGS songs are skipped: they
+add a quadratic number of pairs and little signal.
+
+The top RECOMMENDATION_NEIGHBORS neighbours of each song are stored in one
+SongSimilarity row. /api/songs/{id}/similar/ reads that row, and
+/api/songs/recommended/ merges the rows of the user's own songs. Rebuild
+with `python manage.py build_song_similarity` (e.g. nightly from cron).
+"""
+import heapq
+import math
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Favorite, Recording, Song, SongSimilarity
+
+
+def _user_songs():
+    """``{user_id: {song_id, ...}}`` from favorites and recordings."""
+    user_songs = defaultdict(set)
+    favorites = Favorite.objects.values_list('user_id', 'song_id').order_by()
+    recordings = Recording.objects.filter(song__isnull=False).values_list('user_id', 'song_id').order_by()
+    for queryset in (favorites, recordings):
+        for user_id, song_id in queryset.iterator(chunk_size=10000):
+            user_songs[user_id].add(song_id)
+    return user_songs
+
+
+def _best(items, k):
+    """Top ``k`` (song_id, score) pairs, ties to the lower id."""
+    return heapq.nlargest(k, items, key=lambda item: (item[1], -item[0]))
+
+
+def compute_neighbors(user_songs, k, shrinkage=0.0, max_user_songs=None):
+    """``{song_id: [(neighbor_id, similarity), ...]}``, most similar first."""
+    rows = [tuple(songs) for songs in user_songs.values()
+            if max_user_songs is None or len(songs) <= max_user_songs]
+    song_users = defaultdict(list)
+    for row, songs in enumerate(rows):
+        for song_id in songs:
+            song_users[song_id].append(row)
+
+    neighbors = {}
+    for song_id, users in song_users.items():
+        # One row of the song x song co-occurrence matrix
+        co = Counter()
+        for row in users:
+            co.update(rows[row])
+        del co[song_id]
+        n = len(users)
+        neighbors[song_id] = _best(
+            ((other, count / math.sqrt(n * len(song_users[other])) * count / (count + shrinkage))
+             for other, count in co.items()),
+            k,
+        )
+    return neighbors
+
+
+def build_song_similarity(now=None):
+    """Rebuild the SongSimilarity table; returns the number of songs with neighbours."""
+    now = now or timezone.now()
+    neighbors = compute_neighbors(
+        _user_songs(), settings.RECOMMENDATION_NEIGHBORS,
+        shrinkage=settings.RECOMMENDATION_SHRINKAGE,
+        max_user_songs=settings.RECOMMENDATION_MAX_USER_SONGS,
+    )
+    with transaction.atomic():
+        # Songs deleted while the matrix was being read
+        existing = set(Song.objects.filter(id__in=list(neighbors)).order_by().values_list('id', flat=True))
+        rows = [
+            SongSimilarity(song_id=song_id, neighbor_ids=[other for other, _ in top],
+                           scores=[round(score, 4) for _, score in top], computed_at=now)
+            for song_id, top in neighbors.items() if top and song_id in existing
+        ]
+        SongSimilarity.objects.all().delete()
+        SongSimilarity.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def similar_song_ids(song_id, limit):
+    """Ids of the songs most similar to ``song_id`` ([] if none), or None if it doesn't exist."""
+    found = list(Song.objects.filter(pk=song_id).order_by()
+                 .values_list('similarity__neighbor_ids', flat=True)[:1])
+    if not found:
+        return None
+    return (found[0] or [])[:limit]
+
+
+def recommended_song_ids(user, limit):
+    """
+    Songs similar to the user's most recent favorites and recordings that
+    they don't have yet, best first.
+    """
+    history = settings.RECOMMENDATION_HISTORY
+    favorites = list(Favorite.objects.filter(user=user).order_by('-added_at').values_list('song_id', flat=True))
+    recorded = list(Recording.objects.filter(user=user, song__isnull=False)
+                    .order_by('-created_at').values_list('song_id', flat=True)[:history])
+    owned = set(favorites) | set(recorded)
+    seeds = set(favorites[:history]) | set(recorded)
+    if not seeds:
+        return []
+
+    scores = defaultdict(float)
+    for neighbor_ids, similarities in SongSimilarity.objects.filter(
+            song_id__in=seeds).values_list('neighbor_ids', 'scores'):
+        for song_id, similarity in zip(neighbor_ids, similarities):
+            if song_id not in owned:
+                scores[song_id] += similarity
+    return [song_id for song_id, _ in _best(scores.items(), limit)]
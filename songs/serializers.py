@@ -1,7 +1,11 @@
+from django.core.files.storage import FileSystemStorage
+from django.utils.encoding import filepath_to_uri
 from rest_framework import serializers
 from .models import Song, Category, Favorite, UserProfile
 from django.contrib.auth.models import User
 from .models import Recording
+from .thumbnails import schedule_thumbnail_variants_by_id, thumbnail_srcset, variants_srcset
+from .limits import storage_quota
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -18,8 +22,69 @@ class RecordingSerializer(serializers.ModelSerializer):
     class Meta:
         model = Recording
         fields = ['id', 'user', 'user_username', 'song', 'song_title', 'audio_file',
-                  'recording_id', 'duration', 'created_at', 'updated_at']
-        read_only_fields = ['id', 'user', 'created_at', 'updated_at']
+                  'recording_id', 'duration', 'mix_with_song', 'vocal_offset_ms',
+                  'processing_status', 'processing_error', 'processed_file', 'mix_file',
+                  'processed_at', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'user', 'processing_status', 'processing_error', 'processed_file',
+                            'mix_file', 'processed_at', 'created_at', 'updated_at']
+
+
+class RecordingListSerializer(serializers.ModelSerializer):
+    """Slim rows for the caller's own recordings (no joins)"""
+
+    class Meta:
+        model = Recording
+        fields = ['id', 'song', 'audio_file', 'recording_id', 'duration', 'processing_status',
+                  'processed_file', 'mix_file', 'created_at']
+        read_only_fields = fields
+
+
+class MediaURLs:
+    """
+    Absolute media URLs for one request.  The scheme/host prefix is worked
+    out once instead of calling ``request.build_absolute_uri`` per field.
+    """
+
+    def __init__(self, request=None):
+        self.request = request
+        self.prefix = request.build_absolute_uri('/')[:-1] if request else ''
+        self._bases = {}
+
+    def absolute(self, url):
+        if self.request is None:
+            return url
+        if url.startswith('/') and not url.startswith('//'):
+            return self.prefix + url
+        return self.request.build_absolute_uri(url)
+
+    def _base(self, storage):
+        """Absolute base URL for a plain FileSystemStorage, else None."""
+        key = id(storage)
+        if key not in self._bases:
+            plain = isinstance(storage, FileSystemStorage) and storage.__class__.url is FileSystemStorage.url
+            self._bases[key] = self.absolute(storage.base_url) if plain else None
+        return self._bases[key]
+
+    def file(self, storage, name):
+        if not name:
+            return None
+        base = self._base(storage)
+        if base is None:
+            return self.absolute(storage.url(name))
+        # Same result as absolute(storage.url(name)), minus the urljoin per call
+        return base + filepath_to_uri(name).lstrip('/')
+
+    def audio(self, storage, name):
+        url = self.file(storage, name)
+        # Clients get the AAC transcode for songs uploaded as MP3
+        return url.replace('.mp3', '.m4a') if url else None
+
+
+def media_urls(context):
+    """The MediaURLs for a serializer context, created on first use."""
+    if 'media_urls' not in context:
+        context['media_urls'] = MediaURLs(context.get('request'))
+    return context['media_urls']
 
 
 class SongListSerializer(serializers.ModelSerializer):
@@ -27,75 +92,99 @@ class SongListSerializer(serializers.ModelSerializer):
     lyrics = serializers.SerializerMethodField()
     audio_url = serializers.SerializerMethodField()
     is_favorite = serializers.SerializerMethodField()
+    thumbnail_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = Song
-        fields = ['id', 'title', 'artist', 'category', 'thumbnail',
+        fields = ['id', 'title', 'artist', 'category', 'thumbnail', 'thumbnail_srcset',
                   'duration', 'audio_url', 'lyrics', 'is_favorite']
 
     def get_lyrics(self, obj):
-        if obj.lyrics_file:
-            try:
-                request = self.context.get('request')
-                if request:
-                    return request.build_absolute_uri(obj.lyrics_file.url)
-                return obj.lyrics_file.url
-            except:
-                return None
-        return None
+        try:
+            return media_urls(self.context).file(obj.lyrics_file.storage, obj.lyrics_file.name)
+        except Exception:
+            return None
 
     def get_audio_url(self, obj):
-        request = self.context.get('request')
-        if obj.audio_file:
-            url = request.build_absolute_uri(
-                obj.audio_file.url) if request else obj.audio_file.url
-            url = url.replace('.mp3', '.m4a')
-            return url
-        return None
+        return media_urls(self.context).audio(obj.audio_file.storage, obj.audio_file.name)
 
     def get_is_favorite(self, obj):
+        favorite_ids = self.context.get('favorite_ids')
+        if favorite_ids is not None:
+            return obj.id in favorite_ids
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return Favorite.objects.filter(user=request.user, song=obj).exists()
         return False
 
+    def get_thumbnail_srcset(self, obj):
+        return thumbnail_srcset(obj, self.context.get('request'))
 
-class SongDetailSerializer(serializers.ModelSerializer):
-    category = CategorySerializer(read_only=True)
-    lyrics = serializers.SerializerMethodField()
-    audio_url = serializers.SerializerMethodField()
-    is_favorite = serializers.SerializerMethodField()
 
-    class Meta:
-        model = Song
-        fields = ['id', 'title', 'artist', 'category', 'thumbnail',
-                  'duration', 'audio_url', 'lyrics', 'is_favorite', 'created_at']
+class SongDetailSerializer(SongListSerializer):
+    class Meta(SongListSerializer.Meta):
+        fields = SongListSerializer.Meta.fields + ['created_at']
 
-    def get_lyrics(self, obj):
-        if obj.lyrics_file:
-            try:
-                request = self.context.get('request')
-                if request:
-                    return request.build_absolute_uri(obj.lyrics_file.url)
-                return obj.lyrics_file.url
-            except:
-                return None
-        return None
 
-    def get_audio_url(self, obj):
-        request = self.context.get('request')
-        if obj.audio_file:
-            url = request.build_absolute_uri(
-                obj.audio_file.url) if request else obj.audio_file.url
-            url = url.replace('.mp3', '.m4a')
-            return url
-        return None
+# Columns read by song_rows()
+SONG_ROW_FIELDS = (
+    'id', 'title', 'artist', 'category_id', 'category__name', 'category__slug',
+    'thumbnail', 'thumbnail_variants', 'duration', 'audio_file', 'lyrics_file', 'created_at',
+)
 
-    def get_is_favorite(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return Favorite.objects.filter(user=request.user, song=obj).exists()
-        return False
+_created_at_field = serializers.DateTimeField()
+
+
+def song_rows(rows, request=None, favorite_ids=(), detail=False):
+    """
+    Read-only fast path for the song list/detail endpoints.
+
+    Takes ``Song.objects.values(*SONG_ROW_FIELDS)`` rows and returns the same
+    dicts as SongListSerializer (or SongDetailSerializer with ``detail=True``)
+    without going through DRF's per-field machinery.
+    """
+    urls = MediaURLs(request)
+    audio_storage = Song._meta.get_field('audio_file').storage
+    lyrics_storage = Song._meta.get_field('lyrics_file').storage
+    thumbnail_storage = Song._meta.get_field('thumbnail').storage
+    absolute = urls.absolute if request else None
+
+    data = []
+    for row in rows:
+        song_id = row['id']
+        thumbnail = row['thumbnail']
+        srcset = {}
+        if thumbnail:
+            variants = row['thumbnail_variants'] or {}
+            if variants.get('source') == thumbnail:
+                srcset = variants_srcset(variants, thumbnail_storage, absolute)
+            else:
+                schedule_thumbnail_variants_by_id(song_id)
+
+        category = None
+        if row['category_id'] is not None:
+            category = {
+                'id': row['category_id'],
+                'name': row['category__name'],
+                'slug': row['category__slug'],
+            }
+
+        item = {
+            'id': song_id,
+            'title': row['title'],
+            'artist': row['artist'],
+            'category': category,
+            'thumbnail': urls.file(thumbnail_storage, thumbnail),
+            'thumbnail_srcset': srcset,
+            'duration': row['duration'],
+            'audio_url': urls.audio(audio_storage, row['audio_file']),
+            'lyrics': urls.file(lyrics_storage, row['lyrics_file']),
+            'is_favorite': song_id in favorite_ids,
+        }
+        if detail:
+            item['created_at'] = _created_at_field.to_representation(row['created_at'])
+        data.append(item)
+    return data
 
 
 class FavoriteSerializer(serializers.ModelSerializer):
@@ -108,11 +197,17 @@ class FavoriteSerializer(serializers.ModelSerializer):
 
 class UserProfileSerializer(serializers.ModelSerializer):
     subscription_status = serializers.SerializerMethodField()
+    storage_quota = serializers.SerializerMethodField()
 
     class Meta:
         model = UserProfile
         fields = ['subscription_type', 'trial_start_date', 'trial_end_date',
-                  'subscription_start_date', 'subscription_end_date', 'subscription_status']
+                  'subscription_start_date', 'subscription_end_date', 'subscription_status',
+                  'storage_used', 'storage_quota']
+        read_only_fields = ['storage_used']
+
+    def get_storage_quota(self, obj):
+        return storage_quota(obj)
 
     def get_subscription_status(self, obj):
         from datetime import datetime, timezone
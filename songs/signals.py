@@ -0,0 +1,46 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Category, Recording, Song, UserProfile
+from .lyrics import schedule_lyrics_index
+from .snapshot import request_catalog_snapshot
+from .thumbnails import schedule_thumbnail_variants
+
+
+@receiver(post_save, sender=Song)
+def queue_thumbnail_variants(sender, instance, **kwargs):
+    """Build thumbnail variants in the background once the row is committed"""
+    if instance.thumbnail:
+        transaction.on_commit(lambda: schedule_thumbnail_variants(instance))
+
+
+@receiver(post_save, sender=Song)
+def queue_lyrics_index(sender, instance, **kwargs):
+    """Re-index the lyrics in the background when the lyrics file changed"""
+    transaction.on_commit(lambda: schedule_lyrics_index(instance))
+
+
+@receiver(post_save, sender=Song)
+@receiver(post_delete, sender=Song)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def queue_catalog_snapshot(sender, **kwargs):
+    """Rebuild the static catalog snapshot after any catalog change"""
+    transaction.on_commit(request_catalog_snapshot)
+
+
+@receiver(post_save, sender=Recording)
+def count_recording_storage(sender, instance, created, **kwargs):
+    """Add a new recording to the owner's storage_used"""
+    if created and instance.audio_size:
+        UserProfile.objects.filter(user_id=instance.user_id).update(
+            storage_used=F('storage_used') + instance.audio_size)
+
+
+@receiver(post_delete, sender=Recording)
+def release_recording_storage(sender, instance, **kwargs):
+    if instance.audio_size:
+        UserProfile.objects.filter(user_id=instance.user_id).update(
+            storage_used=F('storage_used') - instance.audio_size)
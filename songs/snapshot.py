@@ -0,0 +1,218 @@
+"""
+Precompiled catalog snapshot.
+
+The whole active catalog (categories, songs, media URLs and thumbnail
+variants) is written to storage as one versioned JSON file plus gzip and
+brotli copies, so catalog reads can be answered by nginx/a CDN:
+
+    catalog/catalog-<version>.json
+    catalog/catalog-<version>.json.gz
+    catalog/catalog-<version>.json.br
+    catalog/current.json          {"version": ..., "url": ..., ...}
+
+The version is a hash of the content, so unchanged catalogs keep their URL.
+Rebuilds are queued on the background worker whenever a Song or Category
+changes. At most one build runs at a time; changes that arrive while it runs
+are folded into a single follow-up build.
+
+Workers cache the pointer for POINTER_CACHE_SECONDS, so a rebuild on one
+worker reaches the others within that time even with the per-process cache.
+A replaced snapshot is kept for SNAPSHOT_RETENTION_SECONDS, well beyond that,
+so a pointer still held by another worker or a client never leads to a 404.
+The pointer itself is replaced atomically (rename on local disk, a single
+overwriting PUT on object storage), so readers never find it missing.
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+import uuid
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from . import tasks
+from .thumbnails import variants_are_current
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+SNAPSHOT_DIR = 'catalog'
+POINTER_NAME = f'{SNAPSHOT_DIR}/current.json'
+POINTER_CACHE_KEY = 'catalog-snapshot-pointer'
+POINTER_CACHE_SECONDS = 30
+KEEP_SNAPSHOTS = 3
+SNAPSHOT_RETENTION_SECONDS = 3600
+
+_state_lock = threading.Lock()
+_dirty = False
+_building = False
+
+
+def _public_url(storage, name):
+    # Snapshots are cached for good, so object storage must hand out
+    # unsigned URLs here rather than expiring pre-signed ones
+    if hasattr(storage, 'public_url'):
+        return storage.public_url(name)
+    return storage.url(name)
+
+
+def _file_url(field_file):
+    if not field_file:
+        return None
+    return _public_url(field_file.storage, field_file.name)
+
+
+def _srcset(song):
+    if not variants_are_current(song):
+        return {}
+    storage = song.thumbnail.storage
+    return {
+        fmt: {size: _public_url(storage, name) for size, name in by_size.items()}
+        for fmt, by_size in song.thumbnail_variants.items() if fmt != 'source'
+    }
+
+
+def catalog_payload():
+    from .models import Category, Song
+
+    categories = [
+        {'id': c.id, 'name': c.name, 'slug': c.slug}
+        for c in Category.objects.order_by('id')
+    ]
+    songs = []
+    for song in Song.objects.filter(is_active=True).order_by('id'):
+        audio_url = _file_url(song.audio_file)
+        songs.append({
+            'id': song.id,
+            'title': song.title,
+            'artist': song.artist,
+            'category': song.category_id,
+            'duration': song.duration,
+            'audio_url': audio_url.replace('.mp3', '.m4a') if audio_url else None,
+            'lyrics': _file_url(song.lyrics_file),
+            'thumbnail': _file_url(song.thumbnail),
+            'thumbnail_srcset': _srcset(song),
+            'updated_at': song.updated_at.isoformat(),
+        })
+    return {'categories': categories, 'songs': songs}
+
+
+def build_catalog_snapshot(storage=None):
+    """Write the snapshot files and pointer. Returns the pointer dict."""
+    storage = storage or default_storage
+    payload = catalog_payload()
+    body = json.dumps(payload, ensure_ascii=False, separators=(',', ':'), sort_keys=True).encode('utf-8')
+    version = hashlib.sha256(body).hexdigest()[:16]
+    name = f'{SNAPSHOT_DIR}/catalog-{version}.json'
+
+    files = {name: body, name + '.gz': gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        files[name + '.br'] = brotli.compress(body, quality=11)
+    for file_name, content in files.items():
+        if not storage.exists(file_name):
+            storage.save(file_name, ContentFile(content))
+
+    pointer = {
+        'version': version,
+        'url': _public_url(storage, name),
+        'gzip_url': _public_url(storage, name + '.gz'),
+        'brotli_url': _public_url(storage, name + '.br') if brotli is not None else None,
+        'size': len(body),
+        'song_count': len(payload['songs']),
+        'generated_at': timezone.now().isoformat(),
+    }
+    _replace_pointer(storage, json.dumps(pointer).encode('utf-8'))
+    cache.set(POINTER_CACHE_KEY, pointer, POINTER_CACHE_SECONDS)
+
+    _prune_old_snapshots(storage, version)
+    return pointer
+
+
+def _replace_pointer(storage, content):
+    """Overwrite the pointer file without a moment where it is missing."""
+    try:
+        path = storage.path(POINTER_NAME)
+    except NotImplementedError:
+        path = None
+    if path is not None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial = os.path.join(os.path.dirname(path), f'.current-{uuid.uuid4().hex}.tmp')
+        with open(partial, 'wb') as f:
+            f.write(content)
+        os.replace(partial, path)
+        return
+    if getattr(storage, 'file_overwrite', False):
+        # e.g. S3: one PUT replaces the object
+        storage.save(POINTER_NAME, ContentFile(content))
+        return
+    if storage.exists(POINTER_NAME):
+        storage.delete(POINTER_NAME)
+    storage.save(POINTER_NAME, ContentFile(content))
+
+
+def _prune_old_snapshots(storage, current_version, now=None):
+    """
+    Delete snapshots beyond the newest KEEP_SNAPSHOTS that were replaced
+    (the next newer one written) more than SNAPSHOT_RETENTION_SECONDS ago.
+    """
+    try:
+        _, names = storage.listdir(SNAPSHOT_DIR)
+    except (OSError, NotImplementedError):
+        return
+    modified = {
+        n: storage.get_modified_time(f'{SNAPSHOT_DIR}/{n}')
+        for n in names if n.startswith('catalog-') and n.endswith('.json')
+    }
+    snapshots = sorted(modified, key=modified.get, reverse=True)
+    cutoff = (now or timezone.now()) - timedelta(seconds=SNAPSHOT_RETENTION_SECONDS)
+    for newer, old in zip(snapshots[KEEP_SNAPSHOTS - 1:], snapshots[KEEP_SNAPSHOTS:]):
+        if old == f'catalog-{current_version}.json' or modified[newer] > cutoff:
+            continue
+        for suffix in ('', '.gz', '.br'):
+            if storage.exists(f'{SNAPSHOT_DIR}/{old}{suffix}'):
+                storage.delete(f'{SNAPSHOT_DIR}/{old}{suffix}')
+
+
+def _build_until_clean():
+    global _dirty, _building
+    pointer = None
+    try:
+        while True:
+            with _state_lock:
+                if not _dirty:
+                    _building = False
+                    return pointer
+                _dirty = False
+            pointer = build_catalog_snapshot()
+    except Exception:
+        with _state_lock:
+            _building = False
+        raise
+
+
+def request_catalog_snapshot():
+    """Mark the catalog changed and make sure a rebuild is queued or running."""
+    global _dirty, _building
+    with _state_lock:
+        _dirty = True
+        if _building:
+            return None
+        _building = True
+    return tasks.submit(_build_until_clean)
+
+
+def current_snapshot():
+    """Pointer for the latest snapshot, or None if none has been built yet."""
+    pointer = cache.get(POINTER_CACHE_KEY)
+    if pointer is None and default_storage.exists(POINTER_NAME):
+        with default_storage.open(POINTER_NAME, 'rb') as f:
+            pointer = json.loads(f.read())
+        cache.set(POINTER_CACHE_KEY, pointer, POINTER_CACHE_SECONDS)
+    return pointer
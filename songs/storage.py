@@ -0,0 +1,67 @@
+"""
+Media storage backends.
+
+Every FileField (song audio, lyrics and thumbnails, recordings) stores
+through Django's default storage, picked by the MEDIA_STORAGE setting:
+
+* ``local`` - FileSystemStorage under MEDIA_ROOT (single node).
+* ``s3``    - S3MediaStorage: AWS S3 or any S3-compatible server (MinIO,
+  Cloudflare R2, ...) via AWS_S3_ENDPOINT_URL.  Large files are uploaded in
+  parallel multipart chunks, downloads are pre-signed GET URLs, and clients
+  can be handed pre-signed PUT URLs to upload straight to the bucket.
+
+Needs django-storages and boto3 for ``s3``.
+"""
+from django.conf import settings
+
+try:
+    from boto3.s3.transfer import TransferConfig
+    from storages.backends.s3 import S3Storage
+    from storages.utils import clean_name
+except ImportError:  # pragma: no cover - optional dependency
+    S3Storage = None
+
+
+if S3Storage is not None:
+    class S3MediaStorage(S3Storage):
+        def __init__(self, **kwargs):
+            kwargs.setdefault('transfer_config', TransferConfig(
+                multipart_threshold=settings.MEDIA_MULTIPART_THRESHOLD,
+                multipart_chunksize=settings.MEDIA_MULTIPART_CHUNKSIZE,
+                max_concurrency=settings.MEDIA_MULTIPART_CONCURRENCY,
+            ))
+            super().__init__(**kwargs)
+
+        def public_url(self, name):
+            """
+            Unsigned URL (via AWS_S3_CUSTOM_DOMAIN when set), for objects that
+            are publicly readable such as the catalog snapshot.
+            """
+            if self.custom_domain:
+                return self.url(name)
+            return self.unsigned_connection.meta.client.generate_presigned_url(
+                'get_object', Params={'Bucket': self.bucket.name, 'Key': self._normalize_name(clean_name(name))})
+
+        def presigned_get_url(self, name, expire=None, filename=None):
+            """Signed playback/download URL, optionally forcing a download filename."""
+            parameters = None
+            if filename:
+                parameters = {'ResponseContentDisposition': f'attachment; filename="{filename}"'}
+            return self.url(name, parameters=parameters, expire=expire)
+
+        def content_type(self, name):
+            """Content-Type recorded on the stored object."""
+            return self.bucket.Object(self._normalize_name(clean_name(name))).content_type
+
+        def presigned_put_url(self, name, content_type, expire=None):
+            """
+            Signed URL a client can PUT ``name`` to directly.  The request
+            must send the same Content-Type header.
+            """
+            name = self._normalize_name(clean_name(name))
+            return self.connection.meta.client.generate_presigned_url(
+                'put_object',
+                Params={'Bucket': self.bucket.name, 'Key': name, 'ContentType': content_type},
+                ExpiresIn=expire or self.querystring_expire,
+                HttpMethod='PUT',
+            )
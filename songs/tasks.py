@@ -0,0 +1,85 @@
+"""
+Small in-process background worker.
+
+Media post-processing (thumbnail variants, transcodes, ...) is too slow for
+the request/response cycle, so it is handed to a bounded thread pool instead.
+Jobs submitted with the same ``key`` while one is still queued or running are
+collapsed into the first one.
+
+Long jobs (ffmpeg) can be sent to a named pool so they never starve the
+default one; pool sizes come from ``BACKGROUND_TASK_POOLS``.
+
+Set ``BACKGROUND_TASKS_EAGER = True`` in settings to run jobs inline (useful
+for tests and management commands).
+"""
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+_executors = {}
+_lock = threading.Lock()
+_pending = {}
+
+
+def _get_executor(pool=None):
+    with _lock:
+        if pool not in _executors:
+            if pool is None:
+                workers = getattr(settings, 'BACKGROUND_TASK_WORKERS', 2)
+            else:
+                workers = getattr(settings, 'BACKGROUND_TASK_POOLS', {}).get(pool, 1)
+            _executors[pool] = ThreadPoolExecutor(
+                max_workers=workers,
+                thread_name_prefix=f'miclab-{pool}' if pool else 'miclab-worker',
+            )
+        return _executors[pool]
+
+
+def _run(fn, key, args, kwargs):
+    try:
+        return fn(*args, **kwargs)
+    except Exception:
+        logger.exception("Background task %s failed", key or fn.__name__)
+        raise
+    finally:
+        if key is not None:
+            with _lock:
+                _pending.pop(key, None)
+        close_old_connections()
+
+
+def submit(fn, *args, key=None, pool=None, **kwargs):
+    """
+    Run ``fn(*args, **kwargs)`` on the background pool (or the named ``pool``)
+    and return a Future.
+
+    If ``key`` is given and a job with the same key is already pending, the
+    existing Future is returned instead of queueing a duplicate.
+    """
+    if getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            logger.exception("Task %s failed", key or fn.__name__)
+            future.set_exception(e)
+        return future
+
+    executor = _get_executor(pool)
+    with _lock:
+        if key is not None and key in _pending:
+            return _pending[key]
+        future = executor.submit(_run, fn, key, args, kwargs)
+        if key is not None and not future.done():
+            _pending[key] = future
+    return future
+
+
+def is_pending(key):
+    with _lock:
+        return key in _pending
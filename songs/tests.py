@@ -1,3 +1,1303 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import subprocess
+import tempfile
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock, skipIf
+from urllib.parse import parse_qs, urlsplit
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import NoReverseMatch, reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from auth_app.async_views import check_access, me
+from config.compression import CompressionMiddleware, choose_encoding, parse_accept_encoding
+from config.renderers import FastJSONRenderer
+from config.roles import RejectUploadsMiddleware
+from .async_views import song_list
+from . import analytics
+from .ranking import refresh_song_ranks, schedule_rank_refresh
+from .recommendations import build_song_similarity, compute_neighbors
+from .lyrics import fold, parse_lrc, parse_vtt, search_lyrics
+from .keyshift import evict_key_shift_cache, schedule_key_shift
+from .ids import uuid7
+from . import snapshot
+from . import storage as media_storage
+from .limits import take_tokens
+from .uploads import purge_abandoned_uploads, read_upload, recording_upload
+from .thumbnails import generate_thumbnail_variants, pick_variant
+from .trial import issue_trial_token, revoke_trial, verify_trial_token
+from .media import parse_range_header, serve_media_file
+from .models import Category, Favorite, Recording, Song, SongDailyStats, SongEvent, SongRank, UserProfile
+from .postprocess import (MAX_PROCESSING_ATTEMPTS, PROCESSING_STALE_SECONDS, _process_claimed,
+                          claim_pending_recordings, process_recording, processing_key)
+from .views import CatalogViewSet, EventViewSet, FavoriteViewSet, RecordingViewSet, SongViewSet, TrialViewSet, upload_song_page
+from .serializers import SONG_ROW_FIELDS, SongDetailSerializer, SongListSerializer, song_rows
+
+
+class AdminChangelistQueryCountTests(TestCase):
+    """The admin changelists must not issue per-row queries"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin123')
+        cls.category = Category.objects.create(name='Traditional', slug='traditional')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def add_songs(self, count):
+        start = Song.objects.count()
+        return Song.objects.bulk_create([
+            Song(title=f'Song {i}', artist=f'Artist {i}', category=self.category,
+                 audio_file=f'songs/audio/song_{i}.m4a', lyrics_file=f'songs/audio/song_{i}.vtt',
+                 duration=180, audio_size=3_000_000, lyrics_size=2_000)
+            for i in range(start, start + count)
+        ])
+
+    def add_favorites(self, count):
+        start = User.objects.count()
+        users = User.objects.bulk_create([User(username=f'user{i}') for i in range(start, start + count)])
+        songs = self.add_songs(count)
+        Favorite.objects.bulk_create([Favorite(user=u, song=s) for u, s in zip(users, songs)])
+
+    def changelist_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_song_changelist_query_count_is_constant(self):
+        url = reverse('admin:songs_song_changelist')
+        self.add_songs(2)
+        few = self.changelist_queries(url)
+        self.add_songs(40)
+        self.assertEqual(self.changelist_queries(url), few)
+
+    def test_favorite_changelist_query_count_is_constant(self):
+        url = reverse('admin:songs_favorite_changelist')
+        self.add_favorites(2)
+        few = self.changelist_queries(url)
+        self.add_favorites(40)
+        self.assertEqual(self.changelist_queries(url), few)
+
+    def test_changelist_counts_are_cached(self):
+        url = reverse('admin:songs_song_changelist')
+        self.add_songs(5)
+        cold = self.changelist_queries(url)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url)
+        self.assertLess(len(ctx.captured_queries), cold)
+
+
+class SongRowsTests(TestCase):
+    """The song list/detail fast path must match the DRF serializers"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('listener', 'listener@example.com', 'pass12345')
+        cls.token = Token.objects.create(user=cls.user)
+        category = Category.objects.create(name='Halk aýdymlary', slug='halk')
+        cls.songs = [
+            Song.objects.create(title='Gyzlar', artist='Aýna', category=category,
+                                audio_file='songs/audio/Aýna_-_Gyzlar.mp3',
+                                lyrics_file='songs/audio/Aýna_-_Gyzlar.vtt', duration=200),
+            Song.objects.create(title='No category', artist='Anon', category=None,
+                                audio_file='songs/audio/anon.m4a', lyrics_file='', duration=90,
+                                thumbnail='songs/thumbnails/anon.png',
+                                thumbnail_variants={'source': 'songs/thumbnails/anon.png',
+                                                    'webp': {'64': 'songs/thumbnails/variants/2/anon_64.webp'}}),
+        ]
+        Favorite.objects.create(user=cls.user, song=cls.songs[0])
+
+    def serializer_context(self):
+        request = Request(APIRequestFactory().get('/api/songs/', HTTP_HOST='api.example.com'))
+        request.user = self.user
+        return request, {'request': request}
+
+    def test_list_rows_match_serializer(self):
+        request, context = self.serializer_context()
+        expected = SongListSerializer(Song.objects.all(), many=True, context=context).data
+        rows = Song.objects.values(*SONG_ROW_FIELDS)
+        self.assertEqual(song_rows(rows, request, {self.songs[0].id}), expected)
+
+    def test_detail_row_matches_serializer(self):
+        request, context = self.serializer_context()
+        song = self.songs[1]
+        expected = SongDetailSerializer(song, context=context).data
+        row = Song.objects.values(*SONG_ROW_FIELDS).get(pk=song.pk)
+        self.assertEqual(song_rows([row], request, detail=True)[0], expected)
+
+    def test_list_endpoint_query_count(self):
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Token {self.token.key}'
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/songs/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][1]['is_favorite'], True)
+        # token, count, page, favorites
+        self.assertEqual(len(ctx.captured_queries), 4)
+
+
+class FavoriteBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('listener', 'listener@example.com', 'pass12345')
+        cls.token = Token.objects.create(user=cls.user)
+        cls.songs = [
+            Song.objects.create(title=f'Song {i}', artist='Aýna', audio_file=f'songs/audio/{i}.m4a',
+                                lyrics_file='', duration=100)
+            for i in range(3)
+        ]
+
+    def batch(self, add=(), remove=()):
+        request = APIRequestFactory().post('/api/favorites/batch/', {'add': add, 'remove': remove},
+                                           format='json', HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        return FavoriteViewSet.as_view({'post': 'batch'})(request)
+
+    def list(self, **headers):
+        request = APIRequestFactory().get('/api/favorites/', HTTP_AUTHORIZATION=f'Token {self.token.key}', **headers)
+        return FavoriteViewSet.as_view({'get': 'list'})(request)
+
+    def test_batch_is_idempotent_and_versioned(self):
+        a, b, c = (song.pk for song in self.songs)
+        first = self.batch(add=[a, b, 999999])
+        self.assertEqual((first.data['version'], first.data['added']), (1, 2))
+        self.assertEqual(sorted(first.data['song_ids']), [a, b])
+
+        again = self.batch(add=[a, b], remove=[c])
+        self.assertEqual((again.data['version'], again.data['added'], again.data['removed']), (1, 0, 0))
+
+        changed = self.batch(add=[c], remove=[a])
+        self.assertEqual((changed.data['version'], changed.data['added'], changed.data['removed']), (2, 1, 1))
+        self.assertEqual(sorted(changed.data['song_ids']), [b, c])
+        self.assertEqual(self.batch(add=a).status_code, 400)
+
+    def test_list_answers_304_until_favorites_change(self):
+        self.batch(add=[self.songs[0].pk])
+        response = self.list()
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(self.list(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.batch(add=[self.songs[1].pk])
+        response = self.list(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        etag = response['ETag']
+        request = APIRequestFactory().delete('/api/favorites/', HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        favorite = Favorite.objects.filter(user=self.user).first()
+        FavoriteViewSet.as_view({'delete': 'destroy'})(request, pk=favorite.pk)
+        self.assertEqual(self.list(HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_compressed_list_revalidates_with_the_weak_etag(self):
+        songs = [Song.objects.create(title=f'Long enough to compress {i}', artist='Aýna',
+                                     audio_file=f'songs/audio/long{i}.m4a', lyrics_file='', duration=100)
+                 for i in range(10)]
+        self.batch(add=[song.pk for song in songs])
+        auth = {'HTTP_AUTHORIZATION': f'Token {self.token.key}', 'HTTP_ACCEPT_ENCODING': 'br, gzip'}
+        response = self.client.get('/api/favorites/', **auth)
+        self.assertEqual((response.status_code, response['Content-Encoding']), (200, 'br'))
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('W/"'))
+        self.assertEqual(self.client.get('/api/favorites/', HTTP_IF_NONE_MATCH=etag, **auth).status_code, 304)
+
+        # Editing a favorited song changes the cached rows, so the ETag too
+        songs[3].title = 'Renamed'
+        songs[3].save()
+        self.assertEqual(self.client.get('/api/favorites/', HTTP_IF_NONE_MATCH=etag, **auth).status_code, 200)
+
+
+class RecordingListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.song = Song.objects.create(title='Gyzlar', artist='Aýna', audio_file='songs/audio/a.m4a',
+                                       lyrics_file='', duration=200)
+        cls.tokens = {}
+        for name in ('ayna', 'merdan'):
+            user = User.objects.create_user(name, f'{name}@example.com', 'pass12345')
+            cls.tokens[name] = Token.objects.create(user=user)
+            for i in range(2):
+                Recording.objects.create(user=user, song=cls.song, recording_id=f'{name}-{i}',
+                                         audio_file=f'myrecordings/{name}-{i}.m4a', audio_size=1)
+
+    def get(self, name, action='list', **kwargs):
+        request = APIRequestFactory().get('/api/recordings/', HTTP_AUTHORIZATION=f'Token {self.tokens[name].key}')
+        return RecordingViewSet.as_view({'get': action})(request, **kwargs)
+
+    def test_other_users_recordings_are_not_visible(self):
+        response = self.get('ayna')
+        self.assertEqual([row['recording_id'] for row in response.data['results']], ['ayna-1', 'ayna-0'])
+        other = Recording.objects.get(recording_id='merdan-0')
+        self.assertEqual(self.get('ayna', 'retrieve', pk=other.pk).status_code, 404)
+        self.assertEqual(self.get('merdan', 'retrieve', pk=other.pk).status_code, 200)
+
+
+def fake_ffmpeg(vocal_path, vocal_out, song_path=None, mix_out=None, offset_ms=0):
+    if song_path is None:
+        return ['cp', vocal_path, vocal_out]
+    return ['sh', '-c', 'cp "$0" "$1" && cp "$0" "$2"', vocal_path, vocal_out, mix_out]
+
+
+@mock.patch('songs.postprocess.ffmpeg_command', fake_ffmpeg)
+class RecordingProcessingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('singer', 'singer@example.com', 'pass12345')
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        overrides = override_settings(MEDIA_ROOT=media_root.name, BACKGROUND_TASKS_EAGER=True)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.song = Song(title='Saba boldy', artist='Agamyrat', lyrics_file='', duration=200)
+        self.song.audio_file.save('saba.m4a', ContentFile(b'song'), save=False)
+        self.song.save()
+        self.recording = Recording(user=self.user, song=self.song, recording_id='r1', mix_with_song=True)
+        self.recording.audio_file.save('r1.m4a', ContentFile(b'vocal'), save=False)
+        self.recording.save()
+
+    def process(self, **data):
+        request = APIRequestFactory().post(f'/api/recordings/{self.recording.pk}/process/', data,
+                                           HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        return RecordingViewSet.as_view({'post': 'process'})(request, pk=self.recording.pk)
+
+    def test_settings_changed_mid_run_are_rendered_before_ready(self):
+        real_run = subprocess.run
+        runs = []
+
+        def run(cmd, **kwargs):
+            if not runs:
+                # A second process request lands while ffmpeg is running
+                Recording.objects.filter(pk=self.recording.pk).update(vocal_offset_ms=500)
+            runs.append(cmd)
+            return real_run(cmd, **kwargs)
+
+        with mock.patch('subprocess.run', run):
+            process_recording(self.recording.pk)
+        self.assertEqual(len(runs), 2)
+        self.recording.refresh_from_db()
+        self.assertEqual(self.recording.processing_status, Recording.STATUS_READY)
+        self.assertIn(processing_key(self.recording, mix=True), self.recording.mix_file.name)
+        # Only the second run's outputs are left in storage
+        _, processed = default_storage.listdir(os.path.dirname(self.recording.processed_file.name))
+        self.assertEqual(sorted(processed),
+                         sorted(os.path.basename(f.name) for f in (self.recording.processed_file,
+                                                                   self.recording.mix_file)))
+
+    def test_run_for_a_deleted_recording_leaves_no_outputs(self):
+        real_run = subprocess.run
+
+        def run(cmd, **kwargs):
+            Recording.objects.filter(pk=self.recording.pk).delete()
+            return real_run(cmd, **kwargs)
+
+        with mock.patch('subprocess.run', run):
+            process_recording(self.recording.pk)
+        self.assertFalse(Recording.objects.filter(pk=self.recording.pk).exists())
+        self.assertEqual(default_storage.listdir('myrecordings/processed')[1], [])
+
+    def test_process_action_bounds_offset_and_reports_storage_errors(self):
+        self.assertEqual(self.process(offset_ms='20000').status_code, 400)
+        self.assertEqual(self.process(offset_ms='soon').status_code, 400)
+        self.assertEqual(self.process(offset_ms='-250').status_code, 202)
+        self.recording.refresh_from_db()
+        self.assertEqual((self.recording.vocal_offset_ms, self.recording.processing_status),
+                         (-250, Recording.STATUS_READY))
+
+        with mock.patch('django.core.files.storage.FileSystemStorage.exists', side_effect=RuntimeError('S3 down')), \
+                self.assertLogs('songs.postprocess', 'WARNING'):
+            self.assertEqual(self.process(mix='0').status_code, 202)
+        self.recording.refresh_from_db()
+        self.assertEqual((self.recording.processing_status, self.recording.processing_error),
+                         (Recording.STATUS_FAILED, 'S3 down'))
+
+
+class RecordingClaimTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('singer', 'singer@example.com', 'pass12345')
+
+    def test_claims_are_exclusive_and_retries_capped(self):
+        recording = Recording.objects.create(user=self.user, recording_id='r1',
+                                             audio_file='myrecordings/r1.m4a', audio_size=1)
+        self.assertEqual(claim_pending_recordings(), [recording.pk])
+        # A second ingest worker polling the same rows gets nothing
+        self.assertEqual(claim_pending_recordings(), [])
+
+        # Claims left behind by a killed worker are taken again, a few times
+        now = timezone.now()
+        for attempt in range(2, MAX_PROCESSING_ATTEMPTS + 1):
+            now += timedelta(seconds=PROCESSING_STALE_SECONDS + 1)
+            self.assertEqual(claim_pending_recordings(now=now), [recording.pk])
+        now += timedelta(seconds=PROCESSING_STALE_SECONDS + 1)
+        self.assertEqual(claim_pending_recordings(now=now), [])
+        recording.refresh_from_db()
+        self.assertEqual((recording.processing_status, recording.processing_attempts),
+                         (Recording.STATUS_FAILED, MAX_PROCESSING_ATTEMPTS))
+
+    def test_unexpected_errors_mark_the_recording_failed(self):
+        recording = Recording.objects.create(user=self.user, recording_id='r2',
+                                             audio_file='myrecordings/r2.m4a', audio_size=1)
+        with mock.patch('songs.postprocess.process_recording', side_effect=RuntimeError('db gone')), \
+                self.assertRaises(RuntimeError):
+            _process_claimed(recording.pk)
+        recording.refresh_from_db()
+        self.assertEqual((recording.processing_status, recording.processing_error),
+                         (Recording.STATUS_FAILED, 'db gone'))
+
+
+class DirectUploadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.song = Song.objects.create(title='Gyzlar', artist='Aýna', audio_file='songs/audio/a.m4a',
+                                       lyrics_file='', duration=200)
+        cls.tokens = {}
+        for name in ('ayna', 'merdan'):
+            user = User.objects.create_user(name, f'{name}@example.com', 'pass12345')
+            UserProfile.objects.create(user=user)
+            cls.tokens[name] = Token.objects.create(user=user).key
+
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        overrides = override_settings(MEDIA_ROOT=media_root.name, BACKGROUND_TASKS_EAGER=True)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def post(self, action, data, user='ayna'):
+        request = APIRequestFactory().post(f'/api/recordings/{action}/', data, format='json',
+                                           HTTP_AUTHORIZATION=f'Token {self.tokens[user]}')
+        # The action's own parsers, as the router would pass them
+        view = RecordingViewSet.as_view({'post': action}, **getattr(RecordingViewSet, action).kwargs)
+        return view(request)
+
+    def upload_url(self, content_type='audio/mp4'):
+        return self.post('upload_url', {'song': self.song.pk, 'content_type': content_type})
+
+    def put(self, upload, body, content_type='audio/mp4'):
+        # CONTENT_TYPE is only filled in for non-empty bodies otherwise
+        request = RequestFactory().put(upload['url'], body, content_type=content_type, CONTENT_TYPE=content_type)
+        return recording_upload(request, upload['upload_id'])
+
+    def test_upload_and_idempotent_finalize(self):
+        self.assertEqual(self.upload_url('video/mp4').status_code, 400)
+        upload = self.upload_url().data
+        self.assertIn('/upload/recordings/', upload['url'])
+
+        self.assertEqual(self.post('finalize', {'upload_id': upload['upload_id']}).status_code, 409)
+        self.assertEqual(self.put(upload, b'audio', content_type='audio/wav').status_code, 415)
+        self.assertEqual(self.put(upload, b'').status_code, 411)
+        with override_settings(RECORDING_UPLOAD_MAX_BYTES=4):
+            self.assertEqual(self.put(upload, b'audio').status_code, 413)
+        self.assertEqual(self.put(upload, b'audio').status_code, 201)
+        self.assertEqual(self.put(upload, b'audio').status_code, 409)
+
+        self.assertEqual(self.post('finalize', {'upload_id': upload['upload_id']}, user='merdan').status_code, 403)
+        self.assertEqual(self.post('finalize', {'upload_id': 'forged'}).status_code, 403)
+        self.assertEqual(self.post('finalize', {'upload_id': upload['upload_id'], 'offset_ms': 99999}).status_code, 400)
+        created = self.post('finalize', {'upload_id': upload['upload_id'], 'duration': 95})
+        self.assertEqual(created.status_code, 201)
+        retried = self.post('finalize', {'upload_id': upload['upload_id']})
+        self.assertEqual((retried.status_code, retried.data['id']), (200, created.data['id']))
+
+        with mock.patch('time.time', return_value=time.time() + 3600):
+            self.assertEqual(self.post('finalize', {'upload_id': upload['upload_id']}).status_code, 410)
+
+    def test_concurrent_finalize_returns_the_winner(self):
+        upload = self.upload_url().data
+        self.assertEqual(self.put(upload, b'audio').status_code, 201)
+        payload = read_upload(upload['upload_id'])
+
+        def other_request_wins(payload):
+            Recording.objects.create(user_id=payload['u'], song_id=payload['s'], audio_file=payload['k'],
+                                     recording_id=payload['r'], audio_size=5)
+            return 5
+
+        with mock.patch('songs.views.check_uploaded_file', other_request_wins):
+            response = self.post('finalize', {'upload_id': upload['upload_id']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['recording_id'], payload['r'])
+        self.assertEqual(Recording.objects.filter(recording_id=payload['r']).count(), 1)
+
+    def test_abandoned_uploads_are_purged_after_expiry(self):
+        names = []
+        for _ in range(3):
+            upload = self.upload_url().data
+            self.put(upload, b'audio')
+            names.append(read_upload(upload['upload_id'])['k'])
+        self.post('finalize', {'upload_id': upload['upload_id']})
+
+        self.assertEqual(purge_abandoned_uploads(), 0)
+        later = timezone.now() + timedelta(hours=1)
+        self.assertEqual(purge_abandoned_uploads(now=later), 2)
+        self.assertEqual([default_storage.exists(name) for name in names], [False, False, True])
+
+
+@skipIf(media_storage.S3Storage is None, "needs boto3 and django-storages")
+class S3MediaStorageTests(SimpleTestCase):
+    def setUp(self):
+        self.storage = media_storage.S3MediaStorage(
+            bucket_name='media', location='songs', access_key='key', secret_key='secret',
+            region_name='us-east-1', endpoint_url='http://minio:9000', addressing_style='path',
+            signature_version='s3v4')
+
+    def test_presigned_put_url_signs_the_content_type(self):
+        client = self.storage.connection.meta.client
+        with mock.patch.object(client, 'generate_presigned_url', wraps=client.generate_presigned_url) as sign:
+            url = self.storage.presigned_put_url('myrecordings\\r1.m4a', 'audio/mp4', expire=60)
+        sign.assert_called_once_with(
+            'put_object', Params={'Bucket': 'media', 'Key': 'songs/myrecordings/r1.m4a', 'ContentType': 'audio/mp4'},
+            ExpiresIn=60, HttpMethod='PUT')
+        parts = urlsplit(url)
+        query = parse_qs(parts.query)
+        self.assertEqual(parts.path, '/media/songs/myrecordings/r1.m4a')
+        self.assertEqual(query['X-Amz-Expires'], ['60'])
+        self.assertIn('content-type', query['X-Amz-SignedHeaders'][0].split(';'))
+
+    def test_presigned_get_url_can_force_a_download_name(self):
+        url = self.storage.presigned_get_url('processed/r1.m4a', expire=120, filename='Saba boldy.m4a')
+        parts = urlsplit(url)
+        query = parse_qs(parts.query)
+        self.assertEqual(parts.path, '/media/songs/processed/r1.m4a')
+        self.assertEqual(query['response-content-disposition'], ['attachment; filename="Saba boldy.m4a"'])
+        self.assertEqual(query['X-Amz-Expires'], ['120'])
+        self.assertIn('X-Amz-Signature', query)
+
+    def test_public_url_is_unsigned(self):
+        url = self.storage.public_url('catalog/./current.json')
+        self.assertEqual(url, 'http://minio:9000/media/songs/catalog/current.json')
+
+        cdn = media_storage.S3MediaStorage(bucket_name='media', custom_domain='cdn.example.com',
+                                           access_key='key', secret_key='secret', region_name='us-east-1')
+        self.assertEqual(cdn.public_url('catalog/current.json'), 'https://cdn.example.com/catalog/current.json')
+
+    def test_content_type_reads_the_stored_object(self):
+        from botocore.stub import Stubber
+
+        with Stubber(self.storage.connection.meta.client) as stub:
+            stub.add_response('head_object', {'ContentType': 'audio/mp4'},
+                              {'Bucket': 'media', 'Key': 'songs/myrecordings/r1.m4a'})
+            self.assertEqual(self.storage.content_type('myrecordings//r1.m4a'), 'audio/mp4')
+            stub.assert_no_pending_responses()
+
+
+class RecordingIdTests(SimpleTestCase):
+    def test_uuid7_ids_are_unique_and_ordered_within_a_millisecond(self):
+        with mock.patch('songs.ids.time.time_ns', return_value=4_000_000_000_000 * 1_000_000):
+            ids = [uuid7() for _ in range(5000)]
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertEqual(sorted(ids, key=str), ids)
+        self.assertEqual({(u.version, u.variant) for u in ids}, {(7, uuid.RFC_4122)})
+        # 4096 counter values per millisecond, then the next one is borrowed
+        self.assertEqual(ids[0].int >> 80, 4_000_000_000_000)
+        self.assertGreater(ids[-1].int >> 80, 4_000_000_000_000)
+
+
+class AsyncViewTests(TestCase):
+    """The ASGI views must answer like the DRF views they replace"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('listener', 'listener@example.com', 'pass12345')
+        cls.token = Token.objects.create(user=cls.user)
+        for i in range(3):
+            song = Song.objects.create(title=f'Song {i}', artist='Aýna', audio_file=f'songs/audio/{i}.m4a',
+                                       lyrics_file='', duration=100)
+        Favorite.objects.create(user=cls.user, song=song)
+
+    def sync_list(self, **params):
+        request = APIRequestFactory().get('/api/songs/', params, HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        response = SongViewSet.as_view({'get': 'list'})(request)
+        response.render()
+        return response
+
+    async def test_song_list_matches_viewset(self):
+        auth = {'headers': {'Authorization': f'Token {self.token.key}'}}
+        response = await song_list(AsyncRequestFactory().get('/api/songs/', **auth))
+        self.assertEqual(response.status_code, 200)
+        expected = await sync_to_async(self.sync_list)()
+        self.assertEqual(json.loads(response.content), json.loads(expected.content))
+
+        response = await song_list(AsyncRequestFactory().get('/api/songs/', {'page': 9}, **auth))
+        self.assertEqual(response.status_code, 404)
+        response = await song_list(AsyncRequestFactory().get('/api/songs/'))
+        self.assertEqual(response.status_code, 401)
+
+    async def test_writes_go_to_the_viewset(self):
+        request = AsyncRequestFactory().post('/api/songs/', {'title': 'New'},
+                                             headers={'Authorization': f'Token {self.token.key}'})
+        response = await song_list(request)
+        # Validation error from SongViewSet.create, not 405
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('artist', response.data)
+
+    async def test_auth_views_reject_anonymous_like_drf(self):
+        for view in (me, check_access):
+            response = await view(AsyncRequestFactory().get('/api/auth/me/'))
+            self.assertEqual(response.status_code, 403)
+            response = await view(AsyncRequestFactory().post('/api/auth/me/'))
+            self.assertEqual(response.status_code, 405)
+
+
+class TrialTokenTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def register(self, device_id):
+        request = APIRequestFactory().post('/api/trial/register/', {'device_id': device_id}, format='json')
+        return TrialViewSet.as_view({'post': 'register'})(request)
+
+    def test_issue_verify_and_revoke(self):
+        response = self.register('device-1')
+        self.assertEqual(response.status_code, 200)
+        token = response.data['trial_token']
+        self.assertEqual(issue_trial_token('device-1')[0], token)
+        with self.assertNumQueries(1):
+            self.assertEqual(verify_trial_token(token), 'device-1')
+            self.assertEqual(verify_trial_token(token), 'device-1')
+        self.assertIsNone(verify_trial_token(token + 'x'))
+
+        self.assertTrue(revoke_trial('device-1'))
+        self.assertIsNone(verify_trial_token(token))
+        # Another worker, or this one after the cache entry is gone
+        cache.clear()
+        self.assertIsNone(verify_trial_token(token))
+        self.assertFalse(revoke_trial('unknown'))
+
+    def test_register_validates_device_id(self):
+        for device_id in (123, ['a'], '', 'x' * 256):
+            self.assertEqual(self.register(device_id).status_code, 400)
+
+
+class ThumbnailVariantTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.token = Token.objects.create(user=User.objects.create_user('listener', 'l@example.com', 'pass12345'))
+
+    def setUp(self):
+        from PIL import Image
+
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        overrides = override_settings(MEDIA_ROOT=media_root.name, BACKGROUND_TASKS_EAGER=True)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        image = io.BytesIO()
+        Image.new('RGBA', (300, 200), (200, 30, 30, 128)).save(image, 'PNG')
+        self.song = Song(title='Saba boldy', artist='Agamyrat', audio_file='songs/audio/s.m4a',
+                         lyrics_file='', duration=200)
+        self.song.thumbnail.save('cover.png', ContentFile(image.getvalue()), save=False)
+        self.song.save()
+
+    def get(self, size):
+        request = APIRequestFactory().get(f'/api/songs/{self.song.pk}/thumbnail/', {'size': size, 'fmt': 'webp'},
+                                          HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        return SongViewSet.as_view({'get': 'thumbnail_variant'})(request, pk=self.song.pk)
+
+    def test_original_is_served_until_the_variants_exist(self):
+        with mock.patch('songs.thumbnails.tasks.submit') as submit:
+            response = self.get(128)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], self.song.thumbnail.url)
+        submit.assert_called_once()
+
+        variants = generate_thumbnail_variants(self.song)
+        self.assertEqual(variants['source'], self.song.thumbnail.name)
+        # Never upscaled past the 300px source
+        self.assertEqual(sorted(variants['jpeg'], key=int), ['64', '128', '256'])
+        self.assertTrue(self.get(100)['Location'].endswith('cover_128.webp'))
+
+    def test_pick_variant(self):
+        variants = {'jpeg': {'64': 'a_64.jpg', '256': 'a_256.jpg'}, 'webp': {'64': 'a_64.webp'}}
+        self.assertEqual(pick_variant(variants, 100, 'jpeg'), 'a_256.jpg')
+        self.assertEqual(pick_variant(variants, 1000, 'jpeg'), 'a_256.jpg')
+        self.assertEqual(pick_variant(variants, 64, 'webp'), 'a_64.webp')
+        self.assertEqual(pick_variant(variants, 64, 'avif'), 'a_64.jpg')
+        self.assertIsNone(pick_variant({}, 64, 'webp'))
+
+
+class SongBundleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.token = Token.objects.create(user=User.objects.create_user('listener', 'l@example.com', 'pass12345'))
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        overrides = override_settings(MEDIA_ROOT=media_root.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.song = Song(title='Saba boldy', artist='Agamyrat', duration=200)
+        self.song.audio_file.save('saba.m4a', ContentFile(bytes(range(256)) * 40), save=False)
+        self.song.lyrics_file.save('saba.vtt', ContentFile(b'WEBVTT\n'), save=False)
+        self.song.save()
+
+    def get(self, **headers):
+        request = APIRequestFactory().get('/api/songs/bundle/', {'ids': f'{self.song.pk},{self.song.pk}'},
+                                          HTTP_AUTHORIZATION=f'Token {self.token.key}', **headers)
+        response = SongViewSet.as_view({'get': 'bundle'})(request)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_parse_range_header(self):
+        self.assertEqual(parse_range_header('bytes=10-19', 100), (10, 20))
+        self.assertEqual(parse_range_header('bytes=90-', 100), (90, 100))
+        self.assertEqual(parse_range_header('bytes=-10', 100), (90, 100))
+        self.assertEqual(parse_range_header('bytes=50-500', 100), (50, 100))
+        # Malformed or multi-range headers are ignored
+        for header in (None, 'bytes=abc', 'bytes=5-3', 'bytes=-', 'items=0-1', 'bytes=0-1,5-6', 'bytes=+1-2'):
+            self.assertIsNone(parse_range_header(header, 100), header)
+        for header in ('bytes=100-', 'bytes=-0'):
+            with self.assertRaises(ValueError):
+                parse_range_header(header, 100)
+
+    def test_bundle_resumes_with_range(self):
+        response, full = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(full.startswith(b'MLPK'))
+        self.assertEqual(int(response['Content-Length']), len(full))
+
+        response, part = self.get(HTTP_RANGE='bytes=100-', HTTP_IF_RANGE=response['ETag'])
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-{len(full) - 1}/{len(full)}')
+        self.assertEqual(part, full[100:])
+
+        self.assertEqual(self.get(HTTP_RANGE='bytes=100-', HTTP_IF_RANGE='"stale"')[1], full)
+        self.assertEqual(self.get(HTTP_RANGE='bytes=oops')[0].status_code, 200)
+        response, _ = self.get(HTTP_RANGE=f'bytes={len(full)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(full)}')
+
+
+class ImportCatalogTests(TestCase):
+    def setUp(self):
+        media_root, self.library = tempfile.TemporaryDirectory(), tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.addCleanup(self.library.cleanup)
+        overrides = override_settings(MEDIA_ROOT=media_root.name, BACKGROUND_TASKS_EAGER=True)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        for stem in ('Aýna_-_Gyzlar', 'Agamyrat_-_Saba_boldy'):
+            title = stem.split('_-_')[1].replace('_', ' ')
+            lyrics = f'WEBVTT\n\n00:00:01.000 --> 00:00:04.000\n{title} aýdymy\n'.encode()
+            for ext, content in (('.m4a', b'A' * 80000), ('.vtt', lyrics)):
+                with open(os.path.join(self.library.name, stem + ext), 'wb') as f:
+                    f.write(content)
+
+    def import_library(self):
+        call_command('import_catalog', self.library.name, workers=1, stdout=io.StringIO(), stderr=io.StringIO())
+
+    def test_resume_after_losing_the_state_does_not_duplicate(self):
+        self.import_library()
+        self.assertEqual(sorted(Song.objects.values_list('artist', 'title')),
+                         [('Agamyrat', 'Saba boldy'), ('Aýna', 'Gyzlar')])
+        # Indexed although bulk_create sends no post_save
+        gyzlar = Song.objects.get(title='Gyzlar')
+        self.assertEqual(search_lyrics('Gyzlar aýdymy'), [(gyzlar.pk, 1000, 1)])
+        # As if the process died after the insert but before the state write
+        os.remove(os.path.join(self.library.name, '.import_catalog.state'))
+        self.import_library()
+        self.assertEqual(Song.objects.count(), 2)
+
+    def test_raw_aac_is_rewrapped_as_m4a(self):
+        from .management.commands.import_catalog import prepare_audio
+
+        entry = {'key': 'k', 'key_hash': 'abc', 'audio': '/music/song.aac', 'duration': 90}
+        with mock.patch('songs.management.commands.import_catalog.transcode_to_m4a',
+                        side_effect=lambda source, output, copy_audio: output) as transcode:
+            result = prepare_audio(entry, '/tmp/work')
+        self.assertEqual(result, {'key': 'k', 'audio': '/tmp/work/abc.m4a', 'duration': 90})
+        self.assertTrue(transcode.call_args.kwargs['copy_audio'])
+
+
+class SongUploadPageTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        overrides = override_settings(MEDIA_ROOT=media_root.name, BACKGROUND_TASKS_EAGER=True)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def test_working_copy_of_the_audio_is_removed(self):
+        real_mkdtemp = tempfile.mkdtemp
+        work_dirs = []
+
+        def mkdtemp(*args, **kwargs):
+            work_dirs.append(real_mkdtemp(*args, **kwargs))
+            return work_dirs[-1]
+
+        request = RequestFactory().post('/upload/', {
+            'title': 'Gyzlar', 'artist': 'Aýna', 'lyrics_text': '[00:01.00] La',
+            'category': Category.objects.create(name='Pop', slug='pop').pk,
+            'audio_file': SimpleUploadedFile('gyzlar.m4a', b'A' * 1000, content_type='audio/mp4'),
+        })
+        request.user = User.objects.create_superuser('admin', 'admin@example.com', 'pass12345')
+        with mock.patch('tempfile.mkdtemp', mkdtemp):
+            response = upload_song_page(request)
+        self.assertEqual(response.status_code, 302)
+        song = Song.objects.get()
+        with song.audio_file.open('rb') as f:
+            self.assertEqual(f.read(), b'A' * 1000)
+        self.assertEqual(len(work_dirs), 1)
+        self.assertFalse(os.path.exists(work_dirs[0]))
+
+
+class CatalogSnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.root = media_root.name
+        overrides = override_settings(MEDIA_ROOT=media_root.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.song = Song.objects.create(title='Gyzlar', artist='Aýna', audio_file='songs/audio/a.m4a',
+                                        lyrics_file='', duration=200)
+
+    def test_rebuild_keeps_unchanged_version_and_moves_the_pointer(self):
+        first = snapshot.build_catalog_snapshot()
+        self.assertEqual(snapshot.build_catalog_snapshot()['version'], first['version'])
+        with open(os.path.join(self.root, 'catalog', f"catalog-{first['version']}.json"), 'rb') as f:
+            self.assertEqual(json.loads(f.read())['songs'][0]['title'], 'Gyzlar')
+
+        Song.objects.filter(pk=self.song.pk).update(title='Gyzlar (remix)')
+        second = snapshot.build_catalog_snapshot()
+        self.assertNotEqual(second['version'], first['version'])
+        self.assertEqual(snapshot.current_snapshot()['version'], second['version'])
+
+    def test_other_workers_pick_up_the_new_pointer(self):
+        first = snapshot.build_catalog_snapshot()
+        Song.objects.filter(pk=self.song.pk).update(title='Gyzlar (remix)')
+        second = snapshot.build_catalog_snapshot()
+        # This worker still caches the old pointer; it expires quickly
+        cache.set(snapshot.POINTER_CACHE_KEY, first, snapshot.POINTER_CACHE_SECONDS)
+        self.assertEqual(snapshot.current_snapshot()['version'], first['version'])
+        later = time.time() + snapshot.POINTER_CACHE_SECONDS + 1
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=later):
+            self.assertEqual(snapshot.current_snapshot()['version'], second['version'])
+
+    def test_pointer_is_replaced_in_place(self):
+        snapshot.build_catalog_snapshot()
+        Song.objects.filter(pk=self.song.pk).update(title='Gyzlar (remix)')
+        with mock.patch.object(snapshot.default_storage, 'delete', wraps=snapshot.default_storage.delete) as delete:
+            second = snapshot.build_catalog_snapshot()
+        self.assertNotIn(mock.call(snapshot.POINTER_NAME), delete.call_args_list)
+        self.assertEqual([n for n in os.listdir(os.path.join(self.root, 'catalog')) if n.startswith(('current', '.'))],
+                         ['current.json'])
+        cache.clear()
+        self.assertEqual(snapshot.current_snapshot()['version'], second['version'])
+
+    def test_endpoint_queues_the_first_build_instead_of_building_inline(self):
+        user = User.objects.create_user('listener', 'listener@example.com', 'pass12345')
+        request = APIRequestFactory().get('/api/catalog/snapshot/',
+                                          HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+        view = CatalogViewSet.as_view({'get': 'snapshot'})
+        with mock.patch('songs.views.request_catalog_snapshot') as queue:
+            response = view(request)
+        self.assertEqual((response.status_code, response['Retry-After']), (503, '5'))
+        queue.assert_called_once_with()
+
+        snapshot.build_catalog_snapshot()
+        self.assertEqual(view(request).data['song_count'], 1)
+
+    def test_prune_keeps_recently_replaced_snapshots(self):
+        directory = os.path.join(self.root, 'catalog')
+        os.makedirs(directory)
+        now = time.time()
+        ages = {'a': 5, 'b': 4, 'c': 3, 'd': 2 * 3600, 'e': 3 * 3600, 'f': 4 * 3600}
+        for version, age in ages.items():
+            path = os.path.join(directory, f'catalog-{version}.json')
+            with open(path, 'w') as f:
+                f.write('{}')
+            os.utime(path, (now - age, now - age))
+        snapshot._prune_old_snapshots(snapshot.default_storage, 'a')
+        # d was replaced by c seconds ago; e and f were replaced hours ago
+        self.assertEqual(sorted(os.listdir(directory)),
+                         ['catalog-a.json', 'catalog-b.json', 'catalog-c.json', 'catalog-d.json'])
+
+
+class CompressionTests(TestCase):
+    def compress(self, response, accept='gzip', method='get'):
+        request = getattr(RequestFactory(), method)('/', HTTP_ACCEPT_ENCODING=accept)
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def json_response(self, size=2000, **headers):
+        response = HttpResponse(json.dumps({'lyrics': 'la ' * (size // 3)}), content_type='application/json')
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+    def test_negotiation_honours_q_values(self):
+        self.assertEqual(parse_accept_encoding('gzip;q=0.5, br , *;q=0, bad;q=x'),
+                         {'gzip': 0.5, 'br': 1.0, '*': 0.0})
+        self.assertEqual(choose_encoding('gzip, br;q=0.5'), 'gzip')
+        self.assertEqual(choose_encoding('gzip;q=0.8, zstd;q=0.8, br;q=0.8'), 'br')  # server preference
+        self.assertEqual(choose_encoding('*'), 'br')
+        self.assertEqual(choose_encoding('br;q=0, *;q=0.1'), 'zstd')
+        self.assertIsNone(choose_encoding('identity'))
+        self.assertIsNone(choose_encoding(None))
+
+    def test_only_large_compressible_full_responses_are_encoded(self):
+        response = self.compress(self.json_response(ETag='"v1"'), accept='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(int(response['Content-Length']), len(response.content))
+        self.assertEqual(json.loads(gzip.decompress(response.content))['lyrics'][:3], 'la ')
+        self.assertEqual((response['ETag'], response['Vary']), ('W/"v1"', 'Accept-Encoding'))
+
+        small = self.compress(self.json_response(size=100))
+        self.assertFalse(small.has_header('Content-Encoding'))
+        self.assertEqual(small['Vary'], 'Accept-Encoding')
+        for response in (
+            self.json_response(**{'Cache-Control': 'no-transform'}),
+            HttpResponse('<p>x</p>' * 500, content_type='text/html'),
+            HttpResponse(b'\0' * 5000, content_type='audio/mp4'),
+            StreamingHttpResponse(iter([b'{}'] * 1000), content_type='application/json'),
+        ):
+            self.assertFalse(self.compress(response).has_header('Content-Encoding'))
+        partial = self.json_response()
+        partial.status_code = 206
+        self.assertFalse(self.compress(partial).has_header('Content-Encoding'))
+        self.assertFalse(self.compress(self.json_response(), method='head').has_header('Content-Encoding'))
+
+    def test_api_responses_are_compressed_end_to_end(self):
+        user = User.objects.create_user('listener', 'listener@example.com', 'pass12345')
+        for i in range(20):
+            Song.objects.create(title=f'Song {i}', artist='Aýna', audio_file=f'songs/audio/{i}.m4a',
+                                lyrics_file='', duration=100)
+        auth = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=user).key}'}
+        plain = self.client.get('/api/songs/', **auth)
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        response = self.client.get('/api/songs/', HTTP_ACCEPT_ENCODING='deflate, gzip;q=0.9', **auth)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+
+
+class FastJSONRendererTests(SimpleTestCase):
+    def test_output_is_byte_identical_to_drf(self):
+        data = {
+            'text': 'Ýüregiň </script> & \u2028line\u2029para \U0001f3a4',
+            'when': datetime(2026, 1, 2, 3, 4, 5, 678901, tzinfo=dt_timezone.utc),
+            'naive': datetime(2026, 1, 2, 3, 4, 5),
+            'day': date(2026, 1, 2),
+            'price': Decimal('1.10'),
+            'id': uuid.UUID('01890a5d-ac96-774b-bcce-b302099a8057'),
+            'detail': gettext_lazy('Invalid page.'),
+            'numbers': [0, -1, 1.5, 0.1, 2 ** 70, True, None],
+            7: {'nested': ('tuple',)},
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(FastJSONRenderer().render([data, data]), JSONRenderer().render([data, data]))
+
+
+class RoleTests(SimpleTestCase):
+    def test_api_role_refuses_upload_bodies_unread(self):
+        middleware = RejectUploadsMiddleware(lambda request: HttpResponse('ok'))
+        factory = RequestFactory()
+        upload = factory.post('/api/recordings/', {'song': '1'})
+        self.assertEqual(middleware(upload).status_code, 415)
+        self.assertFalse(upload._read_started)
+        big = factory.post('/api/favorites/batch/', b'{}', content_type='application/json',
+                           CONTENT_LENGTH=str(10 * 1024 * 1024))
+        self.assertEqual(middleware(big).status_code, 413)
+        json = factory.post('/api/favorites/batch/', b'{}', content_type='application/json')
+        self.assertEqual(middleware(json).status_code, 200)
+
+    def test_api_urlconf_has_no_admin_or_upload_routes(self):
+        self.assertTrue(reverse('song-list', urlconf='config.urls_api'))
+        for name in ('admin:index', 'upload_song'):
+            with self.assertRaises(NoReverseMatch):
+                reverse(name, urlconf='config.urls_api')
+
+    def test_media_role_serves_ranges(self):
+        with tempfile.TemporaryDirectory() as root:
+            with open(f'{root}/song.m4a', 'wb') as f:
+                f.write(bytes(range(256)) * 4)
+            with override_settings(MEDIA_ROOT=root):
+                request = RequestFactory().get('/media/song.m4a', HTTP_RANGE='bytes=10-19')
+                response = serve_media_file(request, 'song.m4a')
+                body = b''.join(response.streaming_content)
+                response.close()
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/1024')
+        self.assertEqual(body, bytes(range(10, 20)))
+
+
+class UploadLimitTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('singer', 'singer@example.com', 'pass12345')
+        cls.token = Token.objects.create(user=cls.user)
+        cls.profile = UserProfile.objects.create(user=cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_token_bucket_allows_burst_then_waits(self):
+        waits = [take_tokens(cache, 'bucket', per_second=1, burst=3) for _ in range(4)]
+        self.assertEqual(waits[:3], [0, 0, 0])
+        self.assertGreater(waits[3], 0)
+
+        broken = mock.Mock(**{'get.side_effect': ConnectionError('down')})
+        with self.assertLogs('songs.limits', 'WARNING'):
+            waits = [take_tokens(broken, 'local', per_second=1, burst=2) for _ in range(3)]
+        self.assertEqual(waits[:2], [0, 0])
+        self.assertGreater(waits[2], 0)
+
+    def test_storage_used_follows_recordings(self):
+        recording = Recording.objects.create(user=self.user, recording_id='r1',
+                                             audio_file='myrecordings/r1.m4a', audio_size=1500)
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.storage_used, 1500)
+        recording.delete()
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.storage_used, 0)
+
+    def test_over_limit_uploads_are_refused_unread(self):
+        view = RecordingViewSet.as_view({'post': 'create'})
+        auth = {'HTTP_AUTHORIZATION': f'Token {self.token.key}'}
+        UserProfile.objects.filter(pk=self.profile.pk).update(storage_used=200 * 1024 * 1024)
+        request = RequestFactory().post('/api/recordings/', {'song': '1'}, **auth)
+        self.assertEqual(view(request).status_code, 413)
+        self.assertFalse(request._read_started)
+
+        for _ in range(9):
+            view(RequestFactory().post('/api/recordings/', {'song': '1'}, **auth))
+        request = RequestFactory().post('/api/recordings/', {'song': '1'}, **auth)
+        response = view(request)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertFalse(request._read_started)
+
+
+class AnalyticsEventTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('listener', 'listener@example.com', 'pass12345')
+        cls.token = Token.objects.create(user=cls.user)
+        cls.song = Song.objects.create(title='Gyzlar', artist='Aýna', audio_file='songs/audio/a.m4a',
+                                       lyrics_file='songs/audio/a.vtt', duration=200)
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(analytics.flush_events)
+
+    def send(self, events, **headers):
+        request = APIRequestFactory().post('/api/events/', {'events': events}, format='json', **headers)
+        return EventViewSet.as_view({'post': 'create'})(request)
+
+    def test_events_are_buffered_then_written_with_daily_rollups(self):
+        auth = {'HTTP_AUTHORIZATION': f'Token {self.token.key}'}
+        events = [
+            {'type': 'play', 'song': self.song.pk},
+            {'type': 'complete', 'song': self.song.pk, 'position_ms': 200000},
+            {'type': 'play', 'song': 999999},
+            {'type': 'dance', 'song': self.song.pk},
+            {'type': 'play', 'song': self.song.pk, 'ts': 1000},
+        ]
+        response = self.send(events, **auth)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data, {'accepted': 3, 'rejected': 2})
+        self.assertFalse(SongEvent.objects.exists())
+
+        with self.assertNumQueries(5):  # song ids, savepoint, events, rollups, release
+            self.assertEqual(analytics.flush_events(), 2)
+        self.send([{'type': 'play', 'song': self.song.pk}], **auth)
+        analytics.flush_events()
+
+        stats = SongDailyStats.objects.get(song=self.song)
+        self.assertEqual((stats.plays, stats.completions, stats.seeks), (2, 1, 0))
+        self.assertEqual(SongEvent.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(self.send([{'type': 'play', 'song': self.song.pk}]).status_code, 403)
+
+    def test_only_database_outages_keep_the_batch(self):
+        analytics.record_events([(self.song.pk, 'play', 0, timezone.now())])
+        with mock.patch('songs.analytics._write_events', side_effect=IntegrityError('user deleted')), \
+                self.assertLogs('songs.analytics', 'ERROR'):
+            self.assertEqual(analytics.flush_events(), 0)
+        self.assertEqual(analytics._buffer, [])
+
+        analytics.record_events([(self.song.pk, 'play', 0, timezone.now())])
+        with mock.patch('songs.analytics._write_events', side_effect=OperationalError('locked')), \
+                self.assertLogs('songs.analytics', 'ERROR'):
+            for _ in range(analytics.MAX_FLUSH_ATTEMPTS - 1):
+                analytics.flush_events()
+                self.assertEqual(len(analytics._buffer), 1)
+            analytics.flush_events()
+        self.assertEqual(analytics._buffer, [])
+
+    @override_settings(ANALYTICS_FLUSH_SIZE=2, BACKGROUND_TASKS_EAGER=True)
+    def test_buffer_flushes_at_size_threshold(self):
+        auth = {'HTTP_AUTHORIZATION': f'Token {self.token.key}'}
+        self.send([{'type': 'play', 'song': self.song.pk}], **auth)
+        self.assertFalse(SongEvent.objects.exists())
+        self.send([{'type': 'record_start', 'song': self.song.pk}], **auth)
+        self.assertEqual(SongEvent.objects.count(), 2)
+        self.assertEqual(SongDailyStats.objects.get(song=self.song).recordings_started, 1)
+
+
+class SongRankingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('listener', 'listener@example.com', 'pass12345')
+        cls.token = Token.objects.create(user=cls.user)
+        cls.classic, cls.new_hit, cls.quiet = [
+            Song.objects.create(title=title, artist='Aýna', audio_file=f'songs/audio/{title}.m4a',
+                                lyrics_file='', duration=200)
+            for title in ('classic', 'new_hit', 'quiet')
+        ]
+        today = timezone.localdate()
+        SongDailyStats.objects.create(song=cls.classic, day=today - timedelta(days=60), plays=200)
+        for i in range(5):
+            Recording.objects.create(user=cls.user, song=cls.new_hit, recording_id=f'r{i}',
+                                     audio_file=f'myrecordings/r{i}.m4a', audio_size=1)
+        Favorite.objects.create(user=cls.user, song=cls.new_hit)
+
+    def setUp(self):
+        cache.clear()
+
+    def list_ids(self, ordering):
+        request = APIRequestFactory().get('/api/songs/', {'ordering': ordering},
+                                          HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        response = SongViewSet.as_view({'get': 'list'})(request)
+        if response.status_code != 200:
+            return response.status_code
+        return [song['id'] for song in response.data['results']]
+
+    def test_refresh_ranks_by_decayed_activity(self):
+        with self.assertNumQueries(7):  # 3 aggregates, song ids, savepoint, upsert, release
+            self.assertEqual(refresh_song_ranks(), 3)
+        self.assertIsNone(schedule_rank_refresh())
+
+        ranks = {rank.song_id: rank for rank in SongRank.objects.all()}
+        self.assertEqual(ranks[self.quiet.pk].trending_score, 0)
+        self.assertEqual(self.list_ids('trending'), [self.new_hit.pk, self.classic.pk, self.quiet.pk])
+        self.assertEqual(self.list_ids('popular'), [self.classic.pk, self.new_hit.pk, self.quiet.pk])
+        self.assertEqual(self.list_ids('loudest'), 400)
+
+        # Listed after the ranked songs until the next refresh
+        late = Song.objects.create(title='late', artist='Aýna', audio_file='songs/audio/late.m4a',
+                                   lyrics_file='', duration=100)
+        self.assertEqual(self.list_ids('trending')[3:], [late.pk])
+        refresh_song_ranks()
+        self.assertEqual(self.list_ids('trending')[2:], [late.pk, self.quiet.pk])
+
+    def test_lists_are_complete_before_the_first_refresh(self):
+        with mock.patch('songs.ranking.tasks.submit') as submit:
+            self.assertEqual(self.list_ids('popular'), [self.quiet.pk, self.new_hit.pk, self.classic.pk])
+        self.assertEqual(submit.call_count, 1)
+
+        # A worker whose cache doesn't know about another's refresh skips it
+        refresh_song_ranks()
+        cache.clear()
+        with override_settings(BACKGROUND_TASKS_EAGER=True), \
+                mock.patch('songs.ranking.refresh_song_ranks') as refresh:
+            schedule_rank_refresh()
+        refresh.assert_not_called()
+
+
+class RecommendationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.songs = {
+            name: Song.objects.create(title=name, artist='Aýna', audio_file=f'songs/audio/{name}.m4a',
+                                      lyrics_file='', duration=200)
+            for name in 'abcd'
+        }
+        histories = {'ata': 'ab', 'bagt': 'abc', 'cemen': 'cd', 'listener': 'a'}
+        for username, names in histories.items():
+            user = User.objects.create_user(username, f'{username}@example.com', 'pass12345')
+            for name in names:
+                Favorite.objects.create(user=user, song=cls.songs[name])
+        cls.user = user
+        cls.token = Token.objects.create(user=user)
+        cls.newcomer = Token.objects.create(user=User.objects.create_user('new', 'new@example.com', 'pass12345'))
+
+    def get(self, path, token, action, **kwargs):
+        request = APIRequestFactory().get(path, HTTP_AUTHORIZATION=f'Token {token.key}')
+        response = SongViewSet.as_view({'get': action})(request, **kwargs)
+        if response.status_code != 200:
+            return response.status_code
+        return ''.join(song['title'] for song in response.data)
+
+    def test_cosine_neighbors_with_shrinkage(self):
+        neighbors = compute_neighbors({1: {10, 20}, 2: {10, 20, 30}, 3: {30, 40}}, k=2)
+        self.assertEqual([song for song, _ in neighbors[10]], [20, 30])
+        self.assertAlmostEqual(neighbors[10][0][1], 1.0)
+        shrunk = compute_neighbors({1: {10, 20}}, k=2, shrinkage=1.0)
+        self.assertAlmostEqual(shrunk[10][0][1], 0.5)
+
+    def test_similar_and_recommended_read_the_index(self):
+        self.assertEqual(build_song_similarity(), 4)
+        a = self.songs['a'].pk
+        with self.assertNumQueries(4):  # token, neighbours, songs, favorites
+            self.assertEqual(self.get(f'/api/songs/{a}/similar/', self.token, 'similar', pk=a), 'bc')
+        self.assertEqual(self.get('/api/songs/999999/similar/', self.token, 'similar', pk=999999), 404)
+        self.assertEqual(self.get('/api/songs/recommended/', self.token, 'recommended'), 'bc')
+
+        # No history: most popular songs instead
+        refresh_song_ranks()
+        self.assertEqual(self.get('/api/songs/recommended/?limit=1', self.newcomer, 'recommended'), 'a')
+
+
+class LyricsSearchTests(TestCase):
+    VTT = """WEBVTT
+
+00:00:10.424 --> 00:00:10.425
+[LINE-START]
+
+00:00:15.626 --> 00:00:18.206
+Gülüm ýatsak
+
+00:00:18.206 --> 00:00:18.706
+saçym ýolgun
+
+00:01:02.100 --> 00:01:03.000
+<v Singer>Tur gaýt oglan
+
+00:01:03.000 --> 00:01:04.000
+saba boldy
+"""
+
+    def test_parsing_and_folding(self):
+        self.assertEqual(fold('Ýüregiň Əli ıssy'), 'yuregin eli issy')
+        self.assertEqual(parse_vtt(self.VTT)[:4],
+                         [('gulum', 15626), ('yatsak', 15626), ('sacym', 18206), ('yolgun', 18206)])
+        self.assertEqual(parse_lrc('[ar:Aýna]\n[00:12.50]Saba <00:13.00>boldy'),
+                         [('saba', 12500), ('boldy', 13000)])
+
+    def test_lyrics_are_indexed_on_save_and_searched_by_phrase(self):
+        user = User.objects.create_user('listener', 'listener@example.com', 'pass12345')
+        token = Token.objects.create(user=user)
+        with tempfile.TemporaryDirectory() as root, \
+                override_settings(MEDIA_ROOT=root, BACKGROUND_TASKS_EAGER=True):
+            song = Song(title='Saba boldy', artist='Agamyrat', audio_file='songs/audio/s.m4a', duration=200)
+            song.lyrics_file.save('saba.vtt', ContentFile(self.VTT.encode()), save=False)
+            with self.captureOnCommitCallbacks(execute=True):
+                song.save()
+        song.refresh_from_db()
+        self.assertEqual(song.lyrics_indexed, song.lyrics_file.name)
+
+        def search(q):
+            request = APIRequestFactory().get('/api/songs/search/', {'q': q},
+                                              HTTP_AUTHORIZATION=f'Token {token.key}')
+            response = SongViewSet.as_view({'get': 'search'})(request)
+            return [(item['id'], item['start_ms']) for item in response.data]
+
+        with self.assertNumQueries(4):  # token, postings, songs, favorites
+            self.assertEqual(search('gaýt oglan SABA'), [(song.pk, 62100)])
+        self.assertEqual(search('SACYM YOLGUN'), [(song.pk, 18206)])
+        self.assertEqual(search('boldy saba'), [])
+        self.assertEqual(search('line start'), [])
+
+
+class KeyShiftTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('singer', 'singer@example.com', 'pass12345')
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        media_root, cache_dir = tempfile.TemporaryDirectory(), tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.addCleanup(cache_dir.cleanup)
+        self.cache_dir = cache_dir.name
+        overrides = override_settings(MEDIA_ROOT=media_root.name, KEY_SHIFT_CACHE_DIR=cache_dir.name,
+                                     BACKGROUND_TASKS_EAGER=True)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.song = Song(title='Saba boldy', artist='Agamyrat', lyrics_file='', duration=200)
+        self.song.audio_file.save('saba.m4a', ContentFile(bytes(range(256)) * 4), save=False)
+        self.song.save()
+
+    def get(self, semitones, **headers):
+        request = APIRequestFactory().get(f'/api/songs/{self.song.pk}/audio/', {'semitones': semitones},
+                                          HTTP_AUTHORIZATION=f'Token {self.token.key}', **headers)
+        return SongViewSet.as_view({'get': 'audio'})(request, pk=self.song.pk)
+
+    def variants(self):
+        return [name for name in os.listdir(self.cache_dir) if not name.startswith('.')]
+
+    @mock.patch('songs.keyshift.key_shift_command', lambda source, output, semitones: ['cp', source, output])
+    def test_variant_is_rendered_once_then_served_with_ranges(self):
+        self.assertEqual(self.get(-2).status_code, 202)
+        self.assertEqual(len(self.variants()), 1)
+        # Found by a worker whose cache never saw the render
+        cache.clear()
+        with mock.patch('songs.keyshift.render_key_shift') as render:
+            response = self.get(-2, HTTP_RANGE='bytes=0-9')
+        render.assert_not_called()
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(10)))
+        self.assertEqual(self.get(0).status_code, 302)
+        self.assertEqual(self.get(7).status_code, 400)
+
+    @mock.patch('songs.keyshift.key_shift_command', lambda source, output, semitones: ['false'])
+    def test_failed_render_is_reported_then_retried(self):
+        with self.assertLogs('songs.tasks', 'ERROR'):
+            self.assertEqual(self.get(3).status_code, 202)
+        response = self.get(3)
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('ffmpeg failed', response.data['detail'])
+        self.assertTrue(0 < int(response['Retry-After']) <= 600)
+
+        failed = [name for name in os.listdir(os.path.join(self.cache_dir, '.state')) if name.endswith('.failed')]
+        os.utime(os.path.join(self.cache_dir, '.state', failed[0]), (0, 0))
+        with mock.patch('songs.keyshift.tasks.submit') as submit:
+            self.assertEqual(self.get(3).status_code, 202)
+        self.assertEqual(submit.call_count, 1)
+
+    def test_concurrent_requests_collapse_and_cache_is_bounded(self):
+        with mock.patch('songs.keyshift.tasks.submit') as submit:
+            schedule_key_shift(self.song, 3)
+            schedule_key_shift(self.song, 3)
+        self.assertEqual(submit.call_count, 1)
+
+        # A live lock is left alone; one abandoned by a crashed render is taken over
+        lock = os.path.join(self.cache_dir, '.state',
+                            next(name for name in os.listdir(os.path.join(self.cache_dir, '.state'))
+                                 if name.endswith('.lock')))
+        inode = os.stat(lock).st_ino
+        with mock.patch('songs.keyshift.tasks.submit') as submit:
+            schedule_key_shift(self.song, 3)
+            self.assertEqual(os.stat(lock).st_ino, inode)
+            os.utime(lock, (0, 0))
+            schedule_key_shift(self.song, 3)
+        self.assertEqual(submit.call_count, 1)
+        self.assertLess(time.time() - os.stat(lock).st_mtime, 60)
+
+        for i, name in enumerate(['old.m4a', 'recent.m4a', 'newest.m4a']):
+            path = os.path.join(self.cache_dir, name)
+            with open(path, 'wb') as f:
+                f.write(b'x' * 100)
+            os.utime(path, (1000 + i, 1000))
+        self.assertEqual(evict_key_shift_cache(max_bytes=250), 200)
+        self.assertEqual(sorted(self.variants()), ['newest.m4a', 'recent.m4a'])
@@ -0,0 +1,179 @@
+"""
+Resized, compressed derivatives of ``Song.thumbnail``.
+
+The uploaded image is decoded once and written out as a small set of
+square-bounded variants (WebP, AVIF when Pillow supports it, and a JPEG
+fallback).  The storage paths are recorded on ``Song.thumbnail_variants``:
+
+    {
+        "source": "songs/thumbnails/cover.png",
+        "webp": {"64": "songs/thumbnails/variants/7/cover_64.webp", ...},
+        "jpeg": {"64": "songs/thumbnails/variants/7/cover_64.jpg", ...},
+    }
+"""
+import io
+import logging
+import os
+
+from django.core.files.base import ContentFile
+
+from . import tasks
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZES = (64, 128, 256, 512)
+
+# format name -> (Pillow format, extension, save options)
+THUMBNAIL_FORMATS = {
+    'avif': ('AVIF', 'avif', {'quality': 55, 'speed': 8}),
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def available_formats():
+    # Pillow is only imported by the functions that use it, so API workers
+    # that never resize an image don't load it at startup
+    from PIL import features
+
+    formats = []
+    if features.check('avif'):
+        formats.append('avif')
+    if features.check('webp'):
+        formats.append('webp')
+    formats.append('jpeg')
+    return formats
+
+
+def variants_are_current(song):
+    variants = song.thumbnail_variants or {}
+    return bool(song.thumbnail) and variants.get('source') == song.thumbnail.name
+
+
+def _variant_name(song, size, ext):
+    stem = os.path.splitext(os.path.basename(song.thumbnail.name))[0]
+    return f"songs/thumbnails/variants/{song.pk}/{stem}_{size}.{ext}"
+
+
+def _encode(image, fmt):
+    from PIL import Image
+
+    pil_format, _, options = THUMBNAIL_FORMATS[fmt]
+    if pil_format == 'JPEG' and image.mode != 'RGB':
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A') if 'A' in image.getbands() else None)
+        image = background
+    buffer = io.BytesIO()
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def generate_thumbnail_variants(song):
+    """Decode the song thumbnail once and store every size/format variant."""
+    from PIL import Image
+
+    from .models import Song
+
+    if not song.thumbnail:
+        return {}
+
+    storage = song.thumbnail.storage
+    with song.thumbnail.open('rb') as f:
+        source = Image.open(f)
+        source.load()
+
+    if source.mode not in ('RGB', 'RGBA'):
+        source = source.convert('RGBA' if 'A' in source.getbands() else 'RGB')
+
+    # Never upscale, but always produce at least the smallest size
+    largest = max(source.size)
+    sizes = [s for s in THUMBNAIL_SIZES if s <= largest] or [THUMBNAIL_SIZES[0]]
+
+    variants = {'source': song.thumbnail.name}
+    for size in sizes:
+        resized = source.copy()
+        resized.thumbnail((size, size), Image.Resampling.LANCZOS)
+        for fmt in available_formats():
+            name = _variant_name(song, size, THUMBNAIL_FORMATS[fmt][1])
+            if storage.exists(name):
+                storage.delete(name)
+            stored = storage.save(name, ContentFile(_encode(resized, fmt)))
+            variants.setdefault(fmt, {})[str(size)] = stored
+
+    Song.objects.filter(pk=song.pk, thumbnail=song.thumbnail.name).update(
+        thumbnail_variants=variants)
+    song.thumbnail_variants = variants
+
+    # update() sends no post_save, but the catalog snapshot embeds the srcset
+    from .snapshot import request_catalog_snapshot
+    request_catalog_snapshot()
+    return variants
+
+
+def _generate_for_pk(song_id):
+    from .models import Song
+
+    song = Song.objects.filter(pk=song_id).first()
+    if song is None or variants_are_current(song):
+        return song.thumbnail_variants if song else {}
+    return generate_thumbnail_variants(song)
+
+
+def schedule_thumbnail_variants(song):
+    """Queue variant generation on the background worker (deduplicated)."""
+    if not song.thumbnail or variants_are_current(song):
+        return None
+    return schedule_thumbnail_variants_by_id(song.pk)
+
+
+def schedule_thumbnail_variants_by_id(song_id):
+    return tasks.submit(_generate_for_pk, song_id, key=('thumbnail', song_id))
+
+
+def current_thumbnail_variants(song):
+    """
+    The song's variants if they are current, else {} after queueing their
+    generation. Never waits for the worker, so callers fall back to the
+    original image until the variants exist.
+    """
+    if variants_are_current(song):
+        return song.thumbnail_variants
+    schedule_thumbnail_variants(song)
+    return {}
+
+
+def pick_variant(variants, size, fmt):
+    """Smallest stored variant that is at least ``size`` px (or the largest)."""
+    by_size = variants.get(fmt) or variants.get('jpeg') or {}
+    if not by_size:
+        return None
+    sizes = sorted(int(s) for s in by_size)
+    chosen = next((s for s in sizes if s >= size), sizes[-1])
+    return by_size[str(chosen)]
+
+
+def thumbnail_srcset(song, request=None):
+    """
+    ``{format: {size: url}}`` for the API.  Empty until the variants exist;
+    a missing set is queued for generation so the next request gets it.
+    """
+    if not song.thumbnail:
+        return {}
+    if not variants_are_current(song):
+        schedule_thumbnail_variants(song)
+        return {}
+    absolute = request.build_absolute_uri if request else None
+    return variants_srcset(song.thumbnail_variants, song.thumbnail.storage, absolute)
+
+
+def variants_srcset(variants, storage, absolute=None):
+    """``{format: {size: url}}`` for a current ``thumbnail_variants`` dict."""
+    srcset = {}
+    for fmt, by_size in variants.items():
+        if fmt == 'source':
+            continue
+        srcset[fmt] = {}
+        for size, name in by_size.items():
+            url = storage.url(name)
+            srcset[fmt][size] = absolute(url) if absolute else url
+    return srcset
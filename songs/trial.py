@@ -0,0 +1,76 @@
+"""
+Signed, self-contained trial tokens for anonymous catalog access.
+
+A device registers once (the only time `TrialSession` is created) and gets
+back a token carrying its device id and trial expiry, signed with HMAC via
+``django.core.signing``.  Every later request checks the signature and expiry
+in memory.
+
+Revoking a trial ends it in the database (TrialSession.trial_end_date), which
+is the source of truth. Whether a device is still active is cached for
+TRIAL_STATUS_CACHE_SECONDS, so each worker reads a device's row at most once
+per interval. A revocation takes effect at once on the worker that made it
+and within that interval everywhere else, with or without a shared cache.
+"""
+import hashlib
+import time
+from datetime import timedelta
+
+from django.core import signing
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import TrialSession
+
+TRIAL_DAYS = 7
+TRIAL_TOKEN_HEADER = 'X-Trial-Token'
+TRIAL_STATUS_CACHE_SECONDS = 60
+_SALT = 'songs.trial'
+
+
+def _status_key(device_id):
+    return 'trial-active:' + hashlib.sha256(device_id.encode()).hexdigest()[:16]
+
+
+def _trial_is_active(device_id):
+    key = _status_key(device_id)
+    active = cache.get(key)
+    if active is None:
+        active = TrialSession.objects.filter(device_id=device_id, trial_end_date__gt=timezone.now()).exists()
+        cache.set(key, active, TRIAL_STATUS_CACHE_SECONDS)
+    return active
+
+
+def issue_trial_token(device_id):
+    """Return (token, trial_end_date), creating the TrialSession on first use."""
+    session, _ = TrialSession.objects.get_or_create(
+        device_id=device_id,
+        defaults={'trial_end_date': timezone.now() + timedelta(days=TRIAL_DAYS)}
+    )
+    token = signing.dumps(
+        {'d': session.device_id, 'e': int(session.trial_end_date.timestamp())},
+        salt=_SALT
+    )
+    return token, session.trial_end_date
+
+
+def verify_trial_token(token):
+    """Device id for a valid, unexpired, unrevoked token, else None."""
+    if not token:
+        return None
+    try:
+        payload = signing.loads(token, salt=_SALT)
+    except signing.BadSignature:
+        return None
+    if payload.get('e', 0) <= time.time():
+        return None
+    if not _trial_is_active(payload['d']):
+        return None
+    return payload['d']
+
+
+def revoke_trial(device_id):
+    """End a device's trial now; its tokens stop working within TRIAL_STATUS_CACHE_SECONDS."""
+    revoked = TrialSession.objects.filter(device_id=device_id).update(trial_end_date=timezone.now())
+    cache.set(_status_key(device_id), False, TRIAL_STATUS_CACHE_SECONDS)
+    return bool(revoked)
@@ -0,0 +1,187 @@
+"""
+Direct recording uploads that bypass the API workers.
+
+1. ``POST /api/recordings/upload_url/`` returns a short-lived signed PUT
+   target for a fresh storage key.  With object storage that is a pre-signed
+   bucket URL; on local disk it is ``/upload/recordings/<token>/``, handled by
+   `recording_upload`, which streams the body to storage in chunks.
+2. The client PUTs the audio there.
+3. ``POST /api/recordings/finalize/`` checks the stored object's size and
+   content type and creates the Recording row.
+
+Objects that are uploaded but never finalized are removed by
+`purge_abandoned_uploads` (``manage.py purge_uploads``) once their token
+has expired.
+
+The upload token is signed with ``django.core.signing`` and carries the
+user, song, storage key and content type, so no state is kept between the
+steps.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.http import HttpResponse, HttpResponseNotAllowed
+from django.urls import reverse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+
+from .ids import new_recording_id
+from .limits import StorageQuotaExceeded, check_storage_quota
+
+UPLOAD_URL_EXPIRE = 15 * 60
+UPLOAD_DIR = 'myrecordings'
+_SALT = 'songs.uploads'
+
+# Accepted recording formats -> stored file extension
+RECORDING_CONTENT_TYPES = {
+    'audio/mp4': '.m4a',
+    'audio/x-m4a': '.m4a',
+    'audio/aac': '.aac',
+    'audio/mpeg': '.mp3',
+    'audio/wav': '.wav',
+}
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def max_recording_bytes():
+    return getattr(settings, 'RECORDING_UPLOAD_MAX_BYTES', 100 * 1024 * 1024)
+
+
+def create_upload(request, song, content_type):
+    """Signed PUT target for a new recording of ``song`` by ``request.user``."""
+    content_type = (content_type or '').split(';', 1)[0].strip().lower()
+    if content_type not in RECORDING_CONTENT_TYPES:
+        raise UploadError(f"Unsupported content type. Use one of: {', '.join(RECORDING_CONTENT_TYPES)}")
+
+    recording_id = new_recording_id()
+    key = f"{UPLOAD_DIR}/recording_{recording_id}{RECORDING_CONTENT_TYPES[content_type]}"
+    token = signing.dumps({
+        'u': request.user.pk,
+        's': song.pk,
+        'r': recording_id,
+        'k': key,
+        't': content_type,
+    }, salt=_SALT)
+
+    if hasattr(default_storage, 'presigned_put_url'):
+        url = default_storage.presigned_put_url(key, content_type, expire=UPLOAD_URL_EXPIRE)
+    else:
+        # Served by the ingest role, which may be on another host
+        path = reverse('recording_upload', urlconf='config.urls_ingest', args=[token])
+        if settings.INGEST_URL:
+            url = settings.INGEST_URL.rstrip('/') + path
+        else:
+            url = request.build_absolute_uri(path)
+
+    return {
+        'upload_id': token,
+        'method': 'PUT',
+        'url': url,
+        'headers': {'Content-Type': content_type},
+        'max_bytes': max_recording_bytes(),
+        'expires_at': int(time.time()) + UPLOAD_URL_EXPIRE,
+    }
+
+
+def read_upload(token, user=None):
+    """Payload of a valid upload token (for ``user`` if given)."""
+    try:
+        payload = signing.loads(token, salt=_SALT, max_age=UPLOAD_URL_EXPIRE)
+    except signing.SignatureExpired:
+        raise UploadError("Upload URL expired", status=410)
+    except signing.BadSignature:
+        raise UploadError("Invalid upload id", status=403)
+    if user is not None and payload['u'] != user.pk:
+        raise UploadError("Invalid upload id", status=403)
+    return payload
+
+
+def check_uploaded_file(payload):
+    """Size of the uploaded object after checking it exists, fits and has the right type."""
+    key = payload['k']
+    if not default_storage.exists(key):
+        raise UploadError("Nothing has been uploaded yet", status=409)
+
+    size = default_storage.size(key)
+    problem = None
+    if size == 0:
+        problem = "Uploaded file is empty"
+    elif size > max_recording_bytes():
+        problem = "Uploaded file is too large"
+    elif hasattr(default_storage, 'content_type'):
+        # Local uploads are checked by recording_upload before they are stored
+        if default_storage.content_type(key) != payload['t']:
+            problem = "Uploaded file has the wrong content type"
+    if problem:
+        default_storage.delete(key)
+        raise UploadError(problem)
+    return size
+
+
+def purge_abandoned_uploads(now=None, batch=500):
+    """
+    Delete uploaded objects without a Recording whose upload token has
+    expired (so they can no longer be finalized). Returns how many went.
+    """
+    from .models import Recording
+
+    try:
+        _, files = default_storage.listdir(UPLOAD_DIR)
+    except FileNotFoundError:
+        return 0
+    cutoff = (now or timezone.now()) - timedelta(seconds=UPLOAD_URL_EXPIRE)
+    names = [f'{UPLOAD_DIR}/{name}' for name in files if name.startswith('recording_')]
+    removed = 0
+    for start in range(0, len(names), batch):
+        chunk = names[start:start + batch]
+        finalized = set(Recording.objects.filter(audio_file__in=chunk).values_list('audio_file', flat=True))
+        for name in chunk:
+            if name not in finalized and default_storage.get_modified_time(name) < cutoff:
+                default_storage.delete(name)
+                removed += 1
+    return removed
+
+
+@csrf_exempt
+def recording_upload(request, token):
+    """
+    Local-disk PUT target. The signed token is the credential; the body is
+    streamed to storage without being read into memory.
+    """
+    if request.method != 'PUT':
+        return HttpResponseNotAllowed(['PUT'])
+    try:
+        payload = read_upload(token)
+    except UploadError as e:
+        return HttpResponse(str(e), status=e.status, content_type='text/plain')
+
+    content_type = request.content_type.lower()
+    if content_type != payload['t']:
+        return HttpResponse("Content-Type does not match the upload URL", status=415, content_type='text/plain')
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        length = 0
+    if length <= 0:
+        return HttpResponse("Content-Length required", status=411, content_type='text/plain')
+    if length > max_recording_bytes():
+        return HttpResponse("Recording too large", status=413, content_type='text/plain')
+    try:
+        check_storage_quota(payload['u'], length)
+    except StorageQuotaExceeded as e:
+        return HttpResponse(str(e.detail), status=e.status_code, content_type='text/plain')
+    if default_storage.exists(payload['k']):
+        return HttpResponse("Already uploaded", status=409, content_type='text/plain')
+
+    # request.read() is bounded by Content-Length, so this streams exactly the body
+    default_storage.save(payload['k'], File(request, name=payload['k']))
+    return HttpResponse(status=201)
@@ -3,31 +3,59 @@ from datetime import datetime, timezone, timedelta
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import get_object_or_404
+from rest_framework.settings import api_settings
 from django.shortcuts import render, redirect
+from django.http import HttpResponse, HttpResponseRedirect, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required
 from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max
+from django.utils.http import parse_etags
 from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from .models import Song, Category, Favorite, UserProfile, Recording
-from .serializers import SongDetailSerializer, SongListSerializer, CategorySerializer, FavoriteSerializer, UserProfileSerializer, RecordingSerializer
-from .forms import SongUploadForm
+from .serializers import SONG_ROW_FIELDS, song_rows, SongDetailSerializer, SongListSerializer, CategorySerializer, FavoriteSerializer, UserProfileSerializer, RecordingSerializer, RecordingListSerializer
+from .bundles import BUNDLE_CONTENT_TYPE, MAX_BUNDLE_SONGS, SongBundle
+from .media import parse_range_header, serve_media_file
+from .keyshift import cached_variant, is_rendering, render_failure, schedule_key_shift
+from .snapshot import current_snapshot, request_catalog_snapshot
+from .thumbnails import current_thumbnail_variants, pick_variant
+from .ids import new_recording_id
+from .analytics import parse_events, record_events
+from .ranking import RANK_ORDERINGS, order_by_rank, schedule_rank_refresh
+from .recommendations import recommended_song_ids, similar_song_ids
+from .lyrics import search_lyrics
+from .limits import EventThrottle, ProcessingThrottle, StorageQuotaExceeded, UploadThrottle, check_storage_quota, request_size
+from .postprocess import parse_vocal_offset, schedule_recording_processing
+from .uploads import UploadError, check_uploaded_file, create_upload, read_upload
+from .trial import TRIAL_TOKEN_HEADER, issue_trial_token, verify_trial_token
 import os
-import subprocess
-import tempfile
-import time
 
 
-class AllowAnonReadOnly(permissions.BasePermission):
-    """Allow anonymous users to read songs (trial access)"""
+class HasTrialAccess(permissions.BasePermission):
+    """
+    Read access for logged-in users, or anonymous devices presenting a valid
+    trial token in the X-Trial-Token header (songs/trial.py).
+    Writes require a logged-in user.
+    """
+    message = 'Login or a valid trial token is required.'
 
     def has_permission(self, request, view):
-        if request.method in permissions.SAFE_METHODS:  # GET requests
+        if request.user and request.user.is_authenticated:
             return True
-        return request.user and request.user.is_authenticated
+        if request.method in permissions.SAFE_METHODS:
+            return verify_trial_token(request.headers.get(TRIAL_TOKEN_HEADER)) is not None
+        return False
 
 
 class SongViewSet(viewsets.ModelViewSet):
     queryset = Song.objects.all()
     serializer_class = SongDetailSerializer
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [HasTrialAccess]
     parser_classes = (MultiPartParser, FormParser)
 
     def get_serializer_class(self):
@@ -35,7 +63,243 @@ class SongViewSet(viewsets.ModelViewSet):
             return SongListSerializer
         return SongDetailSerializer
 
-    @action(detail=False, methods=['post'])
+    def list(self, request, *args, **kwargs):
+        # Read-only fast path, same JSON as SongListSerializer
+        queryset = self.filter_queryset(self.get_queryset())
+        ordering = request.query_params.get('ordering')
+        if ordering is not None:
+            if ordering not in RANK_ORDERINGS:
+                return Response({'error': f'ordering must be one of: {", ".join(RANK_ORDERINGS)}'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            # Precomputed ranks (songs/ranking.py)
+            schedule_rank_refresh()
+            queryset = order_by_rank(queryset, ordering)
+        queryset = queryset.values(*SONG_ROW_FIELDS)
+        page = self.paginate_queryset(queryset)
+        rows = page if page is not None else list(queryset)
+
+        favorite_ids = set()
+        if request.user.is_authenticated:
+            favorite_ids = set(Favorite.objects.filter(
+                user=request.user, song_id__in=[row['id'] for row in rows]
+            ).values_list('song_id', flat=True))
+
+        data = song_rows(rows, request, favorite_ids)
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        # Read-only fast path, same JSON as SongDetailSerializer
+        row = get_object_or_404(self.get_queryset().values(*SONG_ROW_FIELDS), pk=kwargs['pk'])
+        favorite_ids = set()
+        if request.user.is_authenticated and Favorite.objects.filter(user=request.user, song_id=row['id']).exists():
+            favorite_ids.add(row['id'])
+        return Response(song_rows([row], request, favorite_ids, detail=True)[0])
+
+    MAX_RECOMMENDATIONS = 50
+
+    def _songs_in_order(self, request, song_ids):
+        """Song list items for ``song_ids``, in that order (missing songs skipped)"""
+        rows = {row['id']: row for row in self.get_queryset().filter(
+            id__in=song_ids).order_by().values(*SONG_ROW_FIELDS)}
+        rows = [rows[song_id] for song_id in song_ids if song_id in rows]
+        favorite_ids = set()
+        if rows and request.user.is_authenticated:
+            favorite_ids = set(Favorite.objects.filter(
+                user=request.user, song_id__in=[row['id'] for row in rows]
+            ).values_list('song_id', flat=True))
+        return song_rows(rows, request, favorite_ids)
+
+    def _limit(self, request):
+        limit = int(request.query_params.get('limit', 20))
+        return min(max(limit, 1), self.MAX_RECOMMENDATIONS)
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        """
+        Songs often favorited or recorded by the same users, from the
+        precomputed neighbours (songs/recommendations.py).
+
+        Usage:
+        GET /api/songs/1/similar/?limit=10
+        """
+        try:
+            limit = self._limit(request)
+            song_ids = similar_song_ids(int(pk), limit)
+        except ValueError:
+            return Response({'error': 'id and limit must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        if song_ids is None:
+            return Response({'error': 'Song not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(self._songs_in_order(request, song_ids))
+
+    @action(detail=False, methods=['get'])
+    def recommended(self, request):
+        """
+        Songs similar to the user's favorites and recordings. Trial devices
+        and users without history get the most popular songs.
+
+        Usage:
+        GET /api/songs/recommended/?limit=20
+        """
+        try:
+            limit = self._limit(request)
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        song_ids = []
+        if request.user.is_authenticated:
+            song_ids = recommended_song_ids(request.user, limit)
+        if not song_ids:
+            song_ids = list(order_by_rank(Song.objects.all(), 'popular').values_list('id', flat=True)[:limit])
+        return Response(self._songs_in_order(request, song_ids))
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Find songs by a line of their lyrics (word order matters, diacritics
+        and case don't). Each song comes with `start_ms`, where the first
+        match starts, and the number of `matches`.
+
+        Usage:
+        GET /api/songs/search/?q=saba boldy
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'error': 'q is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = self._limit(request)
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        matches = {song_id: (start_ms, count) for song_id, start_ms, count in search_lyrics(query, limit)}
+        data = self._songs_in_order(request, list(matches))
+        for item in data:
+            item['start_ms'], item['matches'] = matches[item['id']]
+        return Response(data)
+
+    @action(detail=True, methods=['get'])
+    def audio(self, request, pk=None):
+        """
+        The song's audio, optionally shifted by a number of semitones at the
+        same tempo (songs/keyshift.py). A shifted version is rendered on the
+        first request, which gets 202 and Retry-After. Once rendered it is
+        served with Range support. A failed render answers 503 with the
+        error until it may be retried.
+
+        Usage:
+        GET /api/songs/1/audio/?semitones=-2
+        """
+        try:
+            semitones = int(request.query_params.get('semitones', 0))
+        except ValueError:
+            return Response({'error': 'semitones must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if abs(semitones) > settings.KEY_SHIFT_MAX_SEMITONES:
+            return Response({'error': f'semitones must be between -{settings.KEY_SHIFT_MAX_SEMITONES} '
+                                      f'and {settings.KEY_SHIFT_MAX_SEMITONES}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        song = self.get_object()
+        if not song.audio_file:
+            return Response({'error': 'Song has no audio'}, status=status.HTTP_404_NOT_FOUND)
+        if semitones == 0:
+            return HttpResponseRedirect(song.audio_file.url)
+
+        name = cached_variant(song, semitones)
+        if name is not None:
+            return serve_media_file(request, name, document_root=settings.KEY_SHIFT_CACHE_DIR)
+
+        failure = render_failure(song, semitones)
+        if failure is not None:
+            error, retry_after = failure
+            response = Response({'error': 'Rendering the shifted track failed', 'detail': error},
+                                status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            response['Retry-After'] = str(retry_after)
+            return response
+        if not is_rendering(song, semitones):
+            # Only new renders count against the processing limit, not polls
+            throttle = ProcessingThrottle()
+            if not throttle.allow_request(request, self):
+                self.throttled(request, throttle.wait())
+            schedule_key_shift(song, semitones)
+        response = Response({'status': 'rendering'}, status=status.HTTP_202_ACCEPTED)
+        response['Retry-After'] = '3'
+        return response
+
+    @action(detail=True, methods=['get'], url_path='thumbnail')
+    def thumbnail_variant(self, request, pk=None):
+        """
+        Redirect to a resized thumbnail. Until the background worker has
+        produced the variants this redirects to the original image.
+
+        Usage:
+        GET /api/songs/1/thumbnail/?size=128&fmt=webp
+        """
+        song = self.get_object()
+        if not song.thumbnail:
+            return Response({'error': 'Song has no thumbnail'}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            size = int(request.query_params.get('size', 256))
+        except ValueError:
+            return Response({'error': 'size must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        fmt = request.query_params.get('fmt', 'webp')
+
+        variants = current_thumbnail_variants(song)
+        name = pick_variant(variants, size, fmt)
+        if name is None:
+            return HttpResponseRedirect(song.thumbnail.url)
+        return HttpResponseRedirect(song.thumbnail.storage.url(name))
+
+    @action(detail=False, methods=['get'])
+    def bundle(self, request):
+        """
+        Stream an offline song pack (audio, lyrics, thumbnail and a JSON
+        manifest for each song) as one resumable download.
+
+        Usage:
+        GET /api/songs/bundle/?ids=1,2,3
+        Header: Range: bytes=1048576-   (optional, to resume)
+        """
+        try:
+            ids = [int(i) for i in request.query_params.get('ids', '').split(',') if i.strip()]
+        except ValueError:
+            return Response({'error': 'ids must be a comma-separated list of integers'}, status=status.HTTP_400_BAD_REQUEST)
+        ids = list(dict.fromkeys(ids))
+        if not ids:
+            return Response({'error': 'ids is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > MAX_BUNDLE_SONGS:
+            return Response({'error': f'At most {MAX_BUNDLE_SONGS} songs per bundle'}, status=status.HTTP_400_BAD_REQUEST)
+
+        songs = Song.objects.filter(id__in=ids, is_active=True).select_related('category')
+        songs_by_id = {song.id: song for song in songs}
+        pack = SongBundle([songs_by_id[i] for i in ids if i in songs_by_id])
+
+        byte_range = None
+        if_range = request.headers.get('If-Range')
+        if not if_range or if_range == pack.etag:
+            try:
+                byte_range = parse_range_header(request.headers.get('Range'), pack.size)
+            except ValueError:
+                response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+                response['Content-Range'] = f'bytes */{pack.size}'
+                return response
+
+        if byte_range is None:
+            response = StreamingHttpResponse(pack.iter_range(), content_type=BUNDLE_CONTENT_TYPE)
+            response['Content-Length'] = str(pack.size)
+        else:
+            start, end = byte_range
+            response = StreamingHttpResponse(
+                pack.iter_range(start, end), content_type=BUNDLE_CONTENT_TYPE,
+                status=status.HTTP_206_PARTIAL_CONTENT)
+            response['Content-Length'] = str(end - start)
+            response['Content-Range'] = f'bytes {start}-{end - 1}/{pack.size}'
+
+        response['Accept-Ranges'] = 'bytes'
+        response['ETag'] = pack.etag
+        response['Content-Disposition'] = 'attachment; filename="miclab-songs.mlpk"'
+        return response
+
+    @action(detail=False, methods=['post'], throttle_classes=[UploadThrottle])
     def upload_song(self, request):
         """
         Upload a new song with audio and lyrics files
@@ -84,7 +348,7 @@ class SongViewSet(viewsets.ModelViewSet):
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-    @action(detail=True, methods=['post'])
+    @action(detail=True, methods=['post'], throttle_classes=[UploadThrottle])
     def update_audio(self, request, pk=None):
         """
         Update only the audio file for a song
@@ -111,7 +375,7 @@ class SongViewSet(viewsets.ModelViewSet):
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-    @action(detail=True, methods=['post'])
+    @action(detail=True, methods=['post'], throttle_classes=[UploadThrottle])
     def update_lyrics(self, request, pk=None):
 
         try:
@@ -132,6 +396,86 @@ class SongViewSet(viewsets.ModelViewSet):
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
+class TrialViewSet(viewsets.ViewSet):
+    permission_classes = [permissions.AllowAny]
+
+    @action(detail=False, methods=['post'])
+    def register(self, request):
+        """
+        Start (or resume) an anonymous trial for a device and return a signed
+        token to send as the X-Trial-Token header on catalog requests.
+        """
+        device_id = request.data.get('device_id')
+        if not isinstance(device_id, str) or not device_id or len(device_id) > 255:
+            return Response({'error': 'device_id required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        token, trial_end_date = issue_trial_token(device_id)
+        return Response({
+            'trial_token': token,
+            'trial_end_date': trial_end_date.isoformat(),
+            'is_trial_active': trial_end_date > datetime.now(timezone.utc)
+        })
+
+
+class CatalogViewSet(viewsets.ViewSet):
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [HasTrialAccess]
+
+    @action(detail=False, methods=['get'])
+    def snapshot(self, request):
+        """
+        Current static catalog snapshot. Clients compare `version` with the
+        one they hold and only download the file (from nginx/CDN) on change.
+        Before the first build finishes this answers 503 with Retry-After.
+        """
+        pointer = current_snapshot()
+        if pointer is None:
+            request_catalog_snapshot()
+            response = Response({'status': 'building'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            response['Retry-After'] = '5'
+            return response
+        data = dict(pointer)
+        for key in ('url', 'gzip_url', 'brotli_url'):
+            if data.get(key):
+                data[key] = request.build_absolute_uri(data[key])
+        return Response(data)
+
+
+class EventViewSet(viewsets.ViewSet):
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [permissions.AllowAny]
+    throttle_classes = [EventThrottle]
+
+    MAX_BATCH = 500
+
+    def create(self, request):
+        """
+        Listening and singing events, batched by the client. Buffered and
+        written in bulk (songs/analytics.py).
+
+        POST /api/events/
+        {"events": [{"type": "play", "song": 12, "position_ms": 0, "ts": 1760000000.5}]}
+        """
+        user_id, device_id = None, ''
+        if request.user and request.user.is_authenticated:
+            user_id = request.user.pk
+        else:
+            device_id = verify_trial_token(request.headers.get(TRIAL_TOKEN_HEADER))
+            if device_id is None:
+                return Response({'error': HasTrialAccess.message}, status=status.HTTP_403_FORBIDDEN)
+
+        items = request.data.get('events') if isinstance(request.data, dict) else None
+        if not isinstance(items, list):
+            return Response({'error': 'events must be a list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > self.MAX_BATCH:
+            return Response({'error': f'At most {self.MAX_BATCH} events per batch'}, status=status.HTTP_400_BAD_REQUEST)
+
+        events, _ = parse_events(items)
+        accepted = record_events(events, user_id=user_id, device_id=device_id)
+        return Response({'accepted': accepted, 'rejected': len(items) - accepted},
+                        status=status.HTTP_202_ACCEPTED)
+
+
 class CategoryViewSet(viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
@@ -140,6 +484,95 @@ class CategoryViewSet(viewsets.ModelViewSet):
 class FavoriteViewSet(viewsets.ModelViewSet):
     queryset = Favorite.objects.all()
     serializer_class = FavoriteSerializer
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    MAX_BATCH = 500
+
+    def get_queryset(self):
+        return Favorite.objects.filter(user=self.request.user).select_related('song__category')
+
+    def _bump_version(self):
+        UserProfile.objects.get_or_create(user=self.request.user)
+        UserProfile.objects.filter(user=self.request.user).update(favorites_version=F('favorites_version') + 1)
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+        self._bump_version()
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        self._bump_version()
+
+    def list(self, request, *args, **kwargs):
+        """
+        The caller's favorites. The ETag is the favorites version plus the
+        newest change to a favorited song, so a client sending it back in
+        If-None-Match gets 304 until either changes. Compared weakly, since
+        compression turns it into W/"...".
+        """
+        version = UserProfile.objects.filter(user=request.user).values_list(
+            'favorites_version', flat=True).first() or 0
+        songs_changed = Favorite.objects.filter(user=request.user).aggregate(
+            latest=Max('song__updated_at'))['latest']
+        songs_changed = int(songs_changed.timestamp() * 1_000_000) if songs_changed else 0
+        etag = f'"favorites-{request.user.pk}-{version}-{songs_changed}"'
+        sent = {tag.removeprefix('W/') for tag in parse_etags(request.headers.get('If-None-Match', ''))}
+        if etag in sent or '*' in sent:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = super().list(request, *args, **kwargs)
+        response['ETag'] = etag
+        return response
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """
+        Apply a locally edited favorites list in one request (idempotent).
+
+        POST /api/favorites/batch/
+        {"add": [1, 2, 3], "remove": [4]}
+        """
+        add = request.data.get('add', [])
+        remove = request.data.get('remove', [])
+        if not isinstance(add, list) or not isinstance(remove, list):
+            return Response({'error': 'add and remove must be lists of song ids'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            add = {int(song_id) for song_id in add}
+            remove = {int(song_id) for song_id in remove}
+        except (TypeError, ValueError):
+            return Response({'error': 'add and remove must be lists of song ids'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(add) + len(remove) > self.MAX_BATCH:
+            return Response({'error': f'At most {self.MAX_BATCH} songs per batch'}, status=status.HTTP_400_BAD_REQUEST)
+
+        user = request.user
+        add -= remove
+        with transaction.atomic():
+            existing = set(Favorite.objects.filter(
+                user=user, song_id__in=add).values_list('song_id', flat=True))
+            to_add = set(Song.objects.filter(
+                id__in=add - existing).order_by().values_list('id', flat=True))
+            # unique_together ('user', 'song') makes a concurrent duplicate a no-op
+            Favorite.objects.bulk_create(
+                [Favorite(user=user, song_id=song_id) for song_id in to_add],
+                ignore_conflicts=True
+            )
+            removed = 0
+            if remove:
+                removed, _ = Favorite.objects.filter(user=user, song_id__in=remove).delete()
+
+            profile, _ = UserProfile.objects.get_or_create(user=user)
+            if to_add or removed:
+                UserProfile.objects.filter(pk=profile.pk).update(
+                    favorites_version=F('favorites_version') + 1)
+                profile.refresh_from_db(fields=['favorites_version'])
+
+        return Response({
+            'version': profile.favorites_version,
+            'added': len(to_add),
+            'removed': removed,
+            'song_ids': list(Favorite.objects.filter(user=user).values_list('song_id', flat=True)),
+        })
 
 
 class UserProfileViewSet(viewsets.ModelViewSet):
@@ -151,29 +584,66 @@ class RecordingViewSet(viewsets.ModelViewSet):
     queryset = Recording.objects.all()
     serializer_class = RecordingSerializer
     parser_classes = (MultiPartParser, FormParser)
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        """
+        Only the caller's recordings, newest first (served by the
+        (user, -created_at) index). Optional ?song=<id> filter.
+        """
+        queryset = Recording.objects.filter(user=self.request.user)
+        song_id = self.request.query_params.get('song')
+        if song_id:
+            if not song_id.isdigit():
+                raise ValidationError({'song': 'Must be a song id'})
+            queryset = queryset.filter(song_id=song_id)
+        if self.action == 'list':
+            queryset = queryset.only(*RecordingListSerializer.Meta.fields)
+        else:
+            queryset = queryset.select_related('song', 'user')
+        return queryset.order_by('-created_at')
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return RecordingListSerializer
+        return RecordingSerializer
+
+    def get_throttles(self):
+        if self.action == 'create':
+            return [UploadThrottle()]
+        return super().get_throttles()
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
     def create(self, request, *args, **kwargs):
+        # Before request.data, so an over-quota body is never read
+        check_storage_quota(request.user, request_size(request))
         try:
             song_id = request.data.get('song')
             duration = request.data.get('duration')
             audio_file = request.FILES.get('audio_file')
+            mix_with_song = str(request.data.get('mix', '')).lower() in ('1', 'true', 'yes')
+            vocal_offset_ms = parse_vocal_offset(request.data.get('offset_ms'))
 
             if not all([song_id, audio_file]):
                 return Response({'error': 'Missing song or audio_file'}, status=400)
 
             song = Song.objects.get(id=song_id)
-            recording_id = f"{request.user.id}_{song_id}_{int(time.time())}"
+            recording_id = new_recording_id()
 
             recording = Recording.objects.create(
                 user=request.user,
                 song=song,
                 audio_file=audio_file,
                 recording_id=recording_id,
-                duration=int(duration) if duration else 0
+                duration=int(duration) if duration else 0,
+                mix_with_song=mix_with_song,
+                vocal_offset_ms=vocal_offset_ms
             )
+            # Trim/normalize/mix in the background; poll processing_status
+            transaction.on_commit(lambda: schedule_recording_processing(recording))
 
             return Response(RecordingSerializer(recording).data, status=201)
 
@@ -182,9 +652,109 @@ class RecordingViewSet(viewsets.ModelViewSet):
         except Exception as e:
             return Response({'error': str(e)}, status=400)
 
+    @action(detail=False, methods=['post'], parser_classes=api_settings.DEFAULT_PARSER_CLASSES,
+            throttle_classes=[UploadThrottle])
+    def upload_url(self, request):
+        """
+        Step 1 of a direct upload: get a short-lived URL to PUT the audio to
+        (object storage or the local upload endpoint), bypassing the API.
+
+        Usage:
+        POST /api/recordings/upload_url/  {"song": 1, "content_type": "audio/mp4"}
+        """
+        check_storage_quota(request.user)
+        try:
+            song = Song.objects.get(id=int(request.data.get('song')))
+        except (TypeError, ValueError, Song.DoesNotExist):
+            return Response({'error': 'Song not found'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            upload = create_upload(request, song, request.data.get('content_type'))
+        except UploadError as e:
+            return Response({'error': str(e)}, status=e.status)
+        return Response(upload, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'], parser_classes=api_settings.DEFAULT_PARSER_CLASSES)
+    def finalize(self, request):
+        """
+        Step 2 of a direct upload: check the uploaded file and create the
+        recording. Safe to retry.
+
+        Usage:
+        POST /api/recordings/finalize/  {"upload_id": "...", "duration": 95, "mix": true, "offset_ms": 250}
+        """
+        try:
+            upload = read_upload(request.data.get('upload_id') or '', user=request.user)
+        except UploadError as e:
+            return Response({'error': str(e)}, status=e.status)
+
+        existing = Recording.objects.filter(recording_id=upload['r']).first()
+        if existing is not None:
+            return Response(RecordingSerializer(existing).data)
+
+        try:
+            duration = int(request.data.get('duration') or 0)
+        except (TypeError, ValueError):
+            return Response({'error': 'duration must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            vocal_offset_ms = parse_vocal_offset(request.data.get('offset_ms'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            size = check_uploaded_file(upload)
+        except UploadError as e:
+            return Response({'error': str(e)}, status=e.status)
+        try:
+            check_storage_quota(request.user, size)
+        except StorageQuotaExceeded:
+            default_storage.delete(upload['k'])
+            raise
+
+        try:
+            with transaction.atomic():
+                recording = Recording.objects.create(
+                    user=request.user,
+                    song_id=upload['s'],
+                    audio_file=upload['k'],
+                    audio_size=size,
+                    recording_id=upload['r'],
+                    duration=duration,
+                    mix_with_song=str(request.data.get('mix', '')).lower() in ('1', 'true', 'yes'),
+                    vocal_offset_ms=vocal_offset_ms
+                )
+        except IntegrityError:
+            # A concurrent retry finalized it first
+            existing = Recording.objects.filter(recording_id=upload['r']).first()
+            if existing is None:
+                raise
+            return Response(RecordingSerializer(existing).data)
+        transaction.on_commit(lambda: schedule_recording_processing(recording))
+        return Response(RecordingSerializer(recording).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'], throttle_classes=[ProcessingThrottle])
+    def process(self, request, pk=None):
+        """
+        Re-run post-processing, optionally changing the mix settings.
+
+        Usage:
+        POST /api/recordings/{id}/process/  mix=1&offset_ms=250
+        """
+        recording = self.get_object()
+        try:
+            if 'mix' in request.data:
+                recording.mix_with_song = str(request.data['mix']).lower() in ('1', 'true', 'yes')
+            if 'offset_ms' in request.data:
+                recording.vocal_offset_ms = parse_vocal_offset(request.data['offset_ms'])
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        recording.save(update_fields=['mix_with_song', 'vocal_offset_ms', 'updated_at'])
+        schedule_recording_processing(recording)
+        return Response(RecordingSerializer(recording).data, status=status.HTTP_202_ACCEPTED)
+
 
 def convert_to_m4a(input_file_path):
     """Convert audio file to M4A format using ffmpeg"""
+    import subprocess
+
     try:
         output_file_path = input_file_path.replace(
             os.path.splitext(input_file_path)[1], '.m4a')
@@ -219,6 +789,10 @@ def convert_to_m4a(input_file_path):
 @login_required
 def upload_song_page(request):
     """Simple form to upload song with lyrics"""
+    # Ingest-only imports, kept out of API worker startup
+    import shutil
+    import tempfile
+    from .forms import SongUploadForm
 
     if request.method == 'POST':
         form = SongUploadForm(request.POST, request.FILES)
@@ -240,44 +814,38 @@ def upload_song_page(request):
             if song.audio_file:
                 ext = os.path.splitext(song.audio_file.name)[1].lower()
 
-                # Save original file temporarily
-                temp_audio_path = os.path.join(
-                    settings.MEDIA_ROOT, 'songs', 'audio', f"temp_{song.audio_file.name}")
-                os.makedirs(os.path.dirname(temp_audio_path), exist_ok=True)
-
-                with open(temp_audio_path, 'wb') as f:
-                    for chunk in song.audio_file.chunks():
-                        f.write(chunk)
-
-                # Convert to M4A if not already
-                if ext in ['.mp3', '.wav', '.flac', '.ogg']:
-                    print(f"🎵 Converting {ext} to M4A...")
-                    converted_path = convert_to_m4a(temp_audio_path)
-                    m4a_filename = f"songs/audio/{filename}.m4a"
-                else:
-                    # Already M4A or AAC
-                    converted_path = temp_audio_path
-                    m4a_filename = f"songs/audio/{filename}.m4a"
-
-                # Read converted file and save to media
-                with open(converted_path, 'rb') as f:
-                    song.audio_file = ContentFile(f.read(), name=m4a_filename)
+                # Save original file temporarily (outside media storage,
+                # which may be a remote bucket)
+                work_dir = tempfile.mkdtemp(prefix='upload-')
+                try:
+                    temp_audio_path = os.path.join(work_dir, f"temp_{os.path.basename(song.audio_file.name)}")
+
+                    with open(temp_audio_path, 'wb') as f:
+                        for chunk in song.audio_file.chunks():
+                            f.write(chunk)
+
+                    # Convert to M4A if not already
+                    if ext in ['.mp3', '.wav', '.flac', '.ogg']:
+                        print(f"🎵 Converting {ext} to M4A...")
+                        converted_path = convert_to_m4a(temp_audio_path)
+                        m4a_filename = f"songs/audio/{filename}.m4a"
+                    else:
+                        # Already M4A or AAC
+                        converted_path = temp_audio_path
+                        m4a_filename = f"songs/audio/{filename}.m4a"
+
+                    # Read converted file and save to media
+                    with open(converted_path, 'rb') as f:
+                        song.audio_file = ContentFile(f.read(), name=m4a_filename)
+                finally:
+                    shutil.rmtree(work_dir, ignore_errors=True)
 
             # Save lyrics from textarea
             lyrics_text = form.cleaned_data.get('lyrics_text', '')
             if lyrics_text:
-                lyrics_filename = f"songs/audio/{filename}.lrc"
-                lyrics_path = os.path.join(
-                    settings.MEDIA_ROOT, lyrics_filename)
-
-                # Create directory if needed
-                os.makedirs(os.path.dirname(lyrics_path), exist_ok=True)
-
-                # Save lyrics to file
-                with open(lyrics_path, 'w', encoding='utf-8') as f:
-                    f.write(lyrics_text)
-
-                song.lyrics_file.name = lyrics_filename
+                # Save lyrics through the media storage
+                song.lyrics_file.save(
+                    f"{filename}.lrc", ContentFile(lyrics_text.encode('utf-8')), save=False)
 
             song.save()
 